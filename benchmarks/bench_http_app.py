@@ -0,0 +1,141 @@
+"""
+Per-request latency of the HTTP honeypot's ASGI stack: the previous FastAPI
+app (catch-all route, @middleware("http") for custom methods, header-casing
+middleware) against HttpApp, for a few representative requests. Requests are
+driven straight through the ASGI interface, so only the app stack is timed
+(no sockets, no Hypercorn); response delays are disabled.
+
+    python benchmarks/bench_http_app.py
+
+The FastAPI stack is only measured when fastapi is installed.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from trapster.modules.http import STANDARD_METHODS, HttpApp, HttpHandler
+
+REQUESTS = [
+    ("GET", "/robots.txt", b""),                     # constant endpoint
+    ("GET", "/api/v1/user", b"id=2"),                # Jinja template
+    ("GET", "/wp-login.php", b""),                   # 404 probe (default)
+    ("PROPFIND", "/webdav", b""),                    # custom method
+]
+ROUNDS = 3000
+
+
+class NullLogger:
+    LOGIN = "login"
+    QUERY = "query"
+
+    def log(self, *args, **kwargs):
+        pass
+
+
+async def no_delay(self, method="GET"):
+    pass
+
+
+def legacy_app(handler):
+    """The stack HttpHoneypot used before HttpApp."""
+    from fastapi import FastAPI, Request
+
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+    @app.middleware("http")
+    async def custom_method_middleware(request: Request, call_next):
+        if request.method not in STANDARD_METHODS:
+            return await handler.handle_unknown_method(request)
+        return await call_next(request)
+
+    @app.api_route("/{path:path}", methods=list(STANDARD_METHODS))
+    async def catch_all(request: Request, path: str):
+        return await handler.handle_request(request)
+
+    titles = {'etag': 'ETag', 'www-authenticate': 'WWW-Authenticate'}
+
+    async def header_capitalization(scope, receive, send):
+        is_h2 = scope.get("http_version") == "2"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                has_date = False
+                names = []
+                for raw_name, raw_value in message.get("headers", []):
+                    lower = raw_name.decode("latin1").lower()
+                    if lower == "date":
+                        has_date = True
+                    names.append((lower, raw_value))
+                if is_h2:
+                    headers = [[lower.encode("latin1"), value] for lower, value in names]
+                else:
+                    headers = [[titles.get(lower, lower.title()).encode("latin1"), value]
+                               for lower, value in names]
+                if not has_date:
+                    date_val = datetime.now(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+                    headers.append([b"date" if is_h2 else b"Date", date_val.encode("latin1")])
+                message["headers"] = headers
+            await send(message)
+
+        await app(scope, receive, send_wrapper)
+
+    return header_capitalization
+
+
+async def call(app, method, path, query):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query, "root_path": "",
+        "headers": [(b"host", b"honeypot.local"), (b"user-agent", b"bench")],
+        "client": ("10.0.0.1", 40000), "server": ("10.0.0.2", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    return time.perf_counter() - start
+
+
+async def measure(app):
+    results = {}
+    for method, path, query in REQUESTS:
+        for _ in range(200):
+            await call(app, method, path, query)
+        samples = sorted([await call(app, method, path, query) for _ in range(ROUNDS)])
+        results[f"{method} {path}"] = (statistics.median(samples) * 1e6,
+                                       samples[int(len(samples) * 0.99)] * 1e6)
+    return results
+
+
+async def main():
+    HttpHandler._apply_delay = no_delay
+    handler = HttpHandler({"skin": "demo_api"}, NullLogger())
+    handler.setup()
+
+    stacks = {"HttpApp": HttpApp(handler)}
+    try:
+        stacks = {"FastAPI": legacy_app(handler), **stacks}
+    except ImportError:
+        print("fastapi is not installed, only measuring HttpApp")
+
+    results = {name: await measure(app) for name, app in stacks.items()}
+    print(f"{'request':<24}" + "".join(f"{name + ' p50/p99 (us)':>28}" for name in stacks))
+    for request in results["HttpApp"]:
+        row = "".join(f"{results[name][request][0]:>18.1f} / {results[name][request][1]:>7.1f}" for name in stacks)
+        print(f"{request:<24}{row}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
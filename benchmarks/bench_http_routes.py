@@ -0,0 +1,73 @@
+"""
+Per-request routing cost of HttpHandler.get_endpoint_config as the number of
+skin routes grows: the original linear scan (re.fullmatch with pattern strings
+on every endpoint) against the compiled RouteIndex. Past 512 routes the
+linear scan also thrashes the `re` module's pattern cache.
+
+    python benchmarks/bench_http_routes.py
+"""
+
+import random
+import re
+import string
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from trapster.libs.http_routes import RouteIndex
+
+
+def linear_lookup(endpoints, path, method, params):
+    for endpoint in endpoints:
+        for route, details in endpoint.items():
+            if not re.fullmatch(route, path):
+                continue
+            if not isinstance(details, list):
+                details = [details]
+            candidates = [d for d in details if d['method'] == method]
+            for config in candidates:
+                if config.get('query') and all(name in params and re.fullmatch(pattern, params[name])
+                                               for name, pattern in config['query'].items()):
+                    return config
+            fallback = next((d for d in candidates if not d.get('query')), None)
+            if fallback:
+                return fallback
+    return None
+
+
+def make_endpoints(count, regex_ratio=0.3):
+    rng = random.Random(count)
+    endpoints = []
+    for i in range(count):
+        word = ''.join(rng.choice(string.ascii_lowercase) for _ in range(8))
+        if rng.random() < regex_ratio:
+            route = f"/{word}/api/v{i}/(.*)"
+        else:
+            route = f"/{word}/page{i}"
+        endpoints.append({route: [{"method": "GET", "status_code": 200, "content": "x"}]})
+    return endpoints
+
+
+def scanner_paths(count=300):
+    rng = random.Random(0)
+    return ['/' + ''.join(rng.choice(string.ascii_lowercase + '/._-') for _ in range(rng.randint(4, 30)))
+            for _ in range(count)]
+
+
+def main():
+    paths = scanner_paths()
+    print(f"{'routes':>8} {'linear (us/req)':>16} {'index (us/req)':>16} {'speedup':>8}")
+    for count in (10, 50, 100, 500, 1000):
+        endpoints = make_endpoints(count)
+        index = RouteIndex(endpoints)
+        linear = timeit.timeit(lambda: [linear_lookup(endpoints, p, "GET", {}) for p in paths], number=1)
+        indexed = timeit.timeit(lambda: [index.lookup(p, "GET", {}) for p in paths], number=1)
+        per_linear = linear / len(paths) * 1e6
+        per_index = indexed / len(paths) * 1e6
+        print(f"{count:>8} {per_linear:>16.2f} {per_index:>16.2f} {per_linear / per_index:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
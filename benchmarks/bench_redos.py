@@ -0,0 +1,95 @@
+"""
+Worst-case matching time of skin regexes on adversarial inputs: plain `re`
+against compile_safe (RE2 when installed, else `re` with the length cap of
+polynomial patterns; exponential patterns are rejected at load). Then the
+per-request routing cost of every shipped skin on the adversarial URL
+corpus.
+
+    python benchmarks/bench_redos.py
+
+Each timing stops growing the input once a match takes a quarter of a second.
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import yaml
+
+from trapster.libs.http_routes import RouteIndex
+from trapster.libs.safe_regex import UnsafePattern, compile_safe, re2
+
+SKINS = Path(__file__).parent.parent / "trapster" / "data" / "http"
+
+# (pattern, attack input of size n): patterns a skin author could plausibly
+# write, with the input that makes `re` backtrack the most.
+CORPUS = [
+    (r"/static/(\w+\.?)+\.js", lambda n: "/static/" + "a" * n + "!"),
+    (r"/api/(\d+|\w+)*/items", lambda n: "/api/" + "1" * n + "!"),
+    (r"/user/([a-z0-9]+)*@host", lambda n: "/user/" + "a" * n + "!"),
+    (r"/(.*)/(.*)/edit", lambda n: "/" + "/" * n + "!"),
+    (r"/files/(.*)-(.*)-(.*)\.zip", lambda n: "/files/" + "-" * n + "!"),
+    (r"/api/v2/monitor(.*)", lambda n: "/api/v2/monitor" + "/" * n + "!"),
+]
+
+# Requests a scanner can send to any skin: long paths, deep nesting, long
+# encoded segments, and query values aimed at query rules.
+ADVERSARIAL_URLS = [
+    "/" + "a" * 8000,
+    "/" * 8000,
+    "/api/" + "/" * 8000 + "!",
+    "/api/v2/monitor" + "-" * 8000,
+    "/error/" + "%2F" * 2500,
+    "/" + "a/" * 4000,
+    "/45482074d2e66dcb140b5a178a24754d" * 200,
+    "/" + quote("é" * 1000),
+    "/.aws" + "s" * 8000,
+]
+ADVERSARIAL_QUERIES = [{"id": "1" * 8000 + "x"}, {"id": "1" * 8000}, {"q": "a" * 8000}]
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def worst_case(regex, attack):
+    """Largest input tried and its time: inputs grow by an eighth (an
+    exponential pattern doubles its time with every character) until a
+    match takes a quarter of a second, or the input reaches 16K characters."""
+    n = 8
+    while True:
+        elapsed = timed(regex.fullmatch, attack(n))
+        if elapsed > 0.25 or n >= 16384:
+            return n, elapsed
+        n = min(16384, n + max(1, n // 8))
+
+
+def main():
+    print(f"RE2: {'installed' if re2 else 'not installed'}\n")
+    print(f"{'pattern':34} {'re: n':>7} {'time (ms)':>10}   {'safe':>26}")
+    for pattern, attack in CORPUS:
+        n, slow = worst_case(re.compile(pattern), attack)
+        try:
+            safe = compile_safe(pattern)
+            _, fast = worst_case(safe, attack)
+            verdict = f"{safe.engine}, degree {safe.degree}: {fast * 1000:8.2f} ms"
+        except UnsafePattern:
+            verdict = "rejected at load"
+        print(f"{pattern:34} {n:>7} {slow * 1000:>10.2f}   {verdict:>26}")
+
+    print(f"\n{'skin':16} {'worst lookup (us)':>18} {'mean (us)':>10}")
+    for config in sorted(SKINS.glob("*/config.yaml")):
+        index = RouteIndex(yaml.safe_load(config.read_text()).get("endpoints") or [])
+        times = [timed(index.lookup, url, method, params)
+                 for url in ADVERSARIAL_URLS for method in ("GET", "POST") for params in ADVERSARIAL_QUERIES]
+        print(f"{config.parent.name:16} {max(times) * 1e6:>18.1f} {sum(times) / len(times) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,12 @@ setup(
             'openai<1.99.0',
             'openai-agents>=0.2.5',
         ],
+        're2': [
+            'google-re2>=1.1',
+        ],
+        'brotli': [
+            'brotli>=1.1',
+        ],
     },
     url='https://trapster.cloud/',
     author='0xBallpoint',
@@ -0,0 +1,80 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from trapster.modules.http import HttpHandler
+
+SKINS = Path(__file__).parent.parent / "trapster" / "data" / "http"
+
+
+class RecordingLogger:
+    """Stand-in for the event logger, keeping (logtype, extra) of each event."""
+    LOGIN = "login"
+    QUERY = "query"
+    DATA = "data"
+
+    def __init__(self):
+        self.events = []
+
+    def log(self, logtype, transport, data='', extra=None):
+        self.events.append((logtype, extra))
+
+
+@pytest.fixture
+def logger():
+    return RecordingLogger()
+
+
+@pytest.fixture
+def no_delay(monkeypatch):
+    """HTTP responses are sent without the skin's simulated delay."""
+    async def apply_delay(self, method="GET"):
+        pass
+    monkeypatch.setattr(HttpHandler, "_apply_delay", apply_delay)
+
+
+class ModelServer:
+    """A stand-in chat completions endpoint, keeping connections alive and
+    recording the connections opened and the requests received."""
+
+    def __init__(self, delay=0, reply=None):
+        self.delay = delay
+        # Answer to a request: the content of the assistant message
+        self.reply = reply or (lambda request: json.dumps({"directory": "/tmp/", "command_result": "ok"}))
+        self.connections = 0
+        self.requests = []
+        self.prompts = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode()
+                length = next(int(line.split(":")[1]) for line in head.split("\r\n")
+                              if line.lower().startswith("content-length:"))
+                request = json.loads(await reader.readexactly(length))
+                self.requests.append(request)
+                self.prompts.append(request["messages"][0]["content"])
+                await asyncio.sleep(self.delay)
+                content = self.reply(request)
+                body = json.dumps({
+                    "id": "1", "object": "chat.completion", "created": 0, "model": request["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/v1/"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
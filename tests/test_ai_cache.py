@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+pytest.importorskip("agents")
+
+from trapster.ai.cache import ResponseCache
+from trapster.modules.http import HttpApp, HttpHandler, HttpHoneypot
+from tests.conftest import ModelServer
+
+
+def test_ttl_and_lru(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("trapster.ai.cache.time.time", lambda: now[0])
+    cache = ResponseCache(ttl=60, max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")  # evicts b, the least recently used
+    assert cache.get("b") is None and cache.get("a") == "1"
+    now[0] += 61
+    assert cache.get("a") is None and cache.get("c") is None
+
+
+def test_disk_persistence(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path)
+    cache.put("a", {"directory": "/", "command_result": "x"})
+    cache.close()
+    assert ResponseCache(path=path).get("a") == {"directory": "/", "command_result": "x"}
+
+
+@pytest.mark.asyncio
+async def test_disk_writes_leave_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path, max_entries=2)
+    threads = []
+    flush = cache._flush
+    monkeypatch.setattr(cache, "_flush", lambda: threads.append(threading.current_thread()) or flush())
+
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert threads == []
+    await cache._writer
+    assert threads and threading.main_thread() not in threads
+    cache.close()
+    # "a" was evicted, and its row deleted after it was written
+    reopened = ResponseCache(path=path)
+    assert (reopened.get("a"), reopened.get("b"), reopened.get("c")) == (None, "B", "C")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_call():
+    cache = ResponseCache()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "body"
+
+    results = await asyncio.gather(*(cache.get_or_create("k", create) for _ in range(10)))
+    assert results == ["body"] * 10 and len(calls) == 1
+    assert await cache.get_or_create("k", create) == "body" and len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_ai_endpoint_shared_across_clients(monkeypatch, no_delay, logger):
+    async with ModelServer(delay=0.1) as model:
+        monkeypatch.setenv("AI_BASE_URL", model.url)
+        monkeypatch.setenv("AI_API_KEY", "test")
+        handler = HttpHandler({"skin": "demo_ai"}, logger)
+        handler.setup()
+
+        async def get(ip, path):
+            transport = httpx.ASGITransport(app=HttpApp(handler), client=(ip, 1234))
+            async with httpx.AsyncClient(transport=transport, base_url="http://honeypot.local") as client:
+                return await client.get(path)
+
+        # Bots from many IPs, some with a disguised path
+        responses = await asyncio.gather(*(get(f"10.0.0.{i}", "/.aws" if i % 2 else "/%2Eaws")
+                                           for i in range(1, 9)))
+        assert {r.status_code for r in responses} == {200}
+        assert len({r.text for r in responses}) == 1
+        assert len(model.prompts) == 1
+        assert (await get("10.0.0.99", "/.aws")).text == responses[0].text
+        assert len(model.prompts) == 1
+        await handler.http_agent.client.close()
+
+
+@pytest.mark.asyncio
+async def test_stopping_the_honeypot_writes_the_cache(tmp_path, monkeypatch, logger):
+    path = str(tmp_path / "cache.db")
+    monkeypatch.setenv("AI_API_KEY", "test")
+    monkeypatch.setenv("AI_CACHE_PATH", path)
+    honeypot = HttpHoneypot({"port": 18182, "skin": "demo_ai"}, logger, bindaddr="127.0.0.1")
+    await honeypot.start()
+    cache = honeypot.handler.http_agent.cache
+    cache.put("k", "body")
+    assert cache._writes
+    await honeypot.stop()
+    assert cache._db is None
+    assert ResponseCache(path=path, table="http_responses").get("k") == "body"
+    await honeypot.handler.http_agent.client.close()
+
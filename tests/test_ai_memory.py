@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("agents")
+
+from trapster.ai import SSHAgent, base
+from trapster.ai.memory import WindowedSession, purge_sessions
+from tests.conftest import ModelServer
+
+
+def turn(i):
+    return [{"role": "user", "content": f"command {i}"},
+            {"role": "assistant", "content": [{"type": "output_text", "text": f"output {i}"}]}]
+
+
+@pytest.mark.asyncio
+async def test_window_and_summary(tmp_path):
+    summaries = []
+
+    async def summarize(summary, transcript):
+        summaries.append((summary, transcript))
+        return f"{summary} [{transcript.count('user:')} turns]".strip()
+
+    session = WindowedSession("ssh:10.0.0.1:pi", str(tmp_path / "memory.db"), turns=2, summarize=summarize)
+    for i in range(3):
+        await session.add_items(turn(i))
+        await session._summarizing
+    # Three turns: the last two are sent, one is not enough to summarize yet
+    assert await session.get_items() == turn(1) + turn(2)
+    assert summaries == []
+
+    await session.add_items(turn(3))
+    await session._summarizing
+    assert summaries == [("", "user: command 0\nassistant: output 0\nuser: command 1\nassistant: output 1")]
+    items = await session.get_items()
+    assert items[0] == {"role": "system", "content": "Summary of the earlier session:\n[2 turns]"}
+    assert items[1:] == turn(2) + turn(3)
+    # The summarized turns are gone from the store
+    assert len(await session.get_items(limit=100)) == 4
+
+
+@pytest.mark.asyncio
+async def test_purge_idle_sessions(tmp_path):
+    path = str(tmp_path / "memory.db")
+    for session_id in ("old", "new"):
+        await WindowedSession(session_id, path, turns=2).add_items(turn(0))
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE agent_sessions SET updated_at = datetime('now', '-2 days') WHERE session_id = 'old'")
+    conn.commit()
+    assert purge_sessions(path, ttl=24 * 3600) == 1
+    assert conn.execute("SELECT DISTINCT session_id FROM agent_messages").fetchall() == [("new",)]
+    assert purge_sessions(str(tmp_path / "empty.db"), ttl=1) == 0
+
+
+@pytest.mark.asyncio
+async def test_model_gets_bounded_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(base, "MEMORY_TURNS", 2)
+    async with ModelServer() as model:
+        monkeypatch.setenv("AI_BASE_URL", model.url)
+        monkeypatch.setenv("AI_API_KEY", "test")
+        monkeypatch.setenv("AI_MEMORY_ENABLE", "true")
+        monkeypatch.setenv("AI_MEMORY_PATH", str(tmp_path / "memory.db"))
+        agent = SSHAgent.shared()
+        for i in range(8):
+            await agent.make_query("ssh:10.0.0.1:pi", f"cd /tmp/{i}", username="pi")
+            await agent.sessions["ssh:10.0.0.1:pi"]._summarizing
+
+        shell = [r for r in model.requests if "bash shell" in r["messages"][0]["content"]]
+        assert len(shell) == 8
+        # Instructions, summary, at most two turns and the new command
+        assert len(shell[-1]["messages"]) <= 1 + 1 + 4 + 1
+        assert shell[-1]["messages"][1]["content"].startswith("Summary of the earlier session")
+        assert shell[-1]["messages"][-1]["content"] == "cd /tmp/7"
+        assert len(model.requests) > 8  # the summaries
+        await agent.client.close()
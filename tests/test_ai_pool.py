@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("agents")
+
+from trapster.ai import HTTPAgent, SSHAgent
+from tests.conftest import ModelServer
+
+
+@pytest.mark.asyncio
+async def test_sessions_share_agent_and_connection(monkeypatch):
+    async with ModelServer() as model:
+        monkeypatch.setenv("AI_BASE_URL", model.url)
+        monkeypatch.setenv("AI_API_KEY", "test")
+        monkeypatch.setenv("AI_MEMORY_ENABLE", "false")
+
+        agent = SSHAgent.shared()
+        assert SSHAgent.shared() is agent
+        assert HTTPAgent.shared().client is agent.client
+
+        for username in ("root", "pi", "root"):
+            result = await agent.make_query(f"ssh:10.0.0.1:{username}", "cd /tmp", username=username)
+            assert result == {"directory": "/tmp/", "command_result": "ok"}
+
+        assert model.connections == 1
+        assert "/home/root" in model.prompts[0] and "/home/pi" in model.prompts[1]
+        assert model.prompts[0] == model.prompts[2]
+        await agent.client.close()
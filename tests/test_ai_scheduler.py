@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("agents")
+
+from trapster.ai.base import AIScheduler
+
+
+def call(log, name, duration=0.05, tokens=10):
+    async def run():
+        log.append(name)
+        await asyncio.sleep(duration)
+        return SimpleNamespace(name=name, context_wrapper=SimpleNamespace(usage=SimpleNamespace(total_tokens=tokens)))
+    return run
+
+
+def fallback():
+    return None
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limits_and_fair_queue():
+    scheduler = AIScheduler(max_concurrency=2, max_per_source=1, timeout=5)
+    started = []
+    # A flooding source first, then two others: they are interleaved with its backlog.
+    calls = [scheduler.run("attacker", call(started, f"a{i}"), fallback) for i in range(4)]
+    calls += [scheduler.run("b", call(started, "b0"), fallback), scheduler.run("c", call(started, "c0"), fallback)]
+    tasks = [asyncio.create_task(c) for c in calls]
+    await asyncio.sleep(0.01)
+    assert scheduler.running == 2 and started == ["a0", "b0"]
+    results = await asyncio.gather(*tasks)
+    assert [r.name for r in results] == ["a0", "a1", "a2", "a3", "b0", "c0"]
+    # c0 is served with the attacker's second call, not after its whole backlog
+    assert started[:4] == ["a0", "b0", "a1", "c0"]
+    metrics = scheduler.metrics()
+    assert metrics["served"] == 6 and metrics["running"] == metrics["queued"] == 0
+    assert metrics["tokens"] == 60 and metrics["queue_wait"]["max"] > 0.1
+
+
+@pytest.mark.asyncio
+async def test_deadline_returns_fallback():
+    scheduler = AIScheduler(max_concurrency=1, max_per_source=1, timeout=0.1)
+    started = []
+    slow = asyncio.create_task(scheduler.run("a", call(started, "slow", duration=1), lambda: "late"))
+    queued = asyncio.create_task(scheduler.run("b", call(started, "queued"), lambda: "waited"))
+    assert await queued == "waited"
+    assert await slow == "late"
+    assert started == ["slow"]
+    assert scheduler.metrics()["fallbacks"] == {"deadline": 2}
+    # Both slots are free again
+    assert (await scheduler.run("a", call(started, "next"), fallback)).name == "next"
+
+
+@pytest.mark.asyncio
+async def test_token_budget_and_queue_bound():
+    scheduler = AIScheduler(max_concurrency=1, max_per_source=1, max_queue=1, timeout=5, tokens_per_minute=25)
+    started = []
+    first = asyncio.create_task(scheduler.run("a", call(started, "1", tokens=20), fallback))
+    second = asyncio.create_task(scheduler.run("b", call(started, "2", tokens=20), fallback))
+    await asyncio.sleep(0.01)
+    assert await scheduler.run("c", call(started, "3"), lambda: "full") == "full"
+    await asyncio.gather(first, second)
+
+    async def cached():
+        return "cached"
+    assert await scheduler.run("d", call(started, "4"), cached) == "cached"
+    assert started == ["1", "2"]
+    assert scheduler.metrics()["fallbacks"] == {"queue_full": 1, "budget": 1}
+    assert scheduler.metrics()["tokens_last_minute"] == 40
+
+
+@pytest.mark.asyncio
+async def test_withdrawn_calls_leave_no_state():
+    scheduler = AIScheduler(max_concurrency=1, max_per_source=1, timeout=0.1)
+    started = []
+    # A wave of sources, queued until their deadline behind a call holding the slot
+    await scheduler._acquire("busy", 1.0)
+    await asyncio.gather(*(scheduler.run(f"10.0.0.{i}", call(started, str(i)), fallback) for i in range(20)))
+    assert started == [] and scheduler.metrics()["fallbacks"] == {"deadline": 20}
+    assert not scheduler._waiting and not scheduler._finish
+    scheduler._release("busy")
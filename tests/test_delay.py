@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import pytest
+
+from trapster.libs.delay import DelayScheduler
+
+
+async def timed(scheduler, delay):
+    start = time.monotonic()
+    await scheduler.sleep(delay)
+    return time.monotonic() - start
+
+
+@pytest.mark.asyncio
+async def test_delays_released_in_order():
+    scheduler = DelayScheduler(tick=0.01, slots=8)
+    # 0.25s needs several turns of an 8-slot wheel.
+    elapsed = await asyncio.gather(*(timed(scheduler, d) for d in (0.05, 0.25, 0.02, 0.1)))
+    for delay, took in zip((0.05, 0.25, 0.02, 0.1), elapsed):
+        assert delay - 0.011 <= took < delay + 0.05
+    stats = scheduler.stats()
+    assert stats["pending"] == 0 and stats["peak"] == 4 and stats["delayed"] == 4
+
+
+@pytest.mark.asyncio
+async def test_cap_and_shrink():
+    scheduler = DelayScheduler(tick=0.01, max_pending=20, shrink_pending=10, min_factor=0.1)
+    waiters = [asyncio.create_task(scheduler.sleep(1.0)) for _ in range(10)]
+    await asyncio.sleep(0)
+    assert scheduler.factor() == 1.0
+
+    # Above shrink_pending new delays are shortened, at max_pending skipped.
+    shrunk = [asyncio.create_task(timed(scheduler, 1.0)) for _ in range(10)]
+    await asyncio.sleep(0)
+    assert scheduler.pending == 20
+    assert await timed(scheduler, 1.0) < 0.01
+    assert scheduler.skipped == 1
+    # The first of them still sees 10 pending, the other 9 are shortened.
+    assert sum(took < 0.95 for took in await asyncio.gather(*shrunk)) == 9
+    assert scheduler.shrunk == 9
+
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    assert scheduler.pending == 0
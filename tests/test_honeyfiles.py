@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import zipfile
+
+import httpx
+import pytest
+
+from trapster.libs.honeyfiles import Honeyfile, SqlDump, ZipArchive, parse_size
+from trapster.modules.http import HttpHoneypot
+
+
+async def download_logged(logger):
+    """The download's log entry is written once the server is done with it."""
+    for _ in range(50):
+        if logger.events and logger.events[-1][0] == "http.data":
+            return logger.events[-1][1]
+        await asyncio.sleep(0.1)
+    raise AssertionError("download was not logged")
+
+
+def test_content_is_deterministic_and_addressable():
+    assert parse_size("2GB") == 2 * 1024 ** 3 and parse_size("512 KiB") == 512 * 1024
+    dump = SqlDump("seed", 300_000)
+    whole = dump.read(0, dump.size)
+    assert len(whole) == 300_000
+    assert whole.startswith(b"-- MySQL dump") and whole.endswith(b"-- Dump completed\n")
+    assert SqlDump("seed", 300_000).read(123_456, 1000) == whole[123_456:124_456]
+    assert SqlDump("other", 300_000).read(0, dump.size) != whole
+
+
+def test_concurrent_streams_read_their_own_blocks():
+    dump = SqlDump("seed", 1024 * 1024)
+    expected = [SqlDump("seed", dump.size).read(offset, 4096) for offset in range(0, dump.size, 4096)]
+    # Streams of one file, reading different blocks from threads at once.
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(3):
+            chunks = list(pool.map(lambda offset: dump.read(offset, 4096), range(0, dump.size, 4096)))
+            assert chunks == expected
+
+
+def test_zip_lists():
+    archive = ZipArchive("seed", 1024 * 1024, members=3)
+    listing = zipfile.ZipFile(io.BytesIO(archive.read(0, archive.size))).infolist()
+    assert [info.filename for info in listing] == [f"backup/part_00{n}.sql" for n in (1, 2, 3)]
+    assert archive.size == 1024 * 1024
+
+
+def test_range_header():
+    honeyfile = Honeyfile(SqlDump("seed", 1000))
+    assert honeyfile.byte_range(None) is None
+    assert honeyfile.byte_range("bytes=100-199") == (100, 200)
+    assert honeyfile.byte_range("bytes=900-") == (900, 1000)
+    assert honeyfile.byte_range("bytes=-50") == (950, 1000)
+    assert honeyfile.byte_range("bytes=0-9999") == (0, 1000)
+    assert honeyfile.byte_range("bytes=1000-") == "unsatisfiable"
+    assert honeyfile.byte_range("bytes=0-1,5-6") is None
+
+
+@pytest.mark.asyncio
+async def test_honeyfile_download(no_delay, logger):
+    honeypot = HttpHoneypot({"port": 18181, "skin": "demo_api", "hot_reload": False, "deploy_seed": "s"},
+                            logger, bindaddr="127.0.0.1")
+    await honeypot.start()
+    try:
+        async with httpx.AsyncClient(base_url="http://127.0.0.1:18181") as client:
+            for _ in range(50):
+                try:
+                    head = await client.head("/backup/db.sql")
+                    break
+                except httpx.ConnectError:
+                    await asyncio.sleep(0.1)
+            assert head.headers["content-length"] == str(2 * 1024 ** 3)
+            assert head.headers["accept-ranges"] == "bytes"
+
+            # Throttled to 512KB/s: a 100KB range takes ~0.2s.
+            logger.events.clear()
+            part = await client.get("/backup/db.sql", headers={"range": "bytes=1000000-1099999"})
+            assert part.status_code == 206
+            assert part.headers["content-range"] == f"bytes 1000000-1099999/{2 * 1024 ** 3}"
+            assert part.content == honeypot.handler.honeyfiles[
+                id(honeypot.handler.get_endpoint_config("/backup/db.sql", "GET"))].content.read(1_000_000, 100_000)
+            extra = await download_logged(logger)
+            assert extra["bytes_sent"] == 100_000 and extra["complete"] is True
+
+            assert (await client.get("/backup/db.sql", headers={"range": "bytes=5000000000-"})).status_code == 416
+
+            # A client leaving mid-download is logged with what it got.
+            async with client.stream("GET", "/backup.zip") as response:
+                async for _ in response.aiter_raw():
+                    break
+            extra = await download_logged(logger)
+            assert extra["complete"] is False and 0 < extra["bytes_sent"] < extra["honeyfile_size"]
+    finally:
+        await honeypot.stop()
@@ -0,0 +1,76 @@
+import hashlib
+import random
+
+import pytest
+from starlette.requests import Request
+
+from trapster.libs.credentials import CredentialScanner
+from trapster.libs.http_context import RequestContext
+
+BODIES = [
+    b"username=admin&password=admin123",
+    b"ajax=1&username=admin&secretkey=pw&redir=%2F",
+    b"login=a&username=b&passwd=c&password=d&login=e",
+    b"user%5Blogin%5D=root&user%5Bpassword%5D=toor",
+    b"x=" + b"A" * 5000 + b"&j_username=bob&j_password=s3cr%C3%A9t",
+    b"<Envelope xmlns='http://schemas.xmlsoap.org/soap/envelope/'><Body><Login><userName>admin</userName>"
+    b"<password>hunter2</password></Login></Body></Envelope>",
+    b"<userName>no envelope</userName>",
+    b"plain text with no credentials at all",
+]
+
+
+def scan(body, chunk_sizes):
+    scanner = CredentialScanner()
+    position = 0
+    for size in chunk_sizes:
+        scanner.feed(body[position:position + size])
+        position += size
+    scanner.feed(body[position:])
+    return scanner.result()
+
+
+def test_scanner_chunking():
+    rng = random.Random(0)
+    for body in BODIES:
+        expected = scan(body, [])
+        for _ in range(50):
+            sizes = [rng.randint(1, 7) for _ in range(len(body))]
+            assert scan(body, sizes) == expected, body
+
+    assert scan(BODIES[0], []) == {"username": "admin", "password": "admin123"}
+    assert scan(BODIES[2], []) == {"username": "b", "password": "d"}
+    assert scan(BODIES[4], []) == {"username": "bob", "password": "s3cr%C3%A9t"}
+    assert scan(BODIES[5], []) == {"username": "admin", "password": "hunter2"}
+    assert scan(BODIES[6], []) == {}
+
+
+def make_request(body, chunk=1000):
+    chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+
+    async def receive():
+        data = chunks.pop(0) if chunks else b""
+        return {"type": "http.request", "body": data, "more_body": bool(chunks)}
+
+    scope = {"type": "http", "method": "POST", "path": "/login", "query_string": b"",
+             "scheme": "http",
+             "server": ("127.0.0.1", 80), "client": ("10.0.0.1", 40000),
+             "headers": [(b"host", b"honeypot.local"), (b"content-type", b"application/x-www-form-urlencoded")]}
+    return Request(scope, receive)
+
+
+@pytest.mark.asyncio
+async def test_body_cap():
+    body = b"comment=" + b"x" * 50000 + b"&username=admin&password=late"
+    context = RequestContext.of(make_request(body), max_body=1024)
+
+    assert await context.body() == body[:1024]
+    assert context.body_length == len(body)
+    assert context.body_sha256 == hashlib.sha256(body).hexdigest()
+    assert context.body_truncated
+    # Credentials past the cap are still found.
+    assert await context.credentials() == {"username": "admin", "password": "late"}
+
+    context = RequestContext.of(make_request(b"username=a&password=b"), max_body=1024)
+    assert (await context.info())["form"] == {"username": "a", "password": "b"}
+    assert not context.body_truncated
@@ -0,0 +1,59 @@
+import shutil
+
+import httpx
+import pytest
+
+from trapster.libs.http_compression import Compression
+from trapster.modules.http import HttpApp, HttpHandler
+from tests.conftest import SKINS
+
+
+def test_negotiate():
+    compression = Compression(encodings=["gzip", "deflate"])
+    assert compression.negotiate("gzip, deflate, br") == "gzip"
+    assert compression.negotiate("deflate;q=1, gzip;q=0.5") == "deflate"
+    assert compression.negotiate("x-gzip") == "gzip"
+    assert compression.negotiate("*;q=0.1, gzip;q=0") == "deflate"
+    assert compression.negotiate("identity") is None
+    assert compression.negotiate("") is None
+
+
+def test_vary_is_merged():
+    compression = Compression()
+    assert compression.with_vary({"Vary": "Cookie"}) == {"Vary": "Cookie, Accept-Encoding"}
+    assert compression.with_vary({"vary": "accept-encoding"}) == {"vary": "accept-encoding"}
+    assert compression.with_vary({}) == {"Vary": "Accept-Encoding"}
+
+
+@pytest.mark.asyncio
+async def test_compressed_responses(tmp_path, no_delay, logger):
+    shutil.copytree(SKINS / "demo_api", tmp_path / "demo_api")
+    (tmp_path / "demo_api" / "files" / "app.js").write_text("function f() { return 1; }\n" * 200)
+    config_file = tmp_path / "demo_api" / "config.yaml"
+    config = config_file.read_text().replace("        Disallow: /\n", "        Disallow: /private/\n" * 20)
+    config_file.write_text(config + "\ncompression:\n  encodings: [gzip, deflate]\n  min_size: 16\n")
+
+    handler = HttpHandler({"skin": "demo_api"}, logger)
+    handler.data_folder = tmp_path
+    handler.setup()
+    # Static files and constant endpoints are compressed at load.
+    assert set(handler.static_variants["app.js"][1]) == {"gzip", "deflate"}
+    assert any(constant.encodings for constant in handler.constant_responses.values())
+
+    transport = httpx.ASGITransport(app=HttpApp(handler), client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://honeypot.local") as client:
+        for path in ("/", "/robots.txt", "/app.js"):
+            identity = await client.get(path, headers={"accept-encoding": "identity"})
+            assert "content-encoding" not in identity.headers
+            assert identity.headers["vary"] == "Accept-Encoding"
+            for encoding in ("gzip", "deflate"):
+                response = await client.get(path, headers={"accept-encoding": encoding})
+                assert response.headers["content-encoding"] == encoding
+                assert response.headers["vary"] == "Accept-Encoding"
+                # Decoded by httpx.
+                assert response.content == identity.content
+                assert int(response.headers["content-length"]) < len(identity.content)
+
+        # Compression wouldn't make it smaller: sent as is.
+        small = await client.get("/api/v1/health", headers={"accept-encoding": "gzip"})
+        assert "content-encoding" not in small.headers
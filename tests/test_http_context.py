@@ -0,0 +1,78 @@
+from collections import Counter
+
+import pytest
+from starlette.requests import Request
+
+from trapster.libs.http_context import RequestContext
+
+
+class CountingRequest(Request):
+    """A Request counting how often the context reads from it."""
+
+    def __init__(self, scope, receive):
+        super().__init__(scope, receive)
+        self.reads = Counter()
+
+    @property
+    def url(self):
+        self.reads["url"] += 1
+        return super().url
+
+    @property
+    def headers(self):
+        self.reads["headers"] += 1
+        return super().headers
+
+    @property
+    def query_params(self):
+        self.reads["query_params"] += 1
+        return super().query_params
+
+
+def make_request(method="POST", body=b"username=admin&password=admin123"):
+    chunks = [body]
+
+    async def receive():
+        receive.calls += 1
+        return {"type": "http.request", "body": chunks.pop(0) if chunks else b"", "more_body": False}
+    receive.calls = 0
+
+    scope = {"type": "http", "method": method, "path": "/login", "query_string": b"next=%2F",
+             "scheme": "http", "server": ("127.0.0.1", 80), "client": ("10.0.0.1", 40000),
+             "headers": [(b"host", b"honeypot.local"), (b"content-type", b"application/x-www-form-urlencoded")]}
+    return CountingRequest(scope, receive), receive
+
+
+@pytest.mark.asyncio
+async def test_context_is_shared_and_computed_once():
+    request, receive = make_request()
+    context = RequestContext.of(request)
+    assert RequestContext.of(request) is context
+
+    assert context.target == "/login?next=%2F"
+    assert context.query == {"next": "/"}
+    info = await context.info()
+    reads = request.reads.copy()
+    assert context.target == "/login?next=%2F" and context.query == {"next": "/"}
+    assert context.headers is info["headers"]
+    assert await context.info() is info
+    assert await context.body() == b"username=admin&password=admin123"
+    assert await context.credentials() == {"username": "admin", "password": "admin123"}
+    # Nothing was read from the request again, and the body was read once.
+    assert request.reads == reads
+    assert reads["query_params"] == 1
+    assert receive.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_unused_facts_are_not_computed():
+    request, receive = make_request()
+    context = RequestContext.of(request)
+    assert context.target == "/login?next=%2F"
+    assert request.reads == {"url": 1}
+    assert receive.calls == 0
+
+    # A GET never reads its body
+    request, receive = make_request("GET")
+    assert await RequestContext.of(request).body() == b""
+    assert receive.calls == 0 and not request.reads
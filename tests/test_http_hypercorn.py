@@ -0,0 +1,81 @@
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import psutil
+
+from trapster.modules.http import HYPERCORN_SETTINGS, HttpHoneypot
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_settings_precedence(caplog, logger):
+    honeypot = HttpHoneypot({"port": 18080, "skin": "demo_api", "hypercorn": {
+        "backlog": 64, "read_timeout": 30, "keep_alive_timeout": "soon", "workers": 4,
+    }}, logger, bindaddr="127.0.0.1")
+    honeypot.handler.setup()
+    honeypot.handler.http_config["hypercorn"] = {"backlog": 10, "h2_max_concurrent_streams": 8}
+
+    config = honeypot._hypercorn_config()
+    assert config.backlog == 64                   # service over skin
+    assert config.h2_max_concurrent_streams == 8  # skin over default
+    assert config.read_timeout == 30.0
+    assert config.keep_alive_timeout == HYPERCORN_SETTINGS["keep_alive_timeout"]
+    assert config.ssl_handshake_timeout == HYPERCORN_SETTINGS["ssl_handshake_timeout"]
+    assert "Invalid hypercorn setting keep_alive_timeout" in caplog.text
+    assert "Unknown hypercorn setting 'workers'" in caplog.text
+
+
+def test_dedicated_http_workers(tmp_path):
+    config = {
+        "id": "test",
+        "services": {"http": [{"port": 18280, "skin": "demo_api", "workers": 2, "hot_reload": False}]},
+        "logger": {"output": "file", "format": "default", "kwargs": {"logfile": str(tmp_path / "events.log")}},
+    }
+    (tmp_path / "trapster.conf").write_text(json.dumps(config))
+    process = subprocess.Popen([sys.executable, "main.py", "-c", str(tmp_path / "trapster.conf")], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                httpx.get("http://127.0.0.1:18280/robots.txt")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        # One worker for the other services, two for HTTP.
+        assert len(psutil.Process(process.pid).children()) == 3
+        for _ in range(10):
+            response = httpx.get("http://127.0.0.1:18280/robots.txt", headers={"connection": "close"})
+            assert response.status_code == 200
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=10)
+
+
+def test_dedicated_workers_bind_failure(tmp_path):
+    config = {
+        "id": "test",
+        "services": {"http": [{"port": 18281, "skin": "demo_api", "workers": 2}]},
+        "logger": {"output": "file", "format": "default", "kwargs": {"logfile": str(tmp_path / "events.log")}},
+    }
+    (tmp_path / "trapster.conf").write_text(json.dumps(config))
+    taken = socket.socket()
+    taken.bind(("0.0.0.0", 18281))
+    taken.listen()
+    process = subprocess.Popen([sys.executable, "main.py", "-c", str(tmp_path / "trapster.conf")], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        time.sleep(3)
+        # No dedicated workers: the service fails to start like any other.
+        assert len(psutil.Process(process.pid).children()) == 0
+    finally:
+        process.send_signal(signal.SIGTERM)
+        _, stderr = process.communicate(timeout=10)
+        taken.close()
+    assert "Could not bind http on port 18281 for its 2 workers" in stderr
+    assert "Service http could not be started on 0.0.0.0:18281: address already in use" in stderr
@@ -0,0 +1,71 @@
+import asyncio
+import shutil
+
+import httpx
+import pytest
+
+from trapster.modules.http import HttpHoneypot
+from tests.conftest import SKINS
+
+
+@pytest.mark.asyncio
+async def test_skin_hot_reload(tmp_path, no_delay, logger):
+    shutil.copytree(SKINS / "demo_api", tmp_path / "demo_api")
+    config_file = tmp_path / "demo_api" / "config.yaml"
+    # An unseeded random() changes on every evaluation, unless carried over.
+    config_file.write_text(config_file.read_text().replace(
+        "  Server: nginx\n", "  Server: nginx\n  X-Nonce: \"{{ random(length=8) }}\"\n"))
+
+    honeypot = HttpHoneypot({"port": 18180, "skin": "demo_api", "hot_reload": True}, logger,
+                            bindaddr="127.0.0.1")
+    honeypot.handler.data_folder = tmp_path
+    await honeypot.start()
+    try:
+        async with httpx.AsyncClient(base_url="http://127.0.0.1:18180") as client:
+            for _ in range(50):
+                try:
+                    before = await client.get("/robots.txt")
+                    break
+                except httpx.ConnectError:
+                    await asyncio.sleep(0.1)
+            assert before.text.startswith("User-agent")
+            seed = honeypot.handler.config["deploy_seed"]
+            nonce = before.headers["x-nonce"]
+
+            config_file.write_text(config_file.read_text().replace("User-agent", "User-Agent-Reloaded"))
+            for _ in range(50):
+                await asyncio.sleep(0.1)
+                after = await client.get("/robots.txt")
+                if "Reloaded" in after.text:
+                    break
+            assert after.text.startswith("User-Agent-Reloaded")
+            assert honeypot.handler.config["deploy_seed"] == seed
+            assert after.headers["x-nonce"] == nonce
+
+            # A broken config keeps the running skin.
+            config_file.write_text("endpoints: [")
+            await asyncio.sleep(1.5)
+            assert (await client.get("/robots.txt")).text.startswith("User-Agent-Reloaded")
+    finally:
+        await honeypot.stop()
+
+
+class Upstream:
+    timeout = 0.05
+    closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_reload_closes_replaced_upstream(logger):
+    honeypot = HttpHoneypot({"port": 18181, "skin": "demo_api"}, logger, bindaddr="127.0.0.1")
+    honeypot.handler.setup()
+    upstream = honeypot.handler.upstream = Upstream()
+
+    await honeypot.reload()
+    # In-flight requests get the upstream timeout to finish first.
+    assert not upstream.closed
+    await asyncio.sleep(0.1)
+    assert upstream.closed and honeypot.handler.upstream is None
@@ -0,0 +1,58 @@
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from trapster.libs.http_responses import ConstantResponse, is_not_modified
+
+GLOBAL_HEADERS = {"Server": "nginx"}
+CONFIG = {
+    "method": "GET",
+    "status_code": 200,
+    "content": "<h1>hello</h1>",
+    "headers": {
+        "Set-Cookie": "SID=abc; Path=/",
+        "set-cookie": "lang=en",
+        "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+    },
+}
+
+
+def render_reason(config, request_info):
+    return config.get("reason")
+
+
+def test_classification():
+    assert ConstantResponse.build(CONFIG, GLOBAL_HEADERS, 200, render_reason) is not None
+    for dynamic in ({"file": "index.html"},
+                    {"ai": "prompt"},
+                    {"content": "x", "headers": {"Location": "{{ request.path }}"}},
+                    {"content": "x", "reason": "{{ request.method }}"}):
+        assert ConstantResponse.build(dynamic, GLOBAL_HEADERS, 200, render_reason) is None
+
+    constant = ConstantResponse.build({"content": "x", "reason": "Superb"}, {}, 200, render_reason)
+    assert constant.reason == "Superb"
+
+
+def test_matches_dynamic_response():
+    constant = ConstantResponse.build(CONFIG, GLOBAL_HEADERS, 200, render_reason)
+    expected = Response(content=CONFIG["content"], status_code=200, headers={**GLOBAL_HEADERS, **CONFIG["headers"]})
+
+    response = constant.response({})
+    assert (response.status_code, response.body, response.raw_headers) == \
+        (expected.status_code, expected.body, expected.raw_headers)
+
+    # Set-Cookie headers for cookies the client already has are dropped.
+    names = [value for name, value in constant.response({"SID": "1"}).raw_headers if name == b"set-cookie"]
+    assert names == [b"lang=en"]
+
+
+def test_not_modified():
+    constant = ConstantResponse.build(CONFIG, GLOBAL_HEADERS, 200, render_reason)
+    for ims, expected in (("Wed, 21 Oct 2015 07:28:00 GMT", True),
+                          ("Thu, 22 Oct 2015 07:28:00 GMT", True),
+                          ("Tue, 20 Oct 2015 07:28:00 GMT", False),
+                          ("garbage", False)):
+        headers = Headers({"if-modified-since": ims})
+        assert constant.is_not_modified(headers) is expected
+        assert is_not_modified(headers, None, CONFIG["headers"]["Last-Modified"]) is expected
+
+    assert constant.not_modified().raw_headers == [(b"last-modified", b"Wed, 21 Oct 2015 07:28:00 GMT")]
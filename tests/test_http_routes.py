@@ -0,0 +1,66 @@
+import pytest
+import re
+
+import yaml
+
+from trapster.libs.http_routes import RouteIndex
+from trapster.modules.http import HttpHandler
+from tests.conftest import SKINS
+
+
+def linear_lookup(endpoints, path, method, params):
+    """Reference implementation: the original per-request scan."""
+    for endpoint in endpoints:
+        for route, details in endpoint.items():
+            if not re.fullmatch(route, path):
+                continue
+            if not isinstance(details, list):
+                details = [details]
+            candidates = [d for d in details if d['method'] == method]
+            for config in candidates:
+                if config.get('query') and all(name in params and re.fullmatch(pattern, params[name])
+                                               for name, pattern in config['query'].items()):
+                    return config
+            fallback = next((d for d in candidates if not d.get('query')), None)
+            if fallback:
+                return fallback
+    return None
+
+
+PATHS = ["/", "/login", "/logout", "/logincheck", "/error/403/", "/api/v2/monitor/system",
+         "/api/v1/user", "/api/v1/login", "/api/x", "/robots.txt", "/robotsXtxt", "/favicon/x",
+         "/45482074d2e66dcb140b5a178a24754d/js/login.js", "/.aws", "/admin/", "/nope", ""]
+METHODS = ["GET", "POST", "PUT"]
+QUERIES = [{}, {"id": "12"}, {"id": "abc"}]
+
+
+@pytest.mark.parametrize("skin", sorted(p.name for p in SKINS.iterdir()))
+def test_route_index_matches_linear_scan(skin):
+    endpoints = yaml.safe_load((SKINS / skin / "config.yaml").read_text()).get("endpoints", [])
+    index = RouteIndex(endpoints)
+    for path in PATHS:
+        for method in METHODS:
+            for params in QUERIES:
+                assert index.lookup(path, method, params) is linear_lookup(endpoints, path, method, params), \
+                    (skin, path, method, params)
+
+
+def test_route_order_and_fallthrough():
+    endpoints = [
+        {"/a/(.*)": [{"method": "POST", "content": "regex-post"}]},
+        {"/a/b": [{"method": "GET", "content": "literal-get"}]},
+        {"/a/.": [{"method": "GET", "query": {"x": "[0-9]+"}, "content": "regex-query"}]},
+        {"/a/(b)": {"method": "GET", "content": "regex-get"}},
+    ]
+    index = RouteIndex(endpoints)
+    assert index.combined is not None
+    for path, method, params in (("/a/b", "POST", {}), ("/a/b", "GET", {}), ("/a/c", "GET", {"x": "1"}),
+                                 ("/a/c", "GET", {}), ("/a/b", "GET", {"x": "1"})):
+        assert index.lookup(path, method, params) is linear_lookup(endpoints, path, method, params)
+
+
+def test_handler_routes_through_index(logger):
+    handler = HttpHandler({"skin": "demo_api"}, logger)
+    handler.setup()
+    assert handler.get_endpoint_config("/api/v1/user?id=7", "GET")["file"] == "user.j2"
+    assert handler.get_endpoint_config("/api/v1/user?id=x", "GET") is None
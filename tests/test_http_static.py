@@ -0,0 +1,69 @@
+import os
+import time
+
+from trapster.libs.http_static import StaticIndex
+
+
+def make_tree(tmp_path):
+    root = tmp_path / "files"
+    (root / "css").mkdir(parents=True)
+    (root / "index.html").write_text("<h1>hi</h1>")
+    (root / "css" / "site.css").write_text("body {}")
+    (root / "big.bin").write_bytes(b"x" * 4096)
+    (tmp_path / "secret.txt").write_text("secret")
+    os.symlink(tmp_path / "secret.txt", root / "leak.txt")
+    os.symlink(root / "css", root / "styles")
+    os.symlink(root, root / "css" / "loop")
+    return root
+
+
+def test_lookup_and_traversal(tmp_path):
+    index = StaticIndex(make_tree(tmp_path), mmap_threshold=1024)
+
+    assert index.read("index.html") == (b"<h1>hi</h1>", "text/html")
+    assert index.read("css/site.css") == (b"body {}", "text/css")
+    assert index.read("styles/site.css") == (b"body {}", "text/css")
+    assert index.read("css//./site.css")[0] == b"body {}"
+    assert index.read("css/../index.html")[0] == b"<h1>hi</h1>"
+    assert index.read("../files/index.html")[0] == b"<h1>hi</h1>"
+
+    for probe in ("leak.txt", "../secret.txt", "css/../../secret.txt", "", "css",
+                  "index.html\x00.png", "nope", "css/loop/loop/index.html"):
+        assert index.read(probe) is None, probe
+
+    content, content_type = index.read("big.bin")
+    assert isinstance(content, memoryview) and bytes(content) == b"x" * 4096
+    assert content_type == "application/octet-stream"
+
+
+def test_cache_and_rescan(tmp_path):
+    root = make_tree(tmp_path)
+    index = StaticIndex(root, cache_size=16)
+    assert index.read("index.html")[0] == b"<h1>hi</h1>"
+    assert index.read("css/site.css")[0] == b"body {}"
+    assert list(index._cache) == ["css/site.css"]
+
+    (root / "new.txt").write_text("new")
+    (root / "index.html").write_text("<h1>changed</h1>")
+    os.utime(root / "index.html", ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert index.read("new.txt") is None
+    index.rescan()
+    assert index.read("new.txt") == (b"new", "text/plain")
+    assert index.read("index.html")[0] == b"<h1>changed</h1>"
+
+    index = StaticIndex(root, rescan_interval=0.01)
+    (root / "later.txt").write_text("later")
+    time.sleep(0.02)
+    assert index.read("later.txt")[0] == b"later"
+
+
+def test_symlink_cycle(tmp_path):
+    root = tmp_path / "files"
+    (root / "a").mkdir(parents=True)
+    (root / "b").mkdir()
+    (root / "b" / "f.txt").write_text("f")
+    os.symlink(root / "b", root / "a" / "to_b")
+    os.symlink(root / "a", root / "b" / "to_a")
+    index = StaticIndex(root)
+    assert index.read("a/to_b/f.txt")[0] == b"f"
+    assert index.read("b/to_a/to_b/f.txt") is None
@@ -0,0 +1,41 @@
+import os
+import shutil
+
+import httpx
+import pytest
+
+from trapster.modules.http import HttpApp, HttpHandler
+from tests.conftest import SKINS
+
+
+def edit(path, content):
+    """Rewrite a file, its mtime moved on even within the clock's resolution."""
+    stat = path.stat()
+    path.write_bytes(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.mark.asyncio
+async def test_edited_templates_are_recompiled(tmp_path, no_delay, logger):
+    shutil.copytree(SKINS / "demo_api", tmp_path / "demo_api")
+    templates = tmp_path / "demo_api" / "templates"
+    (templates / "blob.bin").write_bytes(b"\x00before")
+    config = tmp_path / "demo_api" / "config.yaml"
+    config.write_text(config.read_text().replace(
+        "endpoints:\n", "endpoints:\n  - \"/blob\":\n    - method: GET\n      file: blob.bin\n", 1))
+
+    handler = HttpHandler({"skin": "demo_api"}, logger)
+    handler.data_folder = tmp_path
+    handler.setup()
+    handler.templates.check_interval = 0
+    transport = httpx.ASGITransport(app=HttpApp(handler), client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://honeypot.local") as http:
+        assert '"id": "7"' in (await http.get("/api/v1/user?id=7")).text
+        assert (await http.get("/blob")).content == b"\x00before"
+        # Served from the cache until the files change on disk
+        assert handler.templates.get_file("user.j2") is handler.templates.get_file("user.j2")
+
+        edit(templates / "user.j2", b'{"edited": "{{ request.query_string.id }}"}')
+        edit(templates / "blob.bin", b"\x00after")
+        assert (await http.get("/api/v1/user?id=7")).text == '{"edited": "7"}'
+        assert (await http.get("/blob")).content == b"\x00after"
@@ -0,0 +1,168 @@
+import asyncio
+import shutil
+
+import httpx
+import pytest
+
+from trapster.libs.http_upstream import UpstreamCache, export_skin, normalize_query
+from trapster.modules.http import HttpApp, HttpHandler
+from tests.conftest import SKINS
+
+
+class Origin:
+    """A stand-in origin server, counting the requests it gets."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def handle(self, reader, writer):
+        head = (await reader.readuntil(b"\r\n\r\n")).decode()
+        request_line, *lines = head.split("\r\n")
+        self.requests.append((request_line, lines))
+        method, target, _ = request_line.split(" ")
+        if target.startswith("/slow"):
+            await asyncio.sleep(0.2)
+        if target.startswith("/error"):
+            status, headers, body = "502 Bad Gateway", [], b"redeploying"
+        elif target.startswith("/missing"):
+            status, headers, body = "404 Not Found", [], b"gone"
+        elif target.startswith("/old"):
+            status, headers, body = "301 Moved Permanently", [f"Location: {self.url}/new"], b""
+        else:
+            body = f"<html>{{{{ not jinja }}}} {target}</html>".encode()
+            status, headers = "200 OK", ["Content-Type: text/html", "X-Origin: yes", "Set-Cookie: sid=1"]
+        headers += [f"Content-Length: {len(body)}", "Connection: close"]
+        writer.write(f"HTTP/1.1 {status}\r\n{''.join(h + chr(13) + chr(10) for h in headers)}\r\n".encode()
+                     + (body if method != "HEAD" else b""))
+        await writer.drain()
+        writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def make_handler(data_folder, skin, logger):
+    handler = HttpHandler({"skin": skin}, logger)
+    handler.data_folder = data_folder
+    handler.setup()
+    return handler
+
+
+def client(handler):
+    transport = httpx.ASGITransport(app=HttpApp(handler), client=("10.0.0.1", 1234))
+    return httpx.AsyncClient(transport=transport, base_url="http://honeypot.local")
+
+
+def test_normalize_query():
+    assert normalize_query("b=2&a=1") == normalize_query("a=1&b=%32") == "a=1&b=2"
+    assert normalize_query("x&y=") == "x=&y="
+
+
+@pytest.mark.asyncio
+async def test_record_replay_and_export(tmp_path, no_delay, logger):
+    shutil.copytree(SKINS / "demo_api", tmp_path / "demo_api")
+    async with Origin() as origin:
+        with (tmp_path / "demo_api" / "config.yaml").open("a") as config:
+            config.write(f"\nupstream:\n  url: {origin.url}\n  cache: {tmp_path / 'cache'}\n")
+        handler = make_handler(tmp_path, "demo_api", logger)
+        async with client(handler) as http:
+            first = await http.get("/admin/page.php?b=2&a=1", headers={"cookie": "secret=1"})
+            assert first.status_code == 200
+            assert first.text == "<html>{{ not jinja }} /admin/page.php?a=1&b=2</html>"
+            assert first.headers["x-origin"] == "yes" and "server" not in first.headers
+            assert logger.events[-1][1]["upstream"] == "recorded"
+            # Cookies and credentials are never forwarded.
+            assert not any(line.lower().startswith("cookie") for line in origin.requests[0][1])
+
+            again = await http.get("/admin/page.php?a=1&b=%32")
+            assert again.content == first.content and len(origin.requests) == 1
+            assert logger.events[-1][1]["upstream"] == "replayed"
+
+            # Concurrent misses share one upstream request.
+            responses = await asyncio.gather(*(http.get("/slow") for _ in range(5)))
+            assert {r.text for r in responses} == {"<html>{{ not jinja }} /slow</html>"}
+            assert len(origin.requests) == 2
+
+            # Redirects to the origin stay on the honeypot.
+            moved = await http.get("/old")
+            assert moved.status_code == 301 and moved.headers["location"] == "/new"
+
+            # Endpoints still come first, POST isn't forwarded by default.
+            assert (await http.get("/robots.txt")).headers["content-type"] == "text/plain"
+            assert (await http.post("/admin/page.php")).status_code == 404
+            assert len(origin.requests) == 3
+        await handler.upstream.aclose()
+
+    # Served from disk once the origin is gone, by another handler too.
+    async with client(make_handler(tmp_path, "demo_api", logger)) as http:
+        replayed = await http.get("/admin/page.php?a=1&b=2")
+        assert replayed.content == first.content and replayed.headers["x-origin"] == "yes"
+        assert (await http.get("/never-recorded")).status_code == 404
+
+    assert export_skin(tmp_path / "cache", tmp_path / "exported",
+                       jinja_suffixes=HttpHandler._JINJA_FILE_SUFFIXES) == 3
+    async with client(make_handler(tmp_path, "exported", logger)) as http:
+        exported = await http.get("/admin/page.php?b=2&a=1")
+        assert exported.status_code == 200
+        assert exported.content == first.content and exported.headers["x-origin"] == "yes"
+        assert exported.headers["set-cookie"] == "sid=1"
+        assert (await http.get("/slow")).text == "<html>{{ not jinja }} /slow</html>"
+        moved = await http.get("/old")
+        assert moved.status_code == 301 and moved.headers["location"] == "/new"
+        assert (await http.get("/admin/page.php")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_recorded(tmp_path):
+    async with Origin() as origin:
+        upstream = UpstreamCache(origin.url, tmp_path / "cache", max_entries=2, max_errors=2)
+        for path in ("/missing1", "/missing2", "/missing1", "/missing3"):
+            recording, _ = await upstream.get("GET", path, "", {})
+            assert recording.status_code == 404 and recording.body == b"gone"
+        # Repeats are answered from memory, nothing reaches the disk or
+        # counts against max_entries.
+        assert len(origin.requests) == 3
+        assert not list((tmp_path / "cache").iterdir())
+        recording, recorded = await upstream.get("GET", "/page", "", {})
+        assert recording.status_code == 200 and recorded
+
+        # The least recently used error is evicted past max_errors.
+        await upstream.get("GET", "/missing2", "", {})
+        assert len(origin.requests) == 5
+        await upstream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_not_kept(tmp_path):
+    async with Origin() as origin:
+        upstream = UpstreamCache(origin.url, tmp_path / "cache")
+        for _ in range(2):
+            recording, _ = await upstream.get("GET", "/error", "", {})
+            assert recording.status_code == 502
+        # Asked again each time, in case the origin is back.
+        assert len(origin.requests) == 2
+        assert not list((tmp_path / "cache").iterdir()) and not upstream.errors
+        await upstream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_truncated_bodies_are_not_forwarded(tmp_path, no_delay, logger):
+    shutil.copytree(SKINS / "demo_api", tmp_path / "demo_api")
+    async with Origin() as origin:
+        with (tmp_path / "demo_api" / "config.yaml").open("a") as config:
+            config.write(f"\nupstream:\n  url: {origin.url}\n  cache: {tmp_path / 'cache'}\n"
+                         f"  methods: [GET, POST]\n")
+        handler = HttpHandler({"skin": "demo_api", "max_body_size": 8}, logger)
+        handler.data_folder = tmp_path
+        handler.setup()
+        async with client(handler) as http:
+            assert (await http.post("/admin/page.php", content=b"a=1")).status_code == 200
+            assert (await http.post("/admin/other.php", content=b"a=" + b"1" * 64)).status_code == 404
+            assert len(origin.requests) == 1
+        await handler.upstream.aclose()
@@ -0,0 +1,91 @@
+import asyncio
+import socket
+import ssl
+
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+
+from trapster.libs.vhosts import HostMap
+from trapster.modules.http import HttpApp, HttpHoneypot
+from trapster.modules.https import HttpsHoneypot
+
+
+def test_host_map():
+    hosts = HostMap({"intranet.corp.local": "exact", "*.corp.local": "corp", "*.dev.corp.local": "dev"})
+    assert hosts.lookup("Intranet.Corp.Local:8080") == "exact"
+    assert hosts.lookup("intranet.corp.local.") == "exact"
+    assert hosts.lookup("wiki.corp.local") == "corp"
+    assert hosts.lookup("a.b.corp.local") == "corp"
+    assert hosts.lookup("ci.dev.corp.local") == "dev"
+    assert hosts.lookup("corp.local") is None
+    assert hosts.lookup("[::1]:443", "default") == "default"
+    assert hosts.lookup(b"", "default") == "default"
+
+
+@pytest.mark.asyncio
+async def test_vhosts_share_a_listener(no_delay, logger):
+    config = {"port": 1, "skin": "default_apache",
+              "vhosts": {"api.corp.local": "demo_api", "*.vpn.corp.local": {"skin": "fortigate"}}}
+    honeypot = HttpHoneypot(config, logger)
+    honeypot.handler.setup()
+    for handler in honeypot.vhost_handlers.values():
+        handler.setup()
+    app = HttpApp(honeypot.handler, honeypot._host_map())
+
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://honeypot.local") as client:
+        default = await client.get("/")
+        api = await client.get("/", headers={"host": "API.corp.local"})
+        vpn = await client.get("/", headers={"host": "gw.vpn.corp.local:80"})
+    assert b"Apache2 Ubuntu Default Page" in default.content
+    assert api.headers["server"] == "nginx"
+    assert vpn.content != default.content and vpn.content != api.content
+
+
+@pytest.mark.asyncio
+async def test_sni_selects_the_vhost_certificate(tmp_path, monkeypatch, no_delay, logger):
+    monkeypatch.chdir(tmp_path)
+    config = {"port": 18443, "skin": "default_apache", "hot_reload": False,
+              "vhosts": {"api.corp.local": "demo_api", "*.vpn.corp.local": "fortigate"}}
+    honeypot = HttpsHoneypot(config, logger, bindaddr="127.0.0.1")
+    await honeypot.start()
+
+    def common_name(server_name):
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        with context.wrap_socket(socket.create_connection(("127.0.0.1", 18443)),
+                                 server_hostname=server_name) as sock:
+            certificate = x509.load_der_x509_certificate(sock.getpeercert(binary_form=True))
+        return certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value
+
+    try:
+        for _ in range(50):
+            try:
+                assert await asyncio.to_thread(common_name, "api.corp.local") == "api.corp.local"
+                break
+            except ConnectionRefusedError:
+                await asyncio.sleep(0.1)
+        assert await asyncio.to_thread(common_name, "gw.vpn.corp.local") == "*.vpn.corp.local"
+        assert await asyncio.to_thread(common_name, "other.example") == "server.internal"
+    finally:
+        await honeypot.stop()
+
+
+def test_vhosts_do_not_inherit_the_service_certificate(tmp_path, monkeypatch, logger):
+    monkeypatch.chdir(tmp_path)
+    HttpsHoneypot({"port": 18444, "skin": "default_apache"}, logger)
+    key, certificate = "trapster/data/ssl/https/key.pem", "trapster/data/ssl/https/certificate.pem"
+    config = {"port": 18444, "skin": "default_apache", "key": key, "certificate": certificate,
+              "vhosts": {"api.corp.local": "demo_api",
+                         "vpn.corp.local": {"skin": "fortigate", "key": key, "certificate": certificate}}}
+    honeypot = HttpsHoneypot(config, logger)
+
+    api_key, api_certificate = honeypot.vhost_certificates["api.corp.local"]
+    assert (str(api_key), str(api_certificate)) != (key, certificate)
+    subject = x509.load_pem_x509_certificate(api_certificate.read_bytes()).subject
+    assert subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == "api.corp.local"
+    # A vhost setting its own pair keeps it.
+    assert tuple(map(str, honeypot.vhost_certificates["vpn.corp.local"])) == (key, certificate)
@@ -0,0 +1,197 @@
+import pytest
+import asyncio
+import gzip
+import http.server
+import json
+import threading
+
+import redis
+
+from trapster.logger import OutputLogger
+from trapster.modules.base import UdpTransporter
+
+
+def make_logger(tmp_path, **output_kwargs):
+    logfile = tmp_path / "events.log"
+    logger = OutputLogger("trapster-1", output="file",
+                          output_kwargs={"logfile": str(logfile), **output_kwargs})
+    return logger, logfile
+
+
+def read_events(logfile):
+    return [json.loads(line) for line in logfile.read_text().splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_log_is_queued_and_flushed_in_batches(tmp_path):
+    logger, logfile = make_logger(tmp_path, batch_size=10, flush_interval=60)
+    transport = UdpTransporter("10.0.0.1", 21, "10.0.0.2", 40000)
+
+    for i in range(25):
+        logger.log("ftp.login", transport, extra={"username": f"user{i}"})
+
+    # Nothing has been written synchronously by log() itself.
+    assert logger.stats()["written"] == 0
+    await asyncio.sleep(0.1)
+    # The two full batches are written, the remainder waits for the interval.
+    assert logger.stats()["written"] == 20
+    assert logger.stats()["queue_depth"] == 5
+
+    await logger.flush()
+    events = read_events(logfile)
+    assert [e["extra"]["username"] for e in events] == [f"user{i}" for i in range(25)]
+
+
+@pytest.mark.asyncio
+async def test_overflow_policies(tmp_path):
+    transport = UdpTransporter("10.0.0.1", 21, "10.0.0.2", 40000)
+
+    for policy, expected in (("drop-oldest", ["2", "3", "4"]),
+                             ("drop-newest", ["0", "1", "2"]),
+                             ("block", ["0", "1", "2", "3", "4"])):
+        logger, logfile = make_logger(tmp_path, queue_size=3, batch_size=100,
+                                      flush_interval=60, overflow=policy, mode="w")
+        for i in range(5):
+            logger.log("ftp.data", transport, extra={"n": str(i)})
+        await logger.flush()
+        assert [e["extra"]["n"] for e in read_events(logfile)] == expected, policy
+        assert logger.stats()["dropped"] == (0 if policy == "block" else 2)
+        assert logger.stats()["blocked"] == (2 if policy == "block" else 0)
+
+
+@pytest.mark.asyncio
+async def test_block_policy_wakes_the_writer(tmp_path):
+    logger, logfile = make_logger(tmp_path, queue_size=3, batch_size=100,
+                                  flush_interval=60, overflow="block")
+    transport = UdpTransporter("10.0.0.1", 21, "10.0.0.2", 40000)
+    for i in range(5):
+        logger.log("ftp.data", transport, extra={"n": str(i)})
+
+    # Nothing is written by log() itself, the writer flushes the full queue.
+    assert logger.stats()["written"] == 0
+    await asyncio.sleep(0.1)
+    assert logger.stats()["written"] == 5
+    assert [e["extra"]["n"] for e in read_events(logfile)] == ["0", "1", "2", "3", "4"]
+
+
+class CollectorHandler(http.server.BaseHTTPRequestHandler):
+    """Records every POST; answers 503 to the first one to exercise retries."""
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.requests.append((self.headers["Content-Type"], body))
+        self.send_response(503 if len(self.requests) == 1 else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_api_output_posts_gzipped_ndjson_batches():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), CollectorHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        logger = OutputLogger("trapster-1", output="api", output_kwargs={
+            "url": f"http://127.0.0.1:{server.server_port}/ingest",
+            "body_format": "ndjson", "gzip": True, "batch_size": 10, "flush_interval": 60,
+        })
+        logger.api_sink.backoff = 0.01
+        transport = UdpTransporter("10.0.0.1", 80, "10.0.0.2", 40000)
+        for i in range(10):
+            logger.log("http.query", transport, extra={"n": i})
+        await logger.flush()
+
+        # The 503'd batch is retried, and all 10 events travel in one request.
+        assert len(CollectorHandler.requests) == 2
+        content_type, body = CollectorHandler.requests[-1]
+        assert content_type == "application/x-ndjson"
+        assert [json.loads(line)["extra"]["n"] for line in body.decode().splitlines()] == list(range(10))
+        assert logger.api_sink.failed == 0
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_api_output_counts_only_posted_events():
+    # Nothing listens on port 9: every attempt fails.
+    logger = OutputLogger("trapster-1", output="api", output_kwargs={
+        "url": "http://127.0.0.1:9/ingest", "retries": 1, "batch_size": 10, "flush_interval": 60,
+    })
+    logger.api_sink.backoff = 0.01
+    transport = UdpTransporter("10.0.0.1", 80, "10.0.0.2", 40000)
+    for i in range(3):
+        logger.log("http.query", transport, extra={"n": i})
+    await logger.flush()
+
+    assert logger.api_sink.failed == 3
+    assert logger.stats()["written"] == 0
+
+
+class RejectingHandler(http.server.BaseHTTPRequestHandler):
+    """Answers 401, as a collector given a wrong key does."""
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        RejectingHandler.requests += 1
+        self.send_response(401)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_api_output_client_errors_fail_without_retry():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RejectingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        logger = OutputLogger("trapster-1", output="api", output_kwargs={
+            "url": f"http://127.0.0.1:{server.server_port}/ingest", "body_format": "json",
+            "batch_size": 10, "flush_interval": 60,
+        })
+        transport = UdpTransporter("10.0.0.1", 80, "10.0.0.2", 40000)
+        for i in range(3):
+            logger.log("http.query", transport, extra={"n": i})
+        await logger.flush()
+        assert RejectingHandler.requests == 1
+        assert logger.api_sink.failed == 3
+        assert logger.stats()["written"] == 0
+
+        # Outside an event loop too
+        logger.api_sink.write_sync([{"n": 3}])
+        assert logger.api_sink.failed == 4 and logger.api_sink.sent == 0
+    finally:
+        server.shutdown()
+
+
+def redis_available():
+    try:
+        return redis.Redis(socket_connect_timeout=0.2).ping()
+    except redis.exceptions.ConnectionError:
+        return False
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not redis_available(), reason="needs a redis-server on localhost:6379")
+async def test_redis_stream_output():
+    key = "trapster-test-events"
+    client = redis.Redis()
+    client.delete(key)
+    logger = OutputLogger("trapster-1", output="redis", output_kwargs={
+        "key": key, "structure": "stream", "maxlen": 1000, "batch_size": 100, "flush_interval": 60,
+    })
+    transport = UdpTransporter("10.0.0.1", 22, "10.0.0.2", 40000)
+    for i in range(250):
+        logger.log("ssh.login", transport, extra={"n": i})
+    await logger.flush()
+
+    entries = client.xrange(key)
+    assert [json.loads(fields[b"event"])["extra"]["n"] for _, fields in entries] == list(range(250))
+    client.delete(key)
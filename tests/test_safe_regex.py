@@ -0,0 +1,81 @@
+import math
+import time
+
+import pytest
+import yaml
+
+from trapster.libs import safe_regex
+from trapster.libs.http_routes import RouteIndex, is_literal
+from trapster.libs.safe_regex import UnsafePattern, ambiguity, compile_safe
+from tests.conftest import SKINS
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(a+)+$", r"(a|aa)+$", r"(\w+\s?)*", r"(.*)*", r"([a-z0-9]+)*@", r"(\.|[^\"])*\"",
+    r"^(([a-z])+.)+[A-Z]([a-z])+$", r"/(?!(a+)+b)(.*)",
+    # Identical alternatives: sre_parse factors them into `a(?:|)`
+    r"(a|a)*", r"(ab|ab)*", r"/x/(a|a)*", r"(x(\w*)?/)*",
+])
+def test_exponential_patterns_rejected(pattern):
+    assert ambiguity(pattern) == math.inf
+    with pytest.raises(UnsafePattern):
+        compile_safe(pattern)
+
+
+@pytest.mark.parametrize("pattern, degree", [
+    (r"/api/v2/monitor(.*)", 0), (r"([0-9]+)", 0), (r"(\w+/)*", 0), (r"(\d{1,3}\.){3}\d{1,3}", 0),
+    (r"/a/(.*)/(.*)", 1), (r"\d+\d+", 1), (r".*a.*a.*a", 2),
+])
+def test_polynomial_degree(pattern, degree):
+    assert ambiguity(pattern) == degree
+
+
+def test_shipped_skins_are_safe():
+    for config in SKINS.glob("*/config.yaml"):
+        for endpoint in yaml.safe_load(config.read_text()).get("endpoints") or []:
+            for pattern, details in endpoint.items():
+                rules = [rule for d in (details if isinstance(details, list) else [details])
+                         for rule in (d.get("query") or {}).values()]
+                for regex in ([] if is_literal(str(pattern)) else [str(pattern)]) + [str(r) for r in rules]:
+                    assert ambiguity(regex) == 0, (config.parent.name, regex)
+
+
+def test_identical_alternatives_route_rejected():
+    index = RouteIndex([{"/x/(a|a)*": [{"method": "GET", "content": "unsafe"}]}])
+    assert index.routes == []
+    started = time.perf_counter()
+    assert index.lookup("/x/" + "a" * 26 + "!", "GET", {}) is None
+    assert time.perf_counter() - started < 0.05
+
+
+def test_polynomial_pattern_length_cap(monkeypatch):
+    monkeypatch.setattr(safe_regex, "re2", None)
+    regex = compile_safe(r"/a/(.*)/(.*)x", step_budget=10_000)
+    assert regex.engine == "re" and regex.max_length == 100
+    assert regex.fullmatch("/a/b/cx")
+    # Over the cap: no match, at no cost.
+    started = time.perf_counter()
+    assert regex.fullmatch("/a/" + "/" * 50_000) is None
+    assert time.perf_counter() - started < 0.01
+
+
+def test_route_index_skips_unsafe_routes(monkeypatch, caplog):
+    index = RouteIndex([
+        {"/(a+)+b": [{"method": "GET", "content": "unsafe"}]},
+        {"/safe/(.*)": [{"method": "GET", "content": "safe"}]},
+        {"/query": [{"method": "GET", "query": {"id": "(\\d+)*x"}, "content": "unsafe query"}]},
+    ])
+    assert [route.pattern for route in index.routes] == ["/safe/(.*)"]
+    assert "unsafe regex" in caplog.text
+    started = time.perf_counter()
+    assert index.lookup("/" + "a" * 5000 + "!", "GET", {}) is None
+    assert time.perf_counter() - started < 0.05
+
+
+def test_re2_backend():
+    pytest.importorskip("re2")
+    regex = compile_safe(r"/a/(.*)/(.*)x")
+    assert regex.engine == "re2" and regex.max_length is None
+    assert regex.fullmatch("/a/b/cx") and regex.fullmatch("/a/" + "/" * 10_000) is None
+    # RE2 has no lookarounds: such a pattern stays on `re`.
+    assert compile_safe(r"/(?!favicon)(.*)").engine == "re"
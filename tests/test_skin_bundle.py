@@ -0,0 +1,55 @@
+import httpx
+import pytest
+
+from trapster.modules.http import HttpApp, HttpHandler
+from trapster.trapster import skin_command
+
+
+async def fetch(handler, path):
+    transport = httpx.ASGITransport(app=HttpApp(handler), client=("10.0.0.1", 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://honeypot.local") as client:
+        return await client.get(path)
+
+
+@pytest.mark.asyncio
+async def test_bundle_serves_like_the_skin(tmp_path, monkeypatch, no_delay, logger):
+    bundle = tmp_path / "demo_api.tskin"
+    header = HttpHandler({"skin": "demo_api", "deploy_seed": "s33d"}, logger).compile_bundle(bundle)
+    assert "index.html" in header["templates"] and "status.txt" in header["files"]
+    assert len(header["bytecode"]) == len(header["templates"])
+
+    skin = HttpHandler({"skin": "demo_api", "deploy_seed": "s33d"}, logger)
+    skin.setup()
+    first = HttpHandler({"bundle": str(bundle)}, logger)
+    first.setup()
+    second = HttpHandler({"bundle": str(bundle)}, logger)
+    second.setup()
+
+    # One compiled skin per process, whatever the number of instances.
+    assert first.env is second.env and first.static is second.static
+    assert first.config["deploy_seed"] == "s33d"
+
+    # File templates come precompiled (inline strings are still compiled).
+    compile = first.env.compile
+
+    def compile_inline_only(source, name=None, *args, **kwargs):
+        assert name is None, f"{name} compiled at runtime"
+        return compile(source, name, *args, **kwargs)
+
+    monkeypatch.setattr(first.env, "compile", compile_inline_only)
+    for path in ("/", "/status.txt", "/api/v1/user?id=3", "/nope", "/../../etc/passwd"):
+        expected, got = await fetch(skin, path), await fetch(first, path)
+        assert (got.status_code, got.content) == (expected.status_code, expected.content)
+        assert [h for h in got.headers.multi_items() if h[0] != "date"] == \
+               [h for h in expected.headers.multi_items() if h[0] != "date"]
+
+    with pytest.raises(ValueError):
+        first.templates.path("../config.yaml")
+
+
+def test_skin_compile_command(tmp_path, logger):
+    bundle = tmp_path / "demo_api.tskin"
+    skin_command(["compile", "demo_api", "-o", str(bundle), "--deploy-seed", "s33d"])
+    handler = HttpHandler({"bundle": str(bundle)}, logger)
+    handler.setup()
+    assert handler.config["deploy_seed"] == "s33d"
@@ -0,0 +1,34 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+from trapster.logger import OutputLogger
+from trapster.trapster import TrapsterManager, ai_scheduler
+
+
+@pytest.mark.asyncio
+async def test_stats_are_logged_periodically(no_delay, caplog):
+    config = {"services": {"http": [{"port": 18284, "skin": "demo_api",
+                                     "vhosts": {"admin.example.com": "default_apache"}}]},
+              "stats_interval": 0.1}
+    manager = TrapsterManager(config)
+    manager.logger = OutputLogger("trapster-1")
+    caplog.set_level(logging.INFO)
+    task = asyncio.create_task(manager.start())
+    try:
+        await asyncio.sleep(0.35)
+    finally:
+        task.cancel()
+        for _, _, server in manager.servers:
+            await server.stop()
+
+    stats = [json.loads(record.message.removeprefix("Stats of worker 0: "))
+             for record in caplog.records if record.message.startswith("Stats of worker 0: ")]
+    assert len(stats) >= 2
+    assert set(stats[-1]["logger"]) >= {"queue_depth", "dropped", "written"}
+    assert set(stats[-1]["delays"]) == {"http:18284", "http:18284:admin.example.com"}
+    assert set(stats[-1]["delays"]["http:18284"]) >= {"pending", "peak", "skipped", "shrunk", "lag"}
+    if ai_scheduler is not None:
+        assert set(stats[-1]["ai"]) >= {"queued", "served", "fallbacks", "queue_wait", "latency", "tokens"}
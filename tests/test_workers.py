@@ -0,0 +1,95 @@
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import psutil
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_workers_share_the_port(tmp_path):
+    config = {
+        "id": "test",
+        "services": {"http": [{"port": 18282, "skin": "demo_api"}]},
+        "logger": {"output": "file", "format": "default", "kwargs": {"logfile": str(tmp_path / "events.log")}},
+    }
+    (tmp_path / "trapster.conf").write_text(json.dumps(config))
+    process = subprocess.Popen([sys.executable, "main.py", "-c", str(tmp_path / "trapster.conf"), "--workers", "2"],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    clients = []
+    try:
+        workers = []
+        for _ in range(100):
+            workers = psutil.Process(process.pid).children()
+            if len(workers) == 2 and all(any(c.laddr.port == 18282 and c.status == psutil.CONN_LISTEN
+                                             for c in worker.net_connections("tcp")) for worker in workers):
+                break
+            time.sleep(0.1)
+        else:
+            raise AssertionError("workers did not both bind the port")
+
+        for _ in range(100):
+            try:
+                httpx.get("http://127.0.0.1:18282/robots.txt", headers={"connection": "close"})
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        # The kernel spreads connections across the SO_REUSEPORT listeners:
+        # out of 32, each worker gets some (or the test fails 1 in 2**31).
+        for _ in range(32):
+            clients.append(socket.create_connection(("127.0.0.1", 18282)))
+        for client in clients:
+            client.settimeout(10)
+            client.sendall(b"GET /robots.txt HTTP/1.1\r\nHost: test\r\n\r\n")
+        for client in clients:
+            assert client.recv(64).startswith(b"HTTP/1.1 200")
+        for worker in workers:
+            assert any(c.laddr.port == 18282 and c.status == psutil.CONN_ESTABLISHED
+                       for c in worker.net_connections("tcp"))
+    finally:
+        for client in clients:
+            client.close()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=10)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sigterm_drains_queued_events(tmp_path, workers):
+    port = 18285 + workers
+    logfile = tmp_path / "events.log"
+    config = {
+        "id": "test",
+        "services": {"http": [{"port": port, "skin": "demo_api"}]},
+        # Nothing is written before shutdown but by the drain
+        "logger": {"output": "file", "format": "default",
+                   "kwargs": {"logfile": str(logfile), "flush_interval": 60}},
+    }
+    (tmp_path / "trapster.conf").write_text(json.dumps(config))
+    process = subprocess.Popen([sys.executable, "main.py", "-c", str(tmp_path / "trapster.conf"),
+                                "--workers", str(workers)],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/robots.txt", headers={"connection": "close"})
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        else:
+            raise AssertionError("trapster did not start")
+        for _ in range(5):
+            httpx.get(f"http://127.0.0.1:{port}/robots.txt", headers={"connection": "close"})
+        assert logfile.read_text() == ""
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=20)
+
+    events = [json.loads(line) for line in logfile.read_text().splitlines()]
+    assert sum(event["dst_port"] == port for event in events) >= 6
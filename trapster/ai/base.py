@@ -1,11 +1,19 @@
 
 from __future__ import annotations
 
+import asyncio
+import collections
+import heapq
+import inspect
+import itertools
 import logging
+import time
+import weakref
 from pathlib import Path
 from typing import Dict, Any
 import os
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from agents import (
     Agent,
     OpenAIChatCompletionsModel,
@@ -13,12 +21,246 @@ from agents import (
     SQLiteSession,
     set_tracing_disabled,
     ModelSettings,
-    ModelSettings
 )
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from trapster.ai.memory import WindowedSession, purge_sessions
+
+# Agents and OpenAI clients are shared by every session of a process, one set
+# per event loop: a client's keep-alive connections belong to the loop that
+# opened them. Without a running loop (plain scripts), a module-level pool.
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_default_pool: dict = {}
+
+# Bounds of each client's connection pool to the model endpoint.
+MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS") or 100)
+KEEPALIVE_EXPIRY = 30.0
+
+
+def _loop_pool() -> dict:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _default_pool
+    return _pools.setdefault(loop, {})
+
+
+def shared_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """The process' OpenAI client for this endpoint and key, created on first use."""
+    pool = _loop_pool()
+    key = ("client", base_url, api_key)
+    client = pool.get(key)
+    if client is None:
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS,
+                              max_keepalive_connections=MAX_CONNECTIONS,
+                              keepalive_expiry=KEEPALIVE_EXPIRY)
+        client = pool[key] = AsyncOpenAI(base_url=base_url, api_key=api_key,
+                                         http_client=DefaultAsyncHttpxClient(limits=limits))
+    return client
+
+
+# Admission control of model calls (see AIScheduler), from the environment.
+MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY") or 8)
+MAX_PER_SOURCE = int(os.getenv("AI_MAX_PER_SOURCE") or 2)
+MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE") or 256)
+TIMEOUT = float(os.getenv("AI_TIMEOUT") or 15.0)
+TOKENS_PER_MINUTE = int(os.getenv("AI_TOKENS_PER_MINUTE") or 0)
+
+# Session memory (AI_MEMORY_ENABLE): turns sent to the model, whether older
+# turns are summarized, and the idle time after which a session is purged.
+MEMORY_TURNS = int(os.getenv("AI_MEMORY_TURNS") or 10)
+MEMORY_SUMMARY = os.getenv("AI_MEMORY_SUMMARY", "true") == "true"
+MEMORY_TTL = float(os.getenv("AI_MEMORY_TTL") or 7 * 24 * 3600)
+PURGE_INTERVAL = 3600.0
+
+SUMMARY_PROMPT = """Update the summary of a session between a user and the server you simulate.
+Keep what later answers must stay consistent with: current directory, files and users created, installed tools,
+credentials and values already shown. At most 200 words, no preamble.
+
+Current summary:
+{summary}
+
+Older turns:
+{transcript}"""
+
+
+class AIScheduler:
+    """Admission control for model calls.
+
+    At most `max_concurrency` calls run at once, and `max_per_source` per
+    source (the attacker's IP). Calls over these limits wait in a weighted
+    fair queue: each source's calls get increasing virtual finish tags, so a
+    source flooding the queue only delays its own calls, and a new source
+    is served ahead of them. Each call has a deadline, queue wait included,
+    and over `tokens_per_minute` calls are not even queued: in both cases
+    the caller's fallback answers instead, at once.
+    """
+
+    def __init__(self, *, max_concurrency: int = MAX_CONCURRENCY, max_per_source: int = MAX_PER_SOURCE,
+                 max_queue: int = MAX_QUEUE, timeout: float = TIMEOUT,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_per_source = max_per_source
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.tokens_per_minute = tokens_per_minute
+        self.running = 0
+        self._per_source: collections.Counter = collections.Counter()
+        # Heap of [finish tag, sequence, source, future]
+        self._waiting: list = []
+        self._finish: dict[str, float] = {}
+        self._virtual = 0.0
+        self._sequence = itertools.count()
+        # (time, tokens) of the calls of the last minute
+        self._spent: collections.deque = collections.deque()
+        self._spent_total = 0
+        self.served = 0
+        self.tokens = 0
+        self.fallbacks: collections.Counter = collections.Counter()
+        self.queue_wait = {"count": 0, "total": 0.0, "max": 0.0}
+        self.latency = {"count": 0, "total": 0.0, "max": 0.0}
+
+    async def run(self, source: str, call, fallback, *, weight: float = 1.0):
+        """Await `call()` when admitted, else the result of `fallback()`."""
+        if self.over_budget():
+            return await self._fallback("budget", fallback)
+        if self._full(source):
+            return await self._fallback("queue_full", fallback)
+        started = time.monotonic()
+        admitted = None
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self._acquire(source, weight)
+                admitted = time.monotonic()
+                result = await call()
+        except TimeoutError:
+            return await self._fallback("deadline", fallback)
+        finally:
+            if admitted is not None:
+                self._release(source)
+            self._observe(self.queue_wait, (admitted or time.monotonic()) - started)
+        self._observe(self.latency, time.monotonic() - admitted)
+        self.served += 1
+        self._spend(self._usage(result))
+        return result
+
+    def over_budget(self) -> bool:
+        if not self.tokens_per_minute:
+            return False
+        horizon = time.monotonic() - 60
+        while self._spent and self._spent[0][0] < horizon:
+            self._spent_total -= self._spent.popleft()[1]
+        return self._spent_total >= self.tokens_per_minute
+
+    def metrics(self) -> dict:
+        """Snapshot of the scheduler's state and counters."""
+        def summary(stats):
+            return {"count": stats["count"], "max": stats["max"],
+                    "mean": stats["total"] / stats["count"] if stats["count"] else 0.0}
+        self.over_budget()
+        return {
+            "running": self.running,
+            "queued": len(self._waiting),
+            "served": self.served,
+            "fallbacks": dict(self.fallbacks),
+            "queue_wait": summary(self.queue_wait),
+            "latency": summary(self.latency),
+            "tokens": self.tokens,
+            "tokens_last_minute": self._spent_total,
+        }
+
+    def _full(self, source: str) -> bool:
+        return not self._can_start(source) and len(self._waiting) >= self.max_queue
+
+    def _can_start(self, source: str) -> bool:
+        return self.running < self.max_concurrency and self._per_source[source] < self.max_per_source
+
+    def _start(self, source: str) -> None:
+        self.running += 1
+        self._per_source[source] += 1
+
+    async def _acquire(self, source: str, weight: float) -> None:
+        # Whenever a slot is free, every waiting call is blocked by its
+        # source's limit (_dispatch runs on each release): no one to overtake.
+        if self._can_start(source):
+            self._start(source)
+            return
+        tag = max(self._virtual, self._finish.get(source, 0.0)) + 1.0 / weight
+        self._finish[source] = tag
+        entry = [tag, next(self._sequence), source, asyncio.get_running_loop().create_future()]
+        heapq.heappush(self._waiting, entry)
+        try:
+            await entry[3]
+        except asyncio.CancelledError:
+            if entry[3].done() and not entry[3].cancelled():
+                # Admitted just as the deadline hit
+                self._release(source)
+            elif entry in self._waiting:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                if self._finish.get(source) == entry[0]:
+                    del self._finish[source]
+            raise
+
+    def _release(self, source: str) -> None:
+        self.running -= 1
+        self._per_source[source] -= 1
+        if not self._per_source[source]:
+            del self._per_source[source]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls by finish tag, skipping sources at their limit."""
+        while self.running < self.max_concurrency:
+            entry = next((e for e in sorted(self._waiting) if self._per_source[e[2]] < self.max_per_source), None)
+            if entry is None:
+                return
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            tag, _, source, future = entry
+            if self._finish.get(source) == tag:
+                del self._finish[source]
+            if future.done():
+                # Its deadline hit, it is being withdrawn
+                continue
+            self._virtual = tag
+            self._start(source)
+            future.set_result(None)
+
+    async def _fallback(self, reason: str, fallback):
+        self.fallbacks[reason] += 1
+        logging.debug(f"AI call answered by fallback: {reason}")
+        result = fallback()
+        return await result if inspect.isawaitable(result) else result
+
+    def _spend(self, tokens: int) -> None:
+        if tokens:
+            self.tokens += tokens
+            self._spent.append((time.monotonic(), tokens))
+            self._spent_total += tokens
+
+    @staticmethod
+    def _usage(result) -> int:
+        usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+        return getattr(usage, "total_tokens", 0) or 0
+
+    @staticmethod
+    def _observe(stats: dict, value: float) -> None:
+        stats["count"] += 1
+        stats["total"] += value
+        stats["max"] = max(stats["max"], value)
+
+
+def scheduler() -> AIScheduler:
+    """The process' scheduler, shared by all agents."""
+    pool = _loop_pool()
+    if "scheduler" not in pool:
+        pool["scheduler"] = AIScheduler()
+    return pool["scheduler"]
+
+
 class ai_agent(Agent):
     def __init__(
         self,
@@ -41,43 +283,118 @@ class ai_agent(Agent):
             return 
         
         # Shared OpenAI client
-        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+        self.client = shared_client(base_url, api_key)
         self.sessions: dict[str, SQLiteSession] = {}
+        # Rendered prompts, by query context (see _instructions)
+        self._prompts: dict[tuple, str] = {}
         set_tracing_disabled(disabled=True)
-        # Add recommended handoff instructions prefix
-        prompt = self._get_initial_prompt()
         # Main Agent init
         super().__init__(
             name=module_name,
             model=OpenAIChatCompletionsModel(model=model_name, 
                                              openai_client=self.client), 
             model_settings=ModelSettings(temperature=temperature),
-            instructions=prompt,
+            instructions=self._instructions,
         )
+        # Writes the running summary of the turns leaving a session's window
+        self._summarizer = Agent(name=f"{module_name} summarizer", model=self.model,
+                                 instructions="You summarize conversations concisely.")
+        self._last_used: dict[str, float] = {}
+        self._purged = 0.0
+        self._purging = None
+
+    @classmethod
+    def shared(cls, **kwargs):
+        """The process-wide instance of this agent, created on first use.
+
+        Sessions differ only by the context passed to make_query (e.g. the SSH
+        username), so one agent, one model and one client serve all of them.
+        """
+        pool = _loop_pool()
+        key = (cls, tuple(sorted(kwargs.items())))
+        agent = pool.get(key)
+        if agent is None:
+            agent = pool[key] = cls(**kwargs)
+        return agent
+
+    @classmethod
+    async def close_shared(cls) -> None:
+        """Write and close the response caches of this agent's process-wide
+        instances, if any were created: called when their services stop."""
+        for key, agent in list(_loop_pool().items()):
+            if isinstance(key, tuple) and key[0] is cls and getattr(agent, "cache", None) is not None:
+                await asyncio.to_thread(agent.cache.close)
 
-    def _get_initial_prompt(self):
+    def _get_initial_prompt(self, **context):
         return "be a helpful assistant"
 
+    def _instructions(self, run_context, agent) -> str:
+        """System prompt of a query, rendered once per distinct context."""
+        context = run_context.context or {}
+        key = tuple(sorted(context.items()))
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            if len(self._prompts) >= 1024:
+                self._prompts.clear()
+            prompt = self._prompts[key] = self._get_initial_prompt(**context)
+        return prompt
+
+    async def _run(self, session_id: str, command: str, context: dict, *, source: str | None = None,
+                   fallback=lambda: None):
+        """Runner.run through the scheduler: `fallback()` when not admitted in time."""
+        return await scheduler().run(
+            source or session_id,
+            lambda: Runner.run(self, command, context=context, session=self._ensure_session(session_id)),
+            fallback,
+        )
+
+    async def _summarize(self, summary: str, transcript: str) -> str | None:
+        """The running summary updated with older turns, None if not admitted
+        by the scheduler: all summaries share one source, so they never take
+        more than AI_MAX_PER_SOURCE slots from live sessions."""
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=transcript)
+        result = await scheduler().run("summaries", lambda: Runner.run(self._summarizer, prompt),
+                                       lambda: None, weight=0.5)
+        return result.final_output.strip() if result is not None else None
+
     # Session helpers
     def _ensure_session(self, session_id: str) -> SQLiteSession:
         if not self.memory_enable:
             # if memory is disable
             return None
         
+        now = time.monotonic()
+        self._last_used[session_id] = now
+        if now - self._purged > PURGE_INTERVAL:
+            self._purge(now)
         sess = self.sessions.get(session_id)
         if not sess:
-            if self.memory_path:
-                sess = SQLiteSession(session_id, self.memory_path)
-            else:
-                sess = SQLiteSession(session_id)
+            sess = WindowedSession(session_id, self.memory_path or ":memory:", turns=MEMORY_TURNS,
+                                   summarize=self._summarize if MEMORY_SUMMARY else None)
             self.sessions[session_id] = sess
         return sess
 
-    async def make_query(self, session_id: str, command: str) -> Dict[str, Any]:
+    def _purge(self, now: float) -> None:
+        """Forget sessions idle for more than AI_MEMORY_TTL, here and (off the
+        event loop) in the database."""
+        self._purged = now
+        if not MEMORY_TTL:
+            return
+        for session_id, used in list(self._last_used.items()):
+            if now - used > MEMORY_TTL:
+                del self._last_used[session_id]
+                session = self.sessions.pop(session_id, None)
+                if session is not None:
+                    session.close()
+        if self.memory_path:
+            self._purging = asyncio.ensure_future(asyncio.to_thread(purge_sessions, self.memory_path, MEMORY_TTL))
+
+    async def make_query(self, session_id: str, command: str, *, source: str | None = None,
+                         **context) -> Dict[str, Any]:
         try:
-            result = await Runner.run(self, command, session=self._ensure_session(session_id))
+            result = await self._run(session_id, command, context, source=source)
             
         except Exception as e:
-            print(f"[debug] error: {e}")
+            logging.error(f"AI query for session {session_id} failed: {e}")
             result = None
         return result
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable
+
+
+class ResponseCache:
+    """Model responses shared by every session of a process.
+
+    Entries expire after `ttl` seconds, and past `max_entries` the least
+    recently used is evicted. With a `path`, entries are also written to a
+    `table` of a SQLite database and reloaded at startup, so a restart does not pay for
+    the same prompts again; the writes are queued and committed by one
+    background task in a thread, off the event loop. Concurrent misses on one
+    key share a single model call (see get_or_create).
+    """
+
+    def __init__(self, *, ttl: float = 3600.0, max_entries: int = 10000, path: str | None = None,
+                 table: str = "responses") -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._db = None
+        self._writes: deque[tuple[str, tuple]] = deque()
+        self._writer: asyncio.Future | None = None
+        self._lock = threading.Lock()
+        if path:
+            self._open(path)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode("utf-8", "surrogatepass")).hexdigest()[:32]
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.time():
+            self._delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        expires = time.time() + self.ttl
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._delete(next(iter(self._entries)))
+        if self._db is not None:
+            try:
+                self._persist(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)", (key, expires, json.dumps(value)))
+            except (TypeError, ValueError) as e:
+                logging.warning(f"Could not persist AI response: {e}")
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[Any]]) -> Any | None:
+        """The cached value, else `await create()`, cached unless None.
+
+        The first miss runs `create` in its own task; concurrent misses on the
+        same key wait for it, and a caller going away (client disconnect) does
+        not cancel it for the others.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._create(key, create))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _create(self, key, create):
+        value = await create()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def _delete(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._persist(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _persist(self, statement, parameters):
+        """Queue a write for the background writer (written at once outside
+        an event loop)."""
+        self._writes.append((statement, parameters))
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush()
+            return
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+
+    async def _write(self):
+        while self._writes:
+            await asyncio.to_thread(self._flush)
+
+    def _flush(self):
+        """Execute and commit the queued writes, in order."""
+        with self._lock:
+            if self._db is None or not self._writes:
+                return
+            try:
+                while self._writes:
+                    self._db.execute(*self._writes.popleft())
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Could not persist AI responses: {e}")
+
+    def _open(self, path):
+        try:
+            # Written from the writer's thread, one at a time (see _flush)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+            self._db.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+            self._db.commit()
+            rows = self._db.execute(f"SELECT key, expires, value FROM {self.table} ORDER BY expires DESC LIMIT ?",
+                                    (self.max_entries,)).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"AI response cache {path} unavailable, keeping it in memory: {e}")
+            self._db = None
+            return
+        # Oldest first, so the LRU order follows the expiry order
+        for key, expires, value in reversed(rows):
+            self._entries[key] = (expires, json.loads(value))
+
+    def close(self) -> None:
+        """Write what is still queued, then close the database (the cache
+        then keeps working in memory only)."""
+        self._flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,200 @@
+"""
+Canonical forms of shell commands, for the SSH agent's output cache.
+
+Bots run the same reconnaissance over and over (`uname -a`, `cat
+/proc/cpuinfo`, `id`), so their output is cached across sessions and
+usernames. Commands are keyed by their canonical form: whitespace
+normalized, consecutive short flags sorted (`ls -la`, `ls -al` and `ls -l
+-a` are one command) unless one of them may take an argument, and the
+username replaced by a placeholder. Words keep their
+quoting, which decides what the shell expands (`echo ~` and `echo '~'`).
+Commands whose output depends on the session's history or environment skip
+the cache: those changing the shell's state (`cd`, `export`), those writing
+files (`wget`, `touch`, redirections), those reading what the session wrote,
+and those with variables, command substitutions or globs.
+"""
+
+from __future__ import annotations
+
+import posixpath
+import re
+import shlex
+
+# Marks the username in cached keys and outputs
+USER = "\x00USER\x00"
+
+# Commands changing the session's state: never cached
+STATEFUL = frozenset({
+    "cd", "pushd", "popd", "export", "alias", "unalias", "unset", "set", "source", ".", "history", "su", "sudo",
+    "exec", "eval", "bash", "sh", "zsh", "exit", "logout", "kill", "pkill", "killall", "passwd", "useradd",
+    "adduser", "userdel", "usermod", "crontab", "service", "systemctl", "nohup", "screen", "tmux", "python",
+    "python3", "perl", "php", "ruby", "node",
+})
+# Commands writing files: never cached, and their arguments are noted as
+# written by the session
+WRITERS = frozenset({
+    "touch", "mkdir", "rm", "rmdir", "mv", "cp", "ln", "chmod", "chown", "chattr", "wget", "curl", "tftp",
+    "ftpget", "scp", "rsync", "git", "tee", "dd", "tar", "unzip", "gunzip", "gzip", "bzip2", "xz", "nano",
+    "vi", "vim", "install", "truncate", "shred",
+})
+# Commands whose output is the content of a directory: the working directory
+# counts as read
+LISTERS = frozenset({"ls", "dir", "ll", "la", "find", "du", "tree"})
+# Commands whose single-dash options are words (`find -name`), not flags
+WORD_OPTIONS = frozenset({"find", "java", "gcc", "cc", "clang"})
+
+_REDIRECT = re.compile(r"^\d*(>|>>|&>|>&|<|<<|<<<)$")
+# One token of a command line: a redirection, an operator, or a word as
+# written (quotes and escapes included)
+_TOKEN = re.compile(r"""\s*(?:(?P<redirect>\d*(?:&>|>>|>&|>|<<<|<<|<))|(?P<operator>&&|\|\||[;|&])"""
+                    r"""|(?P<word>(?:[^\s'"\\;&|<>]|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+))""", re.S)
+# Variables, command substitutions ($(...), `...`) and globs: their output
+# depends on more than the command line
+_EXPANSION = re.compile(r"[$`*?\[]")
+_SHORT_FLAGS = re.compile(r"^-[A-Za-z]+$")
+# Names too common in command outputs to be replaced: `root` is in
+# /etc/passwd whoever logs in.
+_SYSTEM_NAMES = frozenset({
+    "root", "bin", "daemon", "sys", "adm", "sync", "games", "man", "lp", "mail", "news", "uucp", "proxy",
+    "backup", "list", "irc", "gnats", "nobody", "sudo", "users", "staff", "docker", "lxd", "ubuntu", "debian",
+    "linux", "localhost", "www-data", "systemd",
+})
+_USERNAME = re.compile(r"^[A-Za-z0-9._-]{3,32}$")
+
+
+class ShellState:
+    """What a session has written, so that reading it skips the cache."""
+
+    def __init__(self) -> None:
+        self.written: set[str] = set()
+        self.directories: set[str] = set()
+
+    def record(self, commands: list[tuple[str, list[str]]], directory: str, username: str) -> None:
+        for _, words in commands:
+            words = _unquoted(words)
+            targets = [target for word, target in zip(words, words[1:]) if _REDIRECT.match(word) and ">" in word]
+            if words[0] in WRITERS:
+                targets += words[1:]
+            elif not targets:
+                continue
+            for path in _paths(targets, directory, username):
+                if path != "/dev/null":
+                    self.written.add(path)
+                    self.directories.add(posixpath.dirname(path))
+            self.directories.add(_resolve(directory, ".", username))
+
+    def touches(self, commands: list[tuple[str, list[str]]], directory: str, username: str) -> bool:
+        if not self.written:
+            return False
+        for _, words in commands:
+            words = _unquoted(words)
+            paths = set(_paths(words[1:], directory, username))
+            if words[0] in LISTERS:
+                paths.add(_resolve(directory, ".", username))
+            if paths & (self.written | self.directories):
+                return True
+        return False
+
+
+def parse(command: str) -> list[tuple[str, list[str]]] | None:
+    """The simple commands of a command line, each with the operator before
+    it (`|`, `&&`, ...; "" for the first), words as written (quoted) and
+    redirections as words of their own. None if it cannot be parsed
+    (unclosed quote)."""
+    commands = [("", [])]
+    position, end = 0, len(command.rstrip())
+    while position < end:
+        token = _TOKEN.match(command, position)
+        if token is None:
+            return None
+        position = token.end()
+        if token["operator"]:
+            commands.append((token["operator"], []))
+        else:
+            commands[-1][1].append(token["redirect"] or token["word"])
+    return [(operator, words) for operator, words in commands if words]
+
+
+def canonical(commands: list[tuple[str, list[str]]]) -> str:
+    """One string for all spellings of the same command line."""
+    return "".join((f" {operator} " if operator else "") + " ".join(_sort_flags(words))
+                   for operator, words in commands)
+
+
+def cacheable(commands: list[tuple[str, list[str]]]) -> bool:
+    """False for command lines whose output depends on the session's history
+    or environment."""
+    for _, words in commands:
+        if any(_EXPANSION.search(word) for word in words):
+            return False
+        words = _unquoted(words)
+        if words[0] in STATEFUL or words[0] in WRITERS:
+            return False
+        if any(_REDIRECT.match(word) for word in words):
+            return False
+    return True
+
+
+def templatable(username: str) -> bool:
+    """True if the username can be swapped for another one in outputs."""
+    return bool(_USERNAME.match(username)) and username not in _SYSTEM_NAMES
+
+
+def to_template(text: str, username: str) -> str:
+    return re.sub(rf"(?<![\w.-]){re.escape(username)}(?![\w-])", USER, text)
+
+
+def from_template(text: str, username: str) -> str:
+    return text.replace(USER, username)
+
+
+def _unquoted(words: list[str]) -> list[str]:
+    """Words as the shell passes them to the command (quotes removed)."""
+    result = []
+    for word in words:
+        try:
+            result.append("".join(shlex.split(word)))
+        except ValueError:
+            result.append(word)
+    return result
+
+
+def _sort_flags(words: list[str]) -> list[str]:
+    """Words with each run of bare short flags (`-l -a`, `-la`) split and
+    sorted. A flag may take the next word as its argument (`grep -v -e
+    foo`, `tail -n -5`), so the last flag of a run followed by a word keeps
+    its place; words after `--` are never flags."""
+    if words[0] in WORD_OPTIONS:
+        return words
+    result, run, options = [words[0]], [], True
+    for word in words[1:] + [None]:
+        if options and word is not None and _SHORT_FLAGS.match(word):
+            run.extend(f"-{letter}" for letter in word[1:])
+            continue
+        last = [run.pop()] if run and word is not None else []
+        result.extend(sorted(run) + last)
+        run = []
+        if word is not None:
+            result.append(word)
+            options = options and word != "--"
+    return result
+
+
+def _paths(arguments: list[str], directory: str, username: str) -> list[str]:
+    paths = []
+    for argument in arguments:
+        if argument.startswith("-") or _REDIRECT.match(argument):
+            continue
+        if "://" in argument:
+            # A download lands in the working directory, under its basename
+            argument = posixpath.basename(argument.split("://", 1)[1].split("?")[0]) or "index.html"
+        paths.append(_resolve(directory, argument, username))
+    return paths
+
+
+def _resolve(directory: str, path: str, username: str) -> str:
+    home = f"/home/{username}"
+    if path == "~" or path.startswith("~/"):
+        path = home + path[1:]
+    directory = home + directory[1:] if directory.startswith("~") else directory
+    return posixpath.normpath(posixpath.join(directory, path))
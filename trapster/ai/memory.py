@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from typing import Awaitable, Callable
+
+from agents import SQLiteSession
+
+SUMMARIES_TABLE = "agent_summaries"
+
+
+class WindowedSession(SQLiteSession):
+    """SQLiteSession sending only the last `turns` turns to the model.
+
+    Older turns are folded into a running summary, sent ahead of the window.
+    The summary is written in the background once `turns` more turns have
+    left the window, and the turns it covers are deleted: a long-lived bot
+    costs the same tokens and latency per call as a new one. Without a
+    `summarize` function, older turns are only deleted.
+    """
+
+    def __init__(self, session_id: str, db_path: str, *, turns: int,
+                 summarize: Callable[[str, str], Awaitable[str | None]] | None = None) -> None:
+        super().__init__(session_id, db_path)
+        self.turns = turns
+        self.summarize = summarize
+        self._summarizing: asyncio.Task | None = None
+        self._execute(f"""
+            CREATE TABLE IF NOT EXISTS {SUMMARIES_TABLE} (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL
+            )
+        """, ())
+
+    async def get_items(self, limit: int | None = None) -> list:
+        if limit is not None:
+            return await super().get_items(limit)
+        summary, window, _ = await asyncio.to_thread(self._read)
+        if summary:
+            return [{"role": "system", "content": f"Summary of the earlier session:\n{summary}"}] + window
+        return window
+
+    async def add_items(self, items: list) -> None:
+        await super().add_items(items)
+        if self._summarizing is None or self._summarizing.done():
+            self._summarizing = asyncio.ensure_future(self._fold())
+
+    async def clear_session(self) -> None:
+        await super().clear_session()
+        await asyncio.to_thread(self._execute, f"DELETE FROM {SUMMARIES_TABLE} WHERE session_id = ?",
+                                (self.session_id,))
+
+    def _read(self):
+        """(summary, items of the window, (id, item) of the older turns)."""
+        conn = self._get_connection()
+        with self._lock if self._is_memory_db else threading.Lock():
+            row = conn.execute(f"SELECT summary FROM {SUMMARIES_TABLE} WHERE session_id = ?",
+                               (self.session_id,)).fetchone()
+            rows = conn.execute(f"SELECT id, message_data FROM {self.messages_table} WHERE session_id = ? ORDER BY id",
+                                (self.session_id,)).fetchall()
+        items = []
+        for id, message_data in rows:
+            try:
+                items.append((id, json.loads(message_data)))
+            except json.JSONDecodeError:
+                continue
+        # The window starts at the user message opening the turns-th last turn
+        starts = [i for i, (_, item) in enumerate(items) if item.get("role") == "user"]
+        start = starts[-self.turns] if len(starts) >= self.turns else 0
+        return row[0] if row else "", [item for _, item in items[start:]], items[:start]
+
+    async def _fold(self):
+        """Summarize the turns that left the window, then delete them."""
+        try:
+            summary, _, older = await asyncio.to_thread(self._read)
+            if sum(item.get("role") == "user" for _, item in older) < self.turns:
+                return
+            if self.summarize is not None:
+                summary = await self.summarize(summary, transcript(item for _, item in older))
+                if not summary:
+                    return
+                await asyncio.to_thread(self._execute,
+                                        f"INSERT OR REPLACE INTO {SUMMARIES_TABLE} VALUES (?, ?)",
+                                        (self.session_id, summary))
+            await asyncio.to_thread(self._execute,
+                                    f"DELETE FROM {self.messages_table} WHERE session_id = ? AND id <= ?",
+                                    (self.session_id, older[-1][0]))
+        except Exception as e:
+            logging.warning(f"Could not summarize AI session {self.session_id}: {e}")
+
+    def _execute(self, query, parameters):
+        conn = self._get_connection()
+        with self._lock if self._is_memory_db else threading.Lock():
+            conn.execute(query, parameters)
+            conn.commit()
+
+
+def transcript(items) -> str:
+    """The text of session items, one `role: content` line each."""
+    lines = []
+    for item in items:
+        content = item.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        if content:
+            lines.append(f"{item.get('role', 'assistant')}: {str(content)[:500]}")
+    return "\n".join(lines)
+
+
+def purge_sessions(db_path: str, ttl: float) -> int:
+    """Delete the sessions idle for more than `ttl` seconds; their count."""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "agent_sessions" not in tables:
+            return 0
+        stale = [row[0] for row in conn.execute(
+            "SELECT session_id FROM agent_sessions WHERE updated_at < datetime('now', ?)", (f"-{int(ttl)} seconds",))]
+        for table in ("agent_messages", SUMMARIES_TABLE, "agent_sessions"):
+            if table in tables:
+                conn.executemany(f"DELETE FROM {table} WHERE session_id = ?", [(id,) for id in stale])
+        conn.commit()
+        return len(stale)
+    except sqlite3.Error as e:
+        logging.warning(f"Could not purge AI sessions from {db_path}: {e}")
+        return 0
+    finally:
+        conn.close()
@@ -1,38 +1,39 @@
 from typing import Dict, Any
 import logging
 import json
-from agents import (
-    Runner
-)
+import os
 from trapster.ai.base import ai_agent
+from trapster.ai.cache import ResponseCache
+from trapster.ai.commands import ShellState, cacheable, canonical, from_template, parse, templatable, to_template
 class SSHAgent(ai_agent):
     """OpenAI-Agents implementation of an SSH-like shell agent.
 
     Usage:
         from trapster.ai import SSHAgent
-        agent = SSHAgent()
-        result = await agent.make_query(session_id="ip-or-user", command="ls -la")
+        agent = SSHAgent.shared()
+        result = await agent.make_query(session_id="ip-or-user", command="ls -la", username="guest",
+                                        directory="/home/guest/", state=ShellState())
         # result: {"directory": "...", "command_result": "..."}
     """
     def __init__(
         self,
         *,
         temperature: float | None = None,
-        # specific variable
-        username: str | None = "guest"
     ) -> None:
-        
-        self.username = username 
         super().__init__(
             module_name="SSH Agent",
             temperature=temperature
         )
+        # Command outputs shared across sessions, by canonical command
+        self.cache = ResponseCache(ttl=float(os.getenv("AI_CACHE_TTL") or 3600),
+                                   max_entries=int(os.getenv("AI_CACHE_SIZE") or 10000),
+                                   path=os.getenv("AI_CACHE_PATH") or None, table="ssh_outputs")
    
-    def _get_initial_prompt(self) -> str:
-        return (f"""You are a Ubuntu Linux bash shell for a low-privilege user in /home/{self.username}. 
+    def _get_initial_prompt(self, username: str = "guest", **context) -> str:
+        return (f"""You are a Ubuntu Linux bash shell for a low-privilege user in /home/{username}. 
     Respond exactly like a real shell. Never reveal you are an AI or add explanations.
     You respond exactly like a real shell and return the result of the user input.
-    Simulate common system files (/etc/passwd), fake credentials, and fake logs in /var/log, fake files in /home/{self.username}/, etc.
+    Simulate common system files (/etc/passwd), fake credentials, and fake logs in /var/log, fake files in /home/{username}/, etc.
                 
     Output rules:
     - Only produce the final JSON:
@@ -40,17 +41,70 @@ class SSHAgent(ai_agent):
     - No markdown, no explanations, no prompt echo.
 
     User: whoami
-    Assistant: {{"directory": "/home/{self.username}/", "command_result": "{self.username}"}}
+    Assistant: {{"directory": "/home/{username}/", "command_result": "{username}"}}
 
     User: id
-    Assistant: {{"directory": "/home/{self.username}/", "command_result": "uid=1000({self.username}) gid=1000({self.username}) groups=1000({self.username}),4(adm),24(cdrom),27(sudo),30(dip),46(plugdev),100(users),114(lpadmin)"}}
+    Assistant: {{"directory": "/home/{username}/", "command_result": "uid=1000({username}) gid=1000({username}) groups=1000({username}),4(adm),24(cdrom),27(sudo),30(dip),46(plugdev),100(users),114(lpadmin)"}}
 
     User: ls
-    Assistant: {{"directory": "/home/{self.username}/", "command_result": "Desktop Documents Downloads Music Pictures Public Templates Videos"}}
+    Assistant: {{"directory": "/home/{username}/", "command_result": "Desktop Documents Downloads Music Pictures Public Templates Videos"}}
     """)
 
-    async def make_query(self, session_id: str, command: str) -> Dict[str, Any]:
-        result = await Runner.run(self, command, session=self._ensure_session(session_id))
+    async def make_query(self, session_id: str, command: str, username: str = "guest",
+                         source: str | None = None, directory: str | None = None,
+                         state: ShellState | None = None) -> Dict[str, Any]:
+        """Run `command` in `directory`. Outputs are shared across sessions
+        and usernames (see trapster.ai.commands), except for commands that
+        depend on what this session did, which `state` keeps track of."""
+        directory = directory or f"/home/{username}/"
+        commands = parse(command)
+        if commands and cacheable(commands) and not (state and state.touches(commands, directory, username)):
+            asked = False
+
+            async def create():
+                nonlocal asked
+                asked = True
+                return await self._template(session_id, command, username, source)
+
+            template = await self.cache.get_or_create(self._command_key(commands, directory, username), create)
+            result = template and {name: from_template(value, username) for name, value in template.items()}
+            if result and not asked:
+                # Served from the cache: the model never saw this exchange, so
+                # it goes into the session's history as if it had.
+                await self._remember(session_id, command, result)
+        else:
+            result = await self._query(session_id, command, username, source)
+            if commands and state is not None:
+                state.record(commands, directory, username)
+        return result or {"directory": directory, "command_result": ""}
+
+    async def _remember(self, session_id, command, result):
+        session = self._ensure_session(session_id)
+        if session is not None:
+            await session.add_items([{"role": "user", "content": command},
+                                     {"role": "assistant", "content": json.dumps(result)}])
+
+    def _command_key(self, commands, directory, username) -> str:
+        if templatable(username):
+            return self.cache.key(to_template(canonical(commands), username), to_template(directory, username))
+        return self.cache.key(canonical(commands), directory, username)
+
+    async def _template(self, session_id, command, username, source):
+        """The model's answer, ready for the cache: the username replaced by
+        a placeholder when it can be (else the key holds the username)."""
+        result = await self._query(session_id, command, username, source)
+        if not isinstance(result, dict):
+            return None
+        result = {"directory": str(result.get("directory") or ""), "command_result": str(result.get("command_result") or "")}
+        if templatable(username):
+            result = {name: to_template(value, username) for name, value in result.items()}
+        return result
+
+    async def _query(self, session_id, command, username, source):
+        result = await self._run(session_id, command, {"username": username}, source=source)
+        if result is None:
+            # Not admitted in time (see AIScheduler): an empty prompt, at once
+            return None
         output = result.final_output
 
         # Remove any JSON or code block markers from the output
@@ -63,9 +117,10 @@ class SSHAgent(ai_agent):
 
             # Remove failed command from history to avoid contaminating future responses
             session = self._ensure_session(session_id)
-            assistant_item = await session.pop_item()  # Remove agent's response
-            logging.debug(f"Response was: {assistant_item}")
-            user_item = await session.pop_item()  # Remove user's question
-            logging.debug(f"Assistant item: {user_item}")
+            if session is not None:
+                assistant_item = await session.pop_item()  # Remove agent's response
+                logging.debug(f"Response was: {assistant_item}")
+                user_item = await session.pop_item()  # Remove user's question
+                logging.debug(f"Assistant item: {user_item}")
             
-            return {"directory": f"/home/{self.username}/", "command_result": ""}
\ No newline at end of file
+            return None
@@ -0,0 +1,121 @@
+"""
+Single-pass credential scanner for HTTP request bodies.
+
+The body is fed in chunks as it arrives, so credentials are found even past
+the part of the body that is kept in memory. Two shapes are recognised:
+
+- form-encoded fields (`username=...&password=...`): for each role, the last
+  value of the matching field wins, as with a dict built from the body
+- SOAP/XML `<userName>` / `<password>` elements, when the body contains a
+  SOAP `<Envelope ...>...</Envelope>`
+
+Only the fields being looked for are buffered, each up to `max_field` bytes.
+"""
+
+
+class CredentialScanner:
+    USERNAME_FIELDS = frozenset({'login', 'username', 'account', 'user%5Blogin%5D', 'j_username', 'ba_username'})
+    PASSWORD_FIELDS = frozenset({'password', 'credential', 'passwd', 'user%5Bpassword%5D', 'j_password',
+                                 'secretkey', 'ba_password'})
+    XML_TAGS = (('userName', 'username'), ('password', 'password'))
+    ENVELOPE = (b'<Envelope', b'</Envelope>')
+
+    def __init__(self, max_field=64 * 1024):
+        self.max_field = max_field
+        # Form parsing: the `&`-separated segment in progress.
+        self._segment = bytearray()
+        self._segment_dropped = False
+        self._longest_key = max(len(k) for k in self.USERNAME_FIELDS | self.PASSWORD_FIELDS) + 1
+        self._params = {}
+        # XML parsing: bytes kept to find markers split across chunks.
+        self._markers = [m for tag, _ in self.XML_TAGS for m in (f'<{tag}>'.encode(), f'</{tag}>'.encode())]
+        self._tail = b''
+        self._tail_size = max(len(m) for m in self._markers + list(self.ENVELOPE)) - 1
+        self._envelope = [False, False]
+        self._captures = {tag: None for tag, _ in self.XML_TAGS}   # tag -> bytearray while open
+        self._values = {}                                           # tag -> bytes once closed
+
+    def feed(self, chunk):
+        self._feed_form(chunk)
+        self._feed_xml(chunk)
+
+    # --- form-encoded ------------------------------------------------------
+
+    def _feed_form(self, chunk):
+        start = 0
+        while True:
+            end = chunk.find(b'&', start)
+            self._extend_segment(chunk[start:] if end < 0 else chunk[start:end])
+            if end < 0:
+                return
+            self._end_segment()
+            start = end + 1
+
+    def _extend_segment(self, data):
+        if self._segment_dropped or not data:
+            return
+        self._segment += data
+        # A segment whose key can't be one we look for, or that grew too
+        # large, is skipped until the next '&'.
+        key_end = self._segment.find(b'=')
+        key_length = key_end if key_end >= 0 else len(self._segment)
+        if key_length > self._longest_key or len(self._segment) > self.max_field:
+            self._segment = bytearray()
+            self._segment_dropped = True
+
+    def _end_segment(self):
+        if not self._segment_dropped:
+            key, _, value = bytes(self._segment).decode('utf-8', errors='replace').partition('=')
+            if key in self.USERNAME_FIELDS or key in self.PASSWORD_FIELDS:
+                self._params[key] = value
+        self._segment = bytearray()
+        self._segment_dropped = False
+
+    # --- SOAP / XML --------------------------------------------------------
+
+    def _feed_xml(self, chunk):
+        data = self._tail + chunk
+        for i, marker in enumerate(self.ENVELOPE):
+            if not self._envelope[i] and marker in data:
+                self._envelope[i] = True
+
+        for tag, _ in self.XML_TAGS:
+            if tag in self._values:
+                continue
+            capture = self._captures[tag]
+            if capture is None:
+                open_tag = f'<{tag}>'.encode()
+                found = data.find(open_tag)
+                if found < 0:
+                    continue
+                capture = self._captures[tag] = bytearray(data[found + len(open_tag):])
+                search_from = 0
+            else:
+                search_from = max(0, len(capture) - self._tail_size)
+                capture += chunk
+            close_tag = f'</{tag}>'.encode()
+            end = capture.find(close_tag, search_from)
+            if end >= 0:
+                self._values[tag] = bytes(capture[:end])
+                self._captures[tag] = None
+            elif len(capture) > self.max_field:
+                self._values[tag] = bytes(capture[:self.max_field])
+                self._captures[tag] = None
+
+        self._tail = data[-self._tail_size:]
+
+    def result(self):
+        """Credentials found in the body ({'username': ..., 'password': ...}),
+        once it has been fed entirely."""
+        self._end_segment()
+        credentials = {}
+        for key, value in self._params.items():
+            if key in self.USERNAME_FIELDS:
+                credentials['username'] = value
+            elif key in self.PASSWORD_FIELDS:
+                credentials['password'] = value
+        if all(self._envelope):
+            for tag, field in self.XML_TAGS:
+                if tag in self._values:
+                    credentials[field] = self._values[tag].decode('utf-8', errors='replace')
+        return credentials
@@ -0,0 +1,141 @@
+"""
+Response delay scheduler: a hashed timer wheel with coarse buckets.
+
+Each delayed response waits on a future filed in the wheel slot of its
+deadline, instead of owning a timer in the event loop's heap. A single ticker
+task advances the wheel every `tick` seconds and releases the whole slot at
+once, so responses due in the same bucket resume in one batch. The ticker
+only runs while something is pending.
+
+Under load:
+
+- at most `max_pending` responses are delayed at once; past that, responses
+  are sent without a delay rather than piling up in memory
+- above `shrink_pending` pending responses, or when the loop lags more than
+  `shrink_lag` seconds behind the wheel, new delays are scaled down
+  proportionally (never below `min_factor` of the requested delay)
+
+stats() exposes the queue size and counters for tuning; they are logged
+periodically in the trapster.stats event (see TrapsterManager.stats).
+"""
+
+import asyncio
+import logging
+import time
+
+
+class DelayScheduler:
+    # Minimum number of seconds between two overload warnings.
+    REPORT_INTERVAL = 60
+
+    def __init__(self, tick=0.05, slots=64, max_pending=10000, shrink_pending=2000,
+                 shrink_lag=0.1, min_factor=0.1):
+        self.tick = float(tick)
+        self.wheel = [[] for _ in range(max(1, int(slots)))]
+        self.max_pending = int(max_pending)
+        self.shrink_pending = int(shrink_pending)
+        self.shrink_lag = float(shrink_lag)
+        self.min_factor = float(min_factor)
+
+        self.pending = 0
+        self.peak = 0
+        self.delayed = 0
+        self.skipped = 0
+        self.shrunk = 0
+        self.lag = 0.0
+        self._cursor = 0
+        self._ticker = None
+        self._reported = (0, 0)
+        self._reported_at = 0.0
+
+    def factor(self):
+        """How much new delays are scaled down by, given the current load."""
+        factor = 1.0
+        if self.pending > self.shrink_pending:
+            factor = self.shrink_pending / self.pending
+        if self.lag > self.shrink_lag:
+            factor = min(factor, self.shrink_lag / self.lag)
+        return max(self.min_factor, factor)
+
+    async def sleep(self, delay):
+        """Wait about `delay` seconds (to within a tick), less under load."""
+        if delay <= 0:
+            return
+        if self.pending >= self.max_pending:
+            self.skipped += 1
+            self._report()
+            return
+        factor = self.factor()
+        if factor < 1.0:
+            self.shrunk += 1
+            delay *= factor
+            self._report()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticks = max(1, round(delay / self.tick))
+        slots = len(self.wheel)
+        # [remaining full turns of the wheel, future]
+        self.wheel[(self._cursor + ticks) % slots].append([(ticks - 1) // slots, future])
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        self.delayed += 1
+        if self._ticker is None or self._ticker.done() or self._ticker.get_loop() is not loop:
+            self._ticker = loop.create_task(self._run())
+        try:
+            await future
+        finally:
+            self.pending -= 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.pending:
+            deadline += self.tick
+            await asyncio.sleep(deadline - loop.time())
+            self.lag = max(0.0, loop.time() - deadline)
+            # Catch up on the ticks missed while the loop was busy.
+            missed = int(self.lag / self.tick)
+            deadline += missed * self.tick
+            for _ in range(missed + 1):
+                self._advance()
+        self.lag = 0.0
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self.wheel)
+        slot = self.wheel[self._cursor]
+        if not slot:
+            return
+        waiting = []
+        for entry in slot:
+            if entry[0]:
+                entry[0] -= 1
+                waiting.append(entry)
+            elif not entry[1].done():
+                entry[1].set_result(None)
+        self.wheel[self._cursor] = waiting
+
+    def _report(self):
+        now = time.monotonic()
+        if now - self._reported_at < self.REPORT_INTERVAL:
+            return
+        skipped, shrunk = self.skipped - self._reported[0], self.shrunk - self._reported[1]
+        logging.warning(
+            f"Response delays under load ({self.pending} pending, lag {self.lag:.3f}s): "
+            f"{skipped} skipped, {shrunk} shortened"
+        )
+        self._reported = (self.skipped, self.shrunk)
+        self._reported_at = now
+
+    def stats(self):
+        """Delay queue size and counters."""
+        return {
+            "pending": self.pending,
+            "peak": self.peak,
+            "max_pending": self.max_pending,
+            "delayed": self.delayed,
+            "skipped": self.skipped,
+            "shrunk": self.shrunk,
+            "factor": self.factor(),
+            "lag": self.lag,
+        }
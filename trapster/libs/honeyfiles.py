@@ -0,0 +1,365 @@
+"""
+Synthetic honeyfiles: large decoy downloads (`/backup.zip`, `/db.sql`,
+`/logs/access.log`, ...) generated on the fly instead of stored.
+
+Content is a pure function of (seed, offset): it is produced in fixed-size
+blocks, each generated from its own seeded RNG, so any byte range can be
+produced directly (Range requests, resumed downloads) and the same deployment
+always serves the same bytes. Streaming holds at most one block per file in
+memory, whatever the file's size.
+
+Kinds:
+
+- `sql`: a mysqldump of a `users` table
+- `log`: an Apache/nginx access log
+- `binary`: random bytes (encrypted archive, disk image, ...)
+- `zip`: a stored (uncompressed) ZIP of `members` files of `member_kind`.
+  The archive's structure is exact, so listing it works; the CRCs are not
+  computed (that would mean generating every member first), so extracting
+  reports CRC errors, as with a corrupted backup.
+"""
+
+import asyncio
+import base64
+import bisect
+import random
+import struct
+import time
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'kib': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2,
+          'mib': 1024 ** 2, 'g': 1024 ** 3, 'gb': 1024 ** 3, 'gib': 1024 ** 3, 't': 1024 ** 4,
+          'tb': 1024 ** 4, 'tib': 1024 ** 4}
+
+
+def parse_size(value):
+    """Bytes in a size given as an int or a string such as '2GB', '512 KiB'
+    (binary multiples)."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().lower().replace(' ', '')
+    number = text.rstrip('abcdefghijklmnopqrstuvwxyz')
+    unit = text[len(number):]
+    if unit not in _UNITS or not number:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(number) * _UNITS[unit])
+
+
+class BlockContent:
+    """Content of `size` bytes made of independently generated blocks."""
+    content_type = 'application/octet-stream'
+
+    def __init__(self, seed, size, block_size=DEFAULT_BLOCK_SIZE):
+        self.seed = seed
+        self.size = size
+        self.block_size = block_size
+        self.epoch = _epoch(seed)
+        self._cached = (None, b'')
+
+    def _rng(self, index):
+        return random.Random(f"{self.seed}:{index}")
+
+    def generate(self, index, length):
+        """Block `index`, exactly `length` bytes long."""
+        raise NotImplementedError
+
+    def block(self, index):
+        # Streams of one file may run in threads: read and replace the cached
+        # (index, data) pair as a whole, never one field after the other.
+        cached = self._cached
+        if cached[0] != index:
+            length = min(self.block_size, self.size - index * self.block_size)
+            cached = self._cached = (index, self.generate(index, length))
+        return cached[1]
+
+    def read(self, offset, length):
+        out = bytearray()
+        end = min(offset + length, self.size)
+        while offset < end:
+            index, skip = divmod(offset, self.block_size)
+            piece = self.block(index)[skip:skip + end - offset]
+            out += piece
+            offset += len(piece)
+        return bytes(out)
+
+
+class BinaryContent(BlockContent):
+    def generate(self, index, length):
+        return self._rng(index).randbytes(length)
+
+
+class TextContent(BlockContent):
+    """Line-oriented text. Each block is whole lines, completed by a filler
+    line; the first block starts with `prologue`, the last ends with
+    `epilogue`."""
+    content_type = 'text/plain'
+
+    def prologue(self):
+        return b''
+
+    def epilogue(self):
+        return b''
+
+    def line(self, rng, index, number):
+        raise NotImplementedError
+
+    def filler(self, length):
+        return b' ' * (length - 1) + b'\n' if length else b''
+
+    def generate(self, index, length):
+        rng = self._rng(index)
+        out = bytearray(self.prologue() if index == 0 else b'')
+        tail = self.epilogue() if (index + 1) * self.block_size >= self.size else b''
+        room = length - len(tail)
+        number = 0
+        while True:
+            line = self.line(rng, index, number)
+            if len(out) + len(line) > room:
+                break
+            out += line
+            number += 1
+        if len(out) < room:
+            out += self.filler(room - len(out))
+        out += tail
+        return bytes(out[:length])
+
+
+_FIRST_NAMES = ('james', 'mary', 'john', 'patricia', 'robert', 'jennifer', 'michael', 'linda', 'david',
+                'elizabeth', 'william', 'barbara', 'richard', 'susan', 'joseph', 'jessica', 'thomas',
+                'sarah', 'charles', 'karen', 'daniel', 'nancy', 'matthew', 'lisa', 'anthony', 'betty')
+_LAST_NAMES = ('smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'rodriguez',
+               'martinez', 'hernandez', 'lopez', 'wilson', 'anderson', 'thomas', 'taylor', 'moore',
+               'jackson', 'martin', 'lee', 'thompson', 'white', 'harris', 'clark', 'lewis', 'walker')
+_DOMAINS = ('gmail.com', 'outlook.com', 'yahoo.com', 'hotmail.com', 'protonmail.com', 'icloud.com')
+_BCRYPT = bytes.maketrans(b'+/=', b'./.')
+
+
+def _epoch(seed):
+    """A fixed point in the past (2020-2023) for a seed's timestamps."""
+    return 1577836800 + random.Random(f"{seed}:epoch").randrange(3 * 365 * 86400)
+
+
+class SqlDump(TextContent):
+    content_type = 'application/sql'
+
+    def prologue(self):
+        date = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.epoch))
+        return (
+            "-- MySQL dump 10.13  Distrib 8.0.36, for Linux (x86_64)\n"
+            "--\n"
+            "-- Host: localhost    Database: production\n"
+            "-- ------------------------------------------------------\n"
+            "-- Server version\t8.0.36-0ubuntu0.22.04.1\n\n"
+            "/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;\n"
+            "/*!50503 SET NAMES utf8mb4 */;\n"
+            "/*!40103 SET @OLD_TIME_ZONE=@@TIME_ZONE */;\n"
+            "/*!40103 SET TIME_ZONE='+00:00' */;\n"
+            "/*!40014 SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0 */;\n"
+            "/*!40014 SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0 */;\n\n"
+            "--\n-- Table structure for table `users`\n--\n\n"
+            "DROP TABLE IF EXISTS `users`;\n"
+            "CREATE TABLE `users` (\n"
+            "  `id` int unsigned NOT NULL AUTO_INCREMENT,\n"
+            "  `username` varchar(64) NOT NULL,\n"
+            "  `email` varchar(255) NOT NULL,\n"
+            "  `password` char(60) NOT NULL,\n"
+            "  `created_at` datetime NOT NULL,\n"
+            "  `is_admin` tinyint(1) NOT NULL DEFAULT '0',\n"
+            "  PRIMARY KEY (`id`),\n"
+            "  UNIQUE KEY `username` (`username`)\n"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;\n\n"
+            f"-- Dumped on {date}\n\n"
+            "LOCK TABLES `users` WRITE;\n"
+            "/*!40000 ALTER TABLE `users` DISABLE KEYS */;\n"
+        ).encode()
+
+    def epilogue(self):
+        return (
+            "/*!40000 ALTER TABLE `users` ENABLE KEYS */;\n"
+            "UNLOCK TABLES;\n"
+            "/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;\n\n"
+            "-- Dump completed\n"
+        ).encode()
+
+    def line(self, rng, index, number):
+        first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+        user = f"{first}.{last}{rng.randrange(100)}"
+        password = base64.b64encode(rng.randbytes(40)).translate(_BCRYPT)[:53].decode()
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.epoch - rng.randrange(10 ** 8)))
+        row_id = index * 1000 + number + 1
+        return (f"INSERT INTO `users` VALUES ({row_id},'{user}','{user}@{rng.choice(_DOMAINS)}',"
+                f"'$2y$10${password}','{created}',{int(rng.random() < 0.02)});\n").encode()
+
+    def filler(self, length):
+        if length < 3:
+            return b'\n' * length
+        return b'--' + b'-' * (length - 3) + b'\n'
+
+
+_PATHS = ('/', '/index.php', '/login', '/wp-login.php', '/api/v1/users', '/static/app.js', '/static/style.css',
+          '/favicon.ico', '/robots.txt', '/admin/', '/search?q=report', '/images/logo.png', '/dashboard')
+_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'curl/7.81.0',
+    'python-requests/2.31.0',
+)
+
+
+class AccessLog(TextContent):
+    # Each block covers one hour of traffic.
+    BLOCK_SECONDS = 3600
+
+    def line(self, rng, index, number):
+        # Timestamps only move forward, within the block's hour.
+        seconds = min(self.BLOCK_SECONDS - 1, number * 8 + rng.randrange(8))
+        stamp = time.strftime('%d/%b/%Y:%H:%M:%S +0000',
+                              time.gmtime(self.epoch + index * self.BLOCK_SECONDS + seconds))
+        ip = f"{rng.choice((10, 172, 192))}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        status = rng.choices((200, 301, 304, 404, 500), (80, 5, 8, 6, 1))[0]
+        method = 'POST' if rng.random() < 0.1 else 'GET'
+        return (f'{ip} - - [{stamp}] "{method} {rng.choice(_PATHS)} HTTP/1.1" {status} '
+                f'{rng.randrange(200, 50000)} "-" "{rng.choice(_AGENTS)}"\n').encode()
+
+
+class ZipArchive:
+    """A stored ZIP whose members are other generated contents."""
+    content_type = 'application/zip'
+    _LOCAL = struct.Struct('<IHHHHHIIIHH')
+    _CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')
+    _END = struct.Struct('<IHHHHIIH')
+
+    def __init__(self, seed, size, members=4, member_kind='sql', member_name=None):
+        member_class = KINDS[member_kind]
+        if member_class is ZipArchive:
+            raise ValueError("ZIP members can't be ZIP archives")
+        if size > 0xFFFFFFFF:
+            raise ValueError("ZIP honeyfiles are limited to 4 GiB")
+        extension = {'sql': 'sql', 'log': 'log'}.get(member_kind, 'bin')
+        member_name = member_name or f"backup/part_{{n:03d}}.{extension}"
+        names = [member_name.format(n=n + 1).encode() for n in range(int(members))]
+        overhead = sum(self._LOCAL.size + self._CENTRAL.size + 2 * len(name) for name in names) + self._END.size
+        data = size - overhead
+        if data < len(names):
+            raise ValueError(f"ZIP honeyfile too small for {len(names)} members")
+
+        rng = random.Random(f"{seed}:zip")
+        stamp = time.gmtime(_epoch(seed))
+        dos_time = (stamp.tm_hour << 11) | (stamp.tm_min << 5) | (stamp.tm_sec // 2)
+        dos_date = ((stamp.tm_year - 1980) << 9) | (stamp.tm_mon << 5) | stamp.tm_mday
+
+        # (offset, bytes or content) segments, in file order.
+        self.segments = []
+        central = bytearray()
+        offset = 0
+        for n, name in enumerate(names):
+            member_size = data // len(names) + (data % len(names) if n == len(names) - 1 else 0)
+            crc = rng.getrandbits(32)
+            header = self._LOCAL.pack(0x04034b50, 20, 0, 0, dos_time, dos_date, crc,
+                                      member_size, member_size, len(name), 0) + name
+            central += self._CENTRAL.pack(0x02014b50, 0x031e, 20, 0, 0, dos_time, dos_date, crc,
+                                          member_size, member_size, len(name), 0, 0, 0, 0,
+                                          0o100644 << 16, offset) + name
+            self.segments.append((offset, header))
+            offset += len(header)
+            self.segments.append((offset, member_class(f"{seed}:{name.decode()}", member_size)))
+            offset += member_size
+        central += self._END.pack(0x06054b50, 0, 0, len(names), len(names), len(central), offset, 0)
+        self.segments.append((offset, bytes(central)))
+        self.size = offset + len(central)
+        self._offsets = [start for start, _ in self.segments]
+
+    def read(self, offset, length):
+        out = bytearray()
+        end = min(offset + length, self.size)
+        i = bisect.bisect_right(self._offsets, offset) - 1
+        while offset < end:
+            start, segment = self.segments[i]
+            skip = offset - start
+            if isinstance(segment, bytes):
+                piece = segment[skip:skip + end - offset]
+            else:
+                piece = segment.read(skip, end - offset)
+            out += piece
+            offset += len(piece)
+            i += 1
+        return bytes(out)
+
+
+KINDS = {'sql': SqlDump, 'log': AccessLog, 'binary': BinaryContent, 'zip': ZipArchive}
+
+
+class Honeyfile:
+    def __init__(self, content, rate=None, chunk_size=DEFAULT_BLOCK_SIZE):
+        self.content = content
+        self.size = content.size
+        self.content_type = content.content_type
+        # Bytes per second, per download (None: as fast as the client reads).
+        self.rate = rate
+        self.chunk_size = min(chunk_size, rate) if rate else chunk_size
+
+    @classmethod
+    def from_config(cls, options, seed):
+        """Honeyfile for an endpoint's `honeyfile` entry; `seed` identifies
+        the deployment and endpoint (the entry's own `seed` is added)."""
+        kind = options.get('kind', 'binary')
+        if kind not in KINDS:
+            raise ValueError(f"Unknown honeyfile kind: {kind}")
+        seed = f"{seed}:{options.get('seed', '')}"
+        size = parse_size(options.get('size', '10MB'))
+        if kind == 'zip':
+            content = ZipArchive(seed, size, options.get('members', 4), options.get('member_kind', 'sql'),
+                                 options.get('member_name'))
+        else:
+            content = KINDS[kind](seed, size)
+        rate = parse_size(options['rate']) if options.get('rate') else None
+        return cls(content, rate, parse_size(options.get('chunk_size', DEFAULT_BLOCK_SIZE)))
+
+    def byte_range(self, header):
+        """(start, end) of a `Range: bytes=...` header (end exclusive); None
+        to serve the whole file (no header, or one this ignores, like
+        multiple ranges); 'unsatisfiable' if it lies past the end."""
+        if not header:
+            return None
+        unit, _, spec = header.partition('=')
+        if unit.strip().lower() != 'bytes' or ',' in spec:
+            return None
+        first, dash, last = spec.strip().partition('-')
+        try:
+            if not dash:
+                return None
+            if not first:
+                length = int(last)
+                if length <= 0:
+                    return 'unsatisfiable'
+                return max(0, self.size - length), self.size
+            start = int(first)
+            end = int(last) + 1 if last else self.size
+        except ValueError:
+            return None
+        if start >= self.size:
+            return 'unsatisfiable'
+        if end <= start:
+            return None
+        return start, min(end, self.size)
+
+    async def stream(self, start, end):
+        """The bytes [start, end) in chunks, at most `rate` bytes per second.
+
+        Chunks are aligned on chunk_size, so a range starting mid-block costs
+        one short chunk, not a block generated twice per chunk. Generating
+        text takes milliseconds per block, so it runs off the event loop.
+        """
+        began = time.monotonic()
+        offset = start
+        while offset < end:
+            length = min(self.chunk_size - offset % self.chunk_size, end - offset)
+            chunk = await asyncio.to_thread(self.content.read, offset, length)
+            offset += len(chunk)
+            yield chunk
+            if self.rate:
+                ahead = (offset - start) / self.rate - (time.monotonic() - began)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
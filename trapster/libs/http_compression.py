@@ -0,0 +1,161 @@
+"""
+Content-Encoding for HTTP skins, as real servers do (mod_deflate, IIS
+dynamic/static compression, ...): a response whose type and size qualify is
+sent in the client's preferred encoding among those the skin offers.
+
+Enabled per skin with a `compression` block in config.yaml:
+
+    compression:
+      encodings: [br, gzip]     # offered, in the server's order of preference
+      min_size: 256             # smaller bodies are sent as is
+      types: [text/, application/javascript, application/json]
+      vary: true                # Vary: Accept-Encoding on compressible responses
+      level: 6
+
+Static files and constant endpoints are compressed once and kept next to
+their identity bytes; rendered templates are compressed per response. The
+gzip/deflate streams come from zlib with its usual header, as a C server's
+would. `br` needs the optional `brotli` package and is ignored without it.
+"""
+
+import logging
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_TYPES = (
+    'text/', 'application/javascript', 'application/x-javascript', 'application/json',
+    'application/xml', 'application/rss+xml', 'application/atom+xml', 'image/svg+xml',
+    'image/x-icon', 'image/vnd.microsoft.icon',
+)
+
+SUPPORTED_ENCODINGS = ('br', 'gzip', 'deflate')
+
+# Statuses whose response has no body to encode.
+_NO_BODY_STATUSES = frozenset({204, 206, 304})
+
+
+def _header(headers, name):
+    return next((v for k, v in headers.items() if k.lower() == name), None)
+
+
+class Compression:
+    def __init__(self, encodings=('gzip',), min_size=256, types=DEFAULT_TYPES, vary=True, level=6):
+        offered = []
+        for encoding in encodings:
+            encoding = str(encoding).strip().lower()
+            if encoding not in SUPPORTED_ENCODINGS:
+                raise ValueError(f"Unsupported content encoding: {encoding}")
+            if encoding == 'br' and brotli is None:
+                logging.warning("br compression needs the brotli package, offering the other encodings only")
+                continue
+            offered.append(encoding)
+        self.encodings = tuple(offered)
+        self.min_size = int(min_size)
+        self.types = tuple(str(t).lower() for t in types)
+        self.vary = bool(vary)
+        self.level = int(level)
+        self._negotiated = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Compression for a skin's `compression` entry, or None if it has
+        none (`compression: true` enables the defaults)."""
+        if not config:
+            return None
+        if config is True:
+            config = {}
+        options = {key: config[key] for key in ('encodings', 'min_size', 'types', 'vary', 'level')
+                   if config.get(key) is not None}
+        compression = cls(**options)
+        return compression if compression.encodings else None
+
+    def negotiate(self, accept_encoding):
+        """The offered encoding the client prefers, per its Accept-Encoding
+        header (q-values, '*', 'x-gzip'), or None for identity."""
+        if not accept_encoding:
+            return None
+        try:
+            return self._negotiated[accept_encoding]
+        except KeyError:
+            pass
+        weights = {}
+        for item in accept_encoding.split(','):
+            token, _, params = item.partition(';')
+            token = token.strip().lower()
+            if token == 'x-gzip':
+                token = 'gzip'
+            q = 1.0
+            params = params.strip().lower()
+            if params.startswith('q='):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            weights[token] = q
+        best, best_q = None, 0.0
+        for encoding in self.encodings:
+            q = weights.get(encoding, weights.get('*', 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        # Header values repeat a lot (one per browser/tool), so this stays small.
+        if len(self._negotiated) >= 1024:
+            self._negotiated.clear()
+        self._negotiated[accept_encoding] = best
+        return best
+
+    def eligible(self, status_code, headers, size):
+        """Whether a response with these headers and body size is compressed."""
+        if status_code < 200 or status_code in _NO_BODY_STATUSES or size < self.min_size:
+            return False
+        if _header(headers, 'content-encoding') is not None:
+            return False
+        content_type = _header(headers, 'content-type')
+        return bool(content_type) and content_type.lower().startswith(self.types)
+
+    def with_vary(self, headers):
+        """`headers` with Accept-Encoding added to Vary (if enabled)."""
+        if not self.vary:
+            return headers
+        for key, value in headers.items():
+            if key.lower() == 'vary':
+                if 'accept-encoding' in value.lower() or value.strip() == '*':
+                    return headers
+                return {**headers, key: f"{value}, Accept-Encoding"}
+        return {**headers, 'Vary': 'Accept-Encoding'}
+
+    def compress(self, data, encoding):
+        """`data` encoded, or None if that doesn't make it smaller."""
+        if encoding == 'br':
+            compressed = brotli.compress(bytes(data), quality=min(self.level, 11))
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+            compressed = compressor.compress(data) + compressor.flush()
+        return compressed if len(compressed) < len(data) else None
+
+    def variants(self, data):
+        """{encoding: compressed bytes} for every offered encoding that helps."""
+        variants = {}
+        for encoding in self.encodings:
+            compressed = self.compress(data, encoding)
+            if compressed is not None:
+                variants[encoding] = compressed
+        return variants
+
+    def encode(self, status_code, headers, body, accept_encoding, variants=None):
+        """(body, headers) to send: compressed in the negotiated encoding (from
+        precomputed `variants` when given), with Vary, if the response
+        qualifies; unchanged otherwise."""
+        if not self.eligible(status_code, headers, len(body)):
+            return body, headers
+        headers = self.with_vary(headers)
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return body, headers
+        compressed = variants.get(encoding) if variants is not None else self.compress(body, encoding)
+        if compressed is None:
+            return body, headers
+        return compressed, {**headers, 'Content-Encoding': encoding}
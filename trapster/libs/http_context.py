@@ -0,0 +1,138 @@
+"""
+Per-request context for the HTTP handler.
+
+Routing, templating, reason rendering and logging all need the same facts
+about a request (its target, headers, body, form fields, ...). A
+RequestContext computes each of them lazily, at most once, and is stored in
+the ASGI scope's `state` so every step handling the request shares it.
+
+The body is streamed rather than buffered: at most `max_body` bytes are kept
+(for templates and logs), while the whole stream is hashed, counted and fed
+to a CredentialScanner.
+"""
+
+from functools import cached_property
+import hashlib
+from urllib.parse import parse_qsl
+
+from starlette.requests import ClientDisconnect
+
+from trapster.libs.credentials import CredentialScanner
+
+_CONTEXT_STATE_KEY = "trapster_request_context"
+
+BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+DEFAULT_MAX_BODY = 1024 * 1024
+
+
+class RequestContext:
+    def __init__(self, request, max_body=DEFAULT_MAX_BODY):
+        self.request = request
+        self.max_body = max_body
+        self._body = None
+        self._info = None
+        self._credentials = {}
+        # Set once the body has been read.
+        self.body_length = 0
+        self.body_sha256 = None
+        self.body_truncated = False
+
+    @classmethod
+    def of(cls, request, max_body=DEFAULT_MAX_BODY):
+        """The request's context, created on first use."""
+        state = request.scope.setdefault("state", {})
+        context = state.get(_CONTEXT_STATE_KEY)
+        if context is None:
+            context = state[_CONTEXT_STATE_KEY] = cls(request, max_body)
+        return context
+
+    @cached_property
+    def target(self):
+        """Path and query string as sent, e.g. '/login?next=%2F'."""
+        return str(self.request.url).split(self.request.base_url.netloc, 1)[1]
+
+    @cached_property
+    def headers(self):
+        return dict(self.request.headers)
+
+    @cached_property
+    def query(self):
+        return dict(self.request.query_params)
+
+    @property
+    def has_body(self):
+        return self.request.method in BODY_METHODS
+
+    async def body(self):
+        """Body of a POST/PUT/PATCH, up to max_body bytes (b'' otherwise).
+
+        The rest of the stream is only hashed and counted (see body_length,
+        body_sha256, body_truncated). A client leaving mid-body keeps what
+        was received.
+        """
+        if self._body is None:
+            self._body = b''
+            if self.has_body:
+                await self._read_body()
+        return self._body
+
+    async def _read_body(self):
+        kept = bytearray()
+        digest = hashlib.sha256()
+        scanner = CredentialScanner()
+        try:
+            async for chunk in self.request.stream():
+                if not chunk:
+                    continue
+                self.body_length += len(chunk)
+                digest.update(chunk)
+                scanner.feed(chunk)
+                if len(kept) < self.max_body:
+                    kept += chunk[:self.max_body - len(kept)]
+        except ClientDisconnect:
+            pass
+        self._body = bytes(kept)
+        self.body_sha256 = digest.hexdigest()
+        self.body_truncated = self.body_length > len(kept)
+        self._credentials = scanner.result()
+
+    async def info(self):
+        """The `request` object exposed to templates."""
+        if self._info is None:
+            request = self.request
+            body = None
+            form = {}
+            if self.has_body:
+                raw = await self.body()
+                # A truncated body may end inside a multi-byte character.
+                body = raw.decode(errors='replace') if raw else None
+                # Parse form-urlencoded bodies so templates can reflect fields
+                # back (e.g. the submitted username). Last value wins for
+                # repeated keys.
+                ctype = request.headers.get("content-type", "")
+                if body and "application/x-www-form-urlencoded" in ctype:
+                    form = dict(parse_qsl(body, keep_blank_values=True))
+
+            self._info = {
+                "url": request.url,
+                "path": request.url.path,
+                "method": request.method,
+                "headers": self.headers,
+                "body": body,
+                "form": form,
+                "remote": request.client.host if request.client else None,
+                "cookies": request.cookies,
+                "query_string": self.query,
+                "content_type": request.headers.get("content-type"),
+                "host": request.headers.get("host"),
+                "secure": request.url.scheme == "https",
+                "scheme": request.url.scheme,
+                "path_qs": self.target,
+            }
+        return self._info
+
+    async def credentials(self):
+        """Credentials found in the whole body (see CredentialScanner)."""
+        await self.body()
+        return self._credentials
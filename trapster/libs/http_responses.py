@@ -0,0 +1,148 @@
+"""
+Pre-built responses for constant HTTP endpoints.
+
+Once deploy-time Jinja has been resolved, many endpoints (inline `content`,
+fixed headers, a fixed or absent reason) produce the same bytes for every
+request. Those are encoded once at setup: body, raw header list (including
+Content-Length) and reason, plus the ETag/Last-Modified used for conditional
+requests, already parsed. With compression, the encoded variants are built
+at the same time. At request time only the encoding choice and the
+Set-Cookie suppression are applied; the Date header is added by the
+middleware as for any response.
+"""
+
+from email.utils import parsedate_to_datetime
+
+from starlette.responses import Response
+
+# Jinja syntax markers: a string without any of them renders to itself.
+_JINJA_MARKERS = ('{{', '{%', '{#')
+
+
+def has_jinja(value):
+    return isinstance(value, str) and any(marker in value for marker in _JINJA_MARKERS)
+
+
+def cookie_name(set_cookie):
+    """Return the cookie name from a Set-Cookie header value, or None."""
+    first = set_cookie.split(';', 1)[0].strip()
+    if '=' in first:
+        return first.split('=', 1)[0].strip()
+    return None
+
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value)
+    except Exception:
+        return None
+
+
+def is_not_modified(request_headers, etag, last_modified, last_modified_date=None):
+    """True if the request's conditional headers match the resource's ETag or
+    Last-Modified. `last_modified_date` is the pre-parsed `last_modified`."""
+    if etag:
+        inm = request_headers.get("if-none-match", "")
+        if inm and (inm.strip('"') == etag.strip('"') or inm == "*"):
+            return True
+    if last_modified:
+        ims = request_headers.get("if-modified-since", "")
+        if ims:
+            if last_modified_date is None:
+                last_modified_date = parse_http_date(last_modified)
+            ims_date = parse_http_date(ims)
+            try:
+                if ims_date >= last_modified_date:
+                    return True
+            except TypeError:
+                if ims == last_modified:
+                    return True
+    return False
+
+
+class PrebuiltResponse(Response):
+    """A Response whose body and raw headers are already encoded."""
+
+    def __init__(self, status_code, body, raw_headers):
+        self.status_code = status_code
+        self.body = body
+        self.raw_headers = raw_headers
+        self.background = None
+
+
+class ConstantResponse:
+    """Everything a constant endpoint sends, encoded once."""
+    __slots__ = ('status_code', 'body', 'raw_headers', 'cookies', 'reason', 'compression', 'encodings',
+                 'etag', 'last_modified', 'last_modified_date', 'not_modified_headers')
+
+    def __init__(self, content, status_code, headers, reason=None, compression=None):
+        template = Response(content=content, status_code=status_code, headers=headers)
+        self.status_code = status_code
+        self.compression = compression
+        # encoding -> (body, raw_headers, cookies) of each compressed variant.
+        self.encodings = {}
+        if compression is not None and compression.eligible(status_code, headers, len(template.body)):
+            headers = compression.with_vary(headers)
+            template = Response(content=content, status_code=status_code, headers=headers)
+            for encoding, body in compression.variants(template.body).items():
+                variant = Response(content=body, status_code=status_code,
+                                   headers={**headers, 'Content-Encoding': encoding})
+                self.encodings[encoding] = (body, variant.raw_headers, self._cookies(variant.raw_headers))
+        self.body = template.body
+        self.raw_headers = template.raw_headers
+        self.cookies = self._cookies(self.raw_headers)
+        self.reason = reason
+
+        self.etag = next((v for k, v in headers.items() if k.lower() == "etag"), None)
+        self.last_modified = next((v for k, v in headers.items() if k.lower() == "last-modified"), None)
+        self.last_modified_date = parse_http_date(self.last_modified) if self.last_modified else None
+        self.not_modified_headers = Response(
+            content=b"", status_code=304,
+            headers={k: v for k, v in headers.items() if k.lower() in ("etag", "cache-control", "last-modified")},
+        ).raw_headers
+
+    @staticmethod
+    def _cookies(raw_headers):
+        """Index of each Set-Cookie header in raw_headers, with its cookie name."""
+        return [(i, cookie_name(value.decode('latin-1')))
+                for i, (name, value) in enumerate(raw_headers) if name == b'set-cookie']
+
+    @classmethod
+    def build(cls, config, global_headers, default_status, render_reason, compression=None):
+        """ConstantResponse for an endpoint config, or None if any part of the
+        response depends on the request (templates, AI, honeyfiles,
+        request-time Jinja in headers or reason)."""
+        if not config or 'file' in config or 'ai' in config or 'honeyfile' in config:
+            return None
+        content = config.get('content', "")
+        if not isinstance(content, (str, bytes)):
+            return None
+        headers = {**global_headers, **config.get('headers', {})}
+        if not all(isinstance(k, str) and isinstance(v, str) and not has_jinja(v) for k, v in headers.items()):
+            return None
+        reason = config.get('reason')
+        if reason and (not isinstance(reason, str) or has_jinja(reason)):
+            return None
+        status_code = config.get('status_code', default_status)
+        return cls(content, status_code, headers, render_reason(config, None) if reason else None, compression)
+
+    def is_not_modified(self, request_headers):
+        return is_not_modified(request_headers, self.etag, self.last_modified, self.last_modified_date)
+
+    def response(self, client_cookies, accept_encoding=None):
+        """The response for a request carrying these cookies (and this
+        Accept-Encoding): Set-Cookie headers for cookies the client already
+        has are left out."""
+        body, raw_headers, cookies = self.body, self.raw_headers, self.cookies
+        if self.encodings and accept_encoding:
+            encoded = self.encodings.get(self.compression.negotiate(accept_encoding))
+            if encoded is not None:
+                body, raw_headers, cookies = encoded
+        if client_cookies and cookies:
+            skip = {i for i, name in cookies if name is not None and name in client_cookies}
+            if skip:
+                raw_headers = [header for i, header in enumerate(raw_headers) if i not in skip]
+        return PrebuiltResponse(self.status_code, body, raw_headers)
+
+    def not_modified(self):
+        return PrebuiltResponse(304, b"", self.not_modified_headers)
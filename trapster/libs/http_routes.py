@@ -0,0 +1,143 @@
+"""
+Route index for HTTP skins: compiles a skin's `endpoints` list once so each
+request is routed without walking, re-matching and re-filtering every entry.
+
+Matching semantics are exactly those of a linear scan over the endpoints:
+routes are tried in config order and must fullmatch the path; the first one
+with a variant for the request method wins, preferring a variant whose query
+rules all match, then one with no query rules; otherwise the scan continues
+with the next matching route.
+
+Route patterns and query rules are skin-author regexes matched against
+attacker-controlled input, so they are compiled with compile_safe (see
+safe_regex): a route with a pattern that can backtrack exponentially is
+skipped, like one with an invalid regex.
+"""
+
+import heapq
+import logging
+import re
+
+from trapster.libs.safe_regex import UnsafePattern, compile_alternation, compile_safe
+
+# Characters with a meaning in a regex. A route without any of them can only
+# ever fullmatch itself, so it is looked up in a dict instead.
+_REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+# Constructs that can't be merged into one alternation: backreferences are
+# renumbered/renamed by the merge, and global inline flags are only valid at
+# the very start of a pattern.
+_UNMERGEABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+
+def is_literal(route):
+    return not any(c in _REGEX_CHARS for c in route)
+
+
+class RouteVariant:
+    """One method/query variant of a route, with its query rules compiled."""
+    __slots__ = ('config', 'query')
+
+    def __init__(self, config):
+        self.config = config
+        rules = config.get('query') or {}
+        self.query = [(name, compile_safe(str(pattern))) for name, pattern in rules.items()]
+
+    def query_matches(self, params):
+        """True if every query rule (regex per param) matches the request."""
+        return all(name in params and pattern.fullmatch(params[name])
+                   for name, pattern in self.query)
+
+
+class Route:
+    """A route's variants bucketed by method, in config order."""
+    __slots__ = ('index', 'pattern', 'regex', 'by_method')
+
+    def __init__(self, index, pattern, details):
+        self.index = index
+        self.pattern = pattern
+        self.regex = None
+        self.by_method = {}
+        for config in details:
+            self.by_method.setdefault(config.get('method'), []).append(RouteVariant(config))
+
+    def resolve(self, method, params):
+        variants = self.by_method.get(method)
+        if not variants:
+            return None
+        for variant in variants:
+            if variant.query and variant.query_matches(params):
+                return variant.config
+        return next((v.config for v in variants if not v.query), None)
+
+
+class RouteIndex:
+    """Compiled form of a skin's `endpoints` list (see module docstring)."""
+
+    def __init__(self, endpoints):
+        self.routes = []
+        self.literals = {}   # path -> [route index, ...] (ascending)
+        self.regexes = []    # [Route, ...] (ascending index)
+        self.combined = None
+
+        for endpoint in endpoints or []:
+            for pattern, details in endpoint.items():
+                pattern = str(pattern)
+                if not isinstance(details, list):
+                    details = [details]
+                try:
+                    route = Route(len(self.routes), pattern, details)
+                    if not is_literal(pattern):
+                        route.regex = compile_safe(pattern)
+                except UnsafePattern as e:
+                    logging.warning(f"Skipping route {pattern!r}, unsafe regex: {e}")
+                    continue
+                except re.error as e:
+                    logging.warning(f"Skipping route {pattern!r}, invalid regex: {e}")
+                    continue
+                if route.regex is None:
+                    self.literals.setdefault(pattern, []).append(route.index)
+                else:
+                    self.regexes.append(route)
+                self.routes.append(route)
+
+        self.combined = self._merge(self.regexes)
+
+    @staticmethod
+    def _merge(regexes):
+        """One alternation of every regex route, so a miss costs one match.
+
+        Each route is wrapped in a named group; the engine tries alternatives
+        left to right, so the group that matched is the first route (in
+        config order) that fullmatches the path.
+        """
+        if len(regexes) < 2 or any(_UNMERGEABLE.search(r.pattern) for r in regexes):
+            return None
+        try:
+            return compile_alternation('|'.join(f'(?P<r{i}>{route.pattern})' for i, route in enumerate(regexes)),
+                                       [route.regex for route in regexes])
+        except re.error:
+            return None
+
+    def _regex_matches(self, path):
+        """Yield the indexes of regex routes fullmatching path, in order."""
+        start = 0
+        if self.combined is not None:
+            match = self.combined.fullmatch(path)
+            if match is None:
+                return
+            start = int(match.lastgroup[1:])
+            yield self.regexes[start].index
+            start += 1
+        for route in self.regexes[start:]:
+            if route.regex.fullmatch(path):
+                yield route.index
+
+    def lookup(self, path, method, params):
+        """Return the endpoint config for this path + method (+ query params)."""
+        literal = self.literals.get(path, ())
+        for index in heapq.merge(literal, self._regex_matches(path)):
+            config = self.routes[index].resolve(method, params)
+            if config is not None:
+                return config
+        return None
@@ -0,0 +1,149 @@
+"""
+In-memory index of a skin's `files/` tree, so static lookups don't touch the
+filesystem: most GETs reaching handle_static_file are 404 probes, and they are
+answered from a dict without a single syscall.
+
+- The tree is walked once at setup; every regular file whose resolved path
+  stays inside the root (symlinks included) is indexed with its size, mtime
+  and Content-Type. Anything resolving outside the root is never indexed, so
+  traversal attempts ('..', symlinks, NUL bytes, ...) simply miss.
+- Hits are served from an LRU byte cache bounded in total size. Files larger
+  than `mmap_threshold` are mmap'd once and served as a memoryview instead of
+  being copied into the cache.
+- With `rescan_interval` (seconds), the tree is walked again on the first
+  lookup after that interval; otherwise changes need a restart (or rescan()).
+"""
+
+from collections import OrderedDict
+import logging
+import mimetypes
+import mmap
+import os
+import posixpath
+import time
+
+mimetypes.add_type('image/x-icon', '.ico')
+
+
+class StaticFile:
+    __slots__ = ('path', 'size', 'mtime', 'content_type')
+
+    def __init__(self, path, size, mtime, content_type):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.content_type = content_type
+
+
+class StaticIndex:
+    def __init__(self, root, cache_size=16 * 1024 * 1024, mmap_threshold=1024 * 1024,
+                 rescan_interval=None):
+        self.root = root
+        self.cache_size = int(cache_size)
+        self.mmap_threshold = int(mmap_threshold)
+        self.rescan_interval = float(rescan_interval) if rescan_interval else None
+        self.files = {}
+        self._cache = OrderedDict()   # rel -> (StaticFile, bytes or memoryview)
+        self._cached_bytes = 0
+        self._scanned_at = 0.0
+        self._root = os.path.realpath(root).replace(os.sep, '/')
+        self._prefix = self._root.rstrip('/') + '/'
+        self.rescan()
+
+    def rescan(self):
+        """Walk the tree and replace the index; cached content of files that
+        changed (or disappeared) is dropped."""
+        files = {}
+        root = os.path.realpath(self.root)
+        # Directory symlinks are followed only while they stay inside the root
+        # and don't lead back to a directory already on the current path.
+        ancestors = {root: frozenset([root])}
+        for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+            chain = ancestors.pop(dirpath)
+            walkable = []
+            for name in dirnames:
+                real = os.path.realpath(os.path.join(dirpath, name))
+                if self._contains(root, real) and real not in chain:
+                    walkable.append(name)
+                    ancestors[os.path.join(dirpath, name)] = chain | {real}
+            dirnames[:] = walkable
+            rel_dir = os.path.relpath(dirpath, root)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                real_path = os.path.realpath(path)
+                if not self._contains(root, real_path):
+                    continue
+                try:
+                    st = os.stat(real_path)
+                except OSError:
+                    continue
+                rel = name if rel_dir == '.' else posixpath.join(rel_dir.replace(os.sep, '/'), name)
+                content_type = mimetypes.guess_type(real_path)[0] or 'application/octet-stream'
+                entry = self.files.get(rel)
+                if entry is None or (entry.path, entry.size, entry.mtime) != (real_path, st.st_size, st.st_mtime_ns):
+                    entry = StaticFile(real_path, st.st_size, st.st_mtime_ns, content_type)
+                files[rel] = entry
+
+        self.files = files
+        for rel in list(self._cache):
+            if self._cache[rel][0] is not files.get(rel):
+                self._evict(rel)
+        self._scanned_at = time.monotonic()
+
+    @staticmethod
+    def _contains(root, path):
+        return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+    def normalize(self, rel):
+        """Index key for a path relative to the root, or None if it escapes
+        the root. Collapses '.', '..' and repeated slashes the way
+        Path.resolve() does, without touching the filesystem."""
+        path = posixpath.normpath(posixpath.join(self._root, rel))
+        if not path.startswith(self._prefix):
+            return None
+        return path[len(self._prefix):]
+
+    def lookup(self, rel):
+        """(key, StaticFile) for a path relative to the root, or None."""
+        if self.rescan_interval and time.monotonic() - self._scanned_at >= self.rescan_interval:
+            self.rescan()
+        key = self.normalize(rel)
+        entry = self.files.get(key) if key is not None else None
+        return (key, entry) if entry is not None else None
+
+    def read(self, rel):
+        """(content, content_type) for a path relative to the root, or None.
+
+        Raises OSError if an indexed file can no longer be read.
+        """
+        found = self.lookup(rel)
+        if found is None:
+            return None
+        key, entry = found
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] is entry:
+            self._cache.move_to_end(key)
+            return cached[1], entry.content_type
+
+        content = self._load(entry)
+        self._evict(key)
+        self._cache[key] = (entry, content)
+        if not isinstance(content, memoryview):
+            self._cached_bytes += len(content)
+            while self._cached_bytes > self.cache_size and len(self._cache) > 1:
+                self._evict(next(iter(self._cache)))
+        return content, entry.content_type
+
+    def _load(self, entry):
+        with open(entry.path, 'rb') as f:
+            if entry.size >= self.mmap_threshold:
+                try:
+                    return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                except (ValueError, OSError) as e:
+                    logging.debug(f"mmap failed for {entry.path}: {e}")
+            return f.read()
+
+    def _evict(self, key):
+        cached = self._cache.pop(key, None)
+        if cached is not None and not isinstance(cached[1], memoryview):
+            self._cached_bytes -= len(cached[1])
@@ -0,0 +1,81 @@
+"""
+Compiled-template cache for HTTP skins, so a request renders an already
+compiled Jinja template instead of reading and compiling its source.
+
+- `file:` templates go through the environment's loader (env.get_template):
+  Jinja keeps them compiled and, with auto_reload, recompiles a template when
+  its mtime changes. With a bytecode cache on the environment, the compiled
+  code also survives restarts.
+- Binary `file:` assets are kept as bytes, re-read when their mtime changes.
+- Inline strings (reasons, header values) are compiled once per distinct
+  source, in a bounded LRU.
+"""
+
+from collections import OrderedDict
+import os
+import time
+
+
+class TemplateCache:
+    def __init__(self, env, template_folder, max_strings=1024, check_interval=1.0):
+        self.env = env
+        self.template_folder = template_folder
+        self.max_strings = max_strings
+        # Binary assets are stat'ed at most this often (seconds).
+        self.check_interval = check_interval
+        self._root = template_folder.resolve()
+        self._paths = {}
+        self._strings = OrderedDict()
+        self._bytes = {}
+
+    def path(self, name):
+        """Resolved path of a template; ValueError if it escapes the folder.
+
+        Symlinks and '..' are resolved once per name and the result cached.
+        """
+        path = self._paths.get(name)
+        if path is None:
+            path = (self.template_folder / name).resolve()
+            path.relative_to(self._root)
+            self._paths[name] = path
+        return path
+
+    def resolve(self, name):
+        """Like path(), plus FileNotFoundError if it isn't a file."""
+        path = self.path(name)
+        if not path.is_file():
+            raise FileNotFoundError(path)
+        return path
+
+    def get_file(self, name):
+        """Compiled template for a file under the template folder (raises
+        jinja2.TemplateNotFound if it doesn't exist)."""
+        path = self.path(name)
+        return self.env.get_template(path.relative_to(self._root).as_posix())
+
+    def get_bytes(self, name):
+        """Raw bytes of a (binary) file under the template folder."""
+        now = time.monotonic()
+        entry = self._bytes.get(name)
+        if entry is not None and now - entry[0] < self.check_interval:
+            return entry[2]
+        path = self.resolve(name)
+        mtime = os.stat(path).st_mtime_ns
+        if entry is None or entry[1] != mtime:
+            entry = (now, mtime, path.read_bytes())
+        else:
+            entry = (now, mtime, entry[2])
+        self._bytes[name] = entry
+        return entry[2]
+
+    def get_string(self, source):
+        """Compiled template for an inline source string."""
+        template = self._strings.get(source)
+        if template is not None:
+            self._strings.move_to_end(source)
+            return template
+        template = self.env.from_string(source)
+        self._strings[source] = template
+        if len(self._strings) > self.max_strings:
+            self._strings.popitem(last=False)
+        return template
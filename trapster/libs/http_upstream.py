@@ -0,0 +1,337 @@
+"""
+Record-and-replay proxy for HTTP skins (`upstream:` in a skin's config).
+
+A request matching no endpoint and no static file is forwarded once to the
+configured origin; the response (status, headers, body) is recorded on disk,
+keyed by method, path and normalized query, and every later request for the
+same key is replayed from the recording. Concurrent misses on one key share
+a single upstream request, and every worker process (and restart) reuses
+what the others recorded. Client errors (4xx) are not recorded: scanners
+probe endless paths that don't exist, so those answers are only kept in a
+small in-memory LRU and never use up `max_entries`. Server errors (5xx) are
+not kept at all: they are served to the request that got them only.
+
+Only the path and query are forwarded, with a few content-negotiation
+headers (and the body, for the methods that have one, unless it was cut at
+the service's `max_body_size`): never the client's cookies or credentials,
+and never to another host than the configured one. The recordings can be turned into a regular
+skin with `trapster skin export` (see export_skin()).
+
+On disk, a recording is `<key>.body` (the raw body) and `<key>.json` (the
+request and response metadata), the latter written last: a recording
+without its .json is incomplete and ignored.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+import httpx
+import yaml
+
+from trapster.libs.http_routes import is_literal
+
+# Headers describing the connection rather than the resource, or recomputed
+# when the response is served again.
+_DROPPED_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+    'transfer-encoding', 'upgrade', 'content-length', 'content-encoding', 'date', 'alt-svc',
+})
+
+# Request headers passed on to the origin, so it answers in the same format
+# and language as it would to the client.
+_FORWARDED_HEADERS = ('user-agent', 'accept', 'accept-language', 'content-type')
+
+_BODY_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+
+def normalize_query(query_string):
+    """Query string with its parameters sorted and uniformly encoded, so
+    `?b=2&a=1` and `?a=1&b=%32` share a recording."""
+    params = parse_qsl(query_string or '', keep_blank_values=True)
+    return urlencode(sorted(params), quote_via=quote)
+
+
+def cache_key(method, path, query):
+    return hashlib.sha256(f"{method} {path}?{query}".encode('utf-8', 'surrogateescape')).hexdigest()[:32]
+
+
+class Recording:
+    """One recorded upstream exchange."""
+    __slots__ = ('method', 'path', 'query', 'status_code', 'headers', 'body')
+
+    def __init__(self, method, path, query, status_code, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.status_code = status_code
+        self.headers = headers  # [[name, value], ...], in the origin's order
+        self.body = body
+
+    @property
+    def key(self):
+        return cache_key(self.method, self.path, self.query)
+
+    def header_dict(self):
+        """Headers as a skin's headers mapping. Repeated headers are joined
+        with ', ', except Set-Cookie, of which only the first is kept (a
+        mapping can't hold several)."""
+        headers = {}
+        for name, value in self.headers:
+            previous = next((k for k in headers if k.lower() == name.lower()), None)
+            if previous is None:
+                headers[name] = value
+            elif name.lower() != 'set-cookie':
+                headers[previous] = f"{headers[previous]}, {value}"
+        return headers
+
+    def metadata(self):
+        return {'method': self.method, 'path': self.path, 'query': self.query,
+                'status_code': self.status_code, 'headers': self.headers}
+
+
+def load_recording(cache_dir, key):
+    try:
+        metadata = json.loads((cache_dir / f"{key}.json").read_text())
+        body = (cache_dir / f"{key}.body").read_bytes()
+    except (OSError, ValueError):
+        return None
+    return Recording(body=body, **metadata)
+
+
+def load_recordings(cache_dir):
+    """Every recording stored in cache_dir, in path order."""
+    cache_dir = Path(cache_dir)
+    found = (load_recording(cache_dir, path.stem) for path in cache_dir.glob('*.json'))
+    return sorted((r for r in found if r is not None), key=lambda r: (r.path, r.query, r.method))
+
+
+class UpstreamCache:
+    """The origin of a skin in upstream mode, and the recordings of its
+    responses (see module docstring).
+
+    Options (the skin's `upstream:` block): `url` (the origin, required),
+    `methods` (forwarded methods, GET and HEAD by default), `timeout` (10s),
+    `max_size` (larger responses are not recorded, 10 MiB),
+    `max_entries` (recordings kept, 10000: past it, misses are not
+    forwarded anymore, so a scanner can't fill the disk) and `max_errors`
+    (4xx responses kept in memory, 1000, least recently used evicted).
+    """
+
+    def __init__(self, url, cache_dir, methods=('GET', 'HEAD'), timeout=10.0,
+                 max_size=10 * 1024 * 1024, max_entries=10000, max_errors=1000):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError(f"Invalid upstream url: {url!r}")
+        self.url = url.rstrip('/')
+        self.prefix = parts.path.rstrip('/')
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.cache_dir = Path(cache_dir)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.timeout = float(timeout)
+        self.max_size = int(max_size)
+        self.max_entries = int(max_entries)
+        self.max_errors = int(max_errors)
+        self.errors = OrderedDict()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = sum(1 for _ in self.cache_dir.glob('*.json'))
+        self._inflight = {}
+        self._client = None
+
+    @classmethod
+    def from_config(cls, options, cache_dir):
+        """UpstreamCache for a skin's `upstream` option: a url, or a dict of
+        options whose `cache` overrides `cache_dir`."""
+        if not options:
+            return None
+        if isinstance(options, str):
+            options = {'url': options}
+        options = dict(options)
+        cache_dir = options.pop('cache', None) or cache_dir
+        return cls(cache_dir=cache_dir, **options)
+
+    @property
+    def options(self):
+        return (self.url, str(self.cache_dir), self.methods, self.timeout, self.max_size, self.max_entries,
+                self.max_errors)
+
+    def load(self, key):
+        """The recording stored under this key, or None."""
+        return load_recording(self.cache_dir, key)
+
+    def save(self, recording):
+        key = recording.key
+        for suffix, data in (('.body', recording.body),
+                             ('.json', json.dumps(recording.metadata(), indent=1).encode())):
+            path = self.cache_dir / f"{key}{suffix}"
+            tmp = path.with_name(f".{path.name}.{os.getpid()}")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        self._entries += 1
+
+    @staticmethod
+    def key(method, path, query):
+        """Recording key of a request (its query normalized)."""
+        return cache_key(method, path, normalize_query(query))
+
+    async def get(self, method, path, query, headers, body=b''):
+        """(recording, recorded) for this request: the stored recording, else
+        one fetched from the origin now (once, even for concurrent callers),
+        with `recorded` true. The recording is None if the method isn't
+        forwarded, the origin can't be reached, or the response can't be
+        recorded."""
+        if method not in self.methods:
+            return None, False
+        query = normalize_query(query)
+        key = cache_key(method, path, query)
+        recording = self.errors.get(key)
+        if recording is not None:
+            self.errors.move_to_end(key)
+            return recording, False
+        recording = await asyncio.to_thread(self.load, key)
+        if recording is not None or self._entries >= self.max_entries:
+            return recording, False
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._record(method, path, query, headers, body))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        recording = await asyncio.shield(task)
+        return recording, recording is not None
+
+    async def _record(self, method, path, query, headers, body):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=False)
+        url = f"{self.url}{path}" + (f"?{query}" if query else '')
+        forwarded = {name: headers[name] for name in _FORWARDED_HEADERS if name in headers}
+        forwarded['accept-encoding'] = 'identity'
+        try:
+            request = self._client.build_request(
+                method, url, headers=forwarded, content=body if method in _BODY_METHODS and body else None)
+            response = await self._client.send(request, stream=True)
+            try:
+                content = bytearray()
+                async for chunk in response.aiter_bytes():
+                    content += chunk
+                    if len(content) > self.max_size:
+                        logging.warning(f"Upstream response for {method} {path} over {self.max_size} bytes, "
+                                        f"not recorded")
+                        return None
+            finally:
+                await response.aclose()
+        except httpx.HTTPError as e:
+            logging.warning(f"Upstream request {method} {url} failed: {e}")
+            return None
+
+        recorded_headers = [[name, self._local(name, value)] for name, value in response.headers.items()
+                            if name.lower() not in _DROPPED_HEADERS]
+        recording = Recording(method, path, query, response.status_code, recorded_headers, bytes(content))
+        if recording.status_code >= 500:
+            # Likely transient (a 502 during a redeploy): served this once,
+            # and asked again next time rather than replayed forever.
+            logging.warning(f"Upstream answered {recording.status_code} to {method} {path}, not recorded")
+            return recording
+        if recording.status_code >= 400:
+            self.errors[recording.key] = recording
+            while len(self.errors) > self.max_errors:
+                self.errors.popitem(last=False)
+            return recording
+        await asyncio.to_thread(self.save, recording)
+        return recording
+
+    def _local(self, name, value):
+        """Redirects to the origin itself are made relative, so they stay on
+        the honeypot."""
+        if name.lower() in ('location', 'content-location') and value.startswith(self.origin):
+            rest = value[len(self.origin):]
+            if not rest or rest[0] in '/?#':
+                if self.prefix and rest.startswith(self.prefix):
+                    rest = rest[len(self.prefix):]
+                return rest or '/'
+        return value
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _template_name(recording, used, binary=False):
+    """A file name for a recording's body, derived from its path and type."""
+    content_type = next((v for k, v in recording.headers if k.lower() == 'content-type'), '')
+    stem = re.sub(r'[^A-Za-z0-9._-]+', '_', recording.path.strip('/')).strip('._') or 'index'
+    suffix = Path(stem).suffix
+    if binary:
+        stem, suffix = f"{Path(stem).stem}.bin", '.bin'
+    elif not suffix:
+        suffix = mimetypes.guess_extension(content_type.split(';')[0].strip()) or '.bin'
+        stem += suffix
+    if recording.method != 'GET' or recording.query:
+        stem = f"{Path(stem).stem}_{recording.method.lower()}_{recording.key[:8]}{suffix}"
+    name, n = stem, 1
+    while name in used:
+        n += 1
+        name = f"{Path(stem).stem}_{n}{suffix}"
+    used.add(name)
+    return name
+
+
+def _escape_jinja(text):
+    """Template source rendering to exactly `text`."""
+    return '{% raw %}' + text.replace('{% endraw %}', "{% endraw %}{{ '{% endraw %}' }}{% raw %}") + '{% endraw %}'
+
+
+def export_skin(cache_dir, skin_dir, name=None, jinja_suffixes=()):
+    """Write the recordings in `cache_dir` as a regular skin in `skin_dir`:
+    one endpoint per recorded request (its query as exact-match `query`
+    rules), serving the recorded status, headers and body from templates/.
+    Bodies of files rendered by Jinja (`jinja_suffixes`) are wrapped in
+    raw blocks, so they are served unchanged. Returns the number of
+    endpoints written."""
+    skin_dir = Path(skin_dir)
+    templates = skin_dir / 'templates'
+    templates.mkdir(parents=True, exist_ok=True)
+    (skin_dir / 'files').mkdir(exist_ok=True)
+
+    recordings = load_recordings(cache_dir)
+    endpoints = {}
+    used = set()
+    for recording in recordings:
+        filename = _template_name(recording, used)
+        body = recording.body
+        if Path(filename).suffix.lower() in jinja_suffixes:
+            try:
+                body = _escape_jinja(body.decode('utf-8')).encode('utf-8')
+            except UnicodeDecodeError:
+                # Not text: served as raw bytes instead.
+                used.discard(filename)
+                filename = _template_name(recording, used, binary=True)
+        (templates / filename).write_bytes(body)
+
+        variant = {'method': recording.method}
+        if recording.query:
+            variant['query'] = {key: re.escape(value) for key, value in parse_qsl(recording.query,
+                                                                                   keep_blank_values=True)}
+        variant['status_code'] = recording.status_code
+        variant['file'] = filename
+        headers = recording.header_dict()
+        if headers:
+            variant['headers'] = headers
+        pattern = recording.path if is_literal(recording.path) else re.escape(recording.path)
+        endpoints.setdefault(pattern, []).append(variant)
+
+    config = {
+        'name': name or skin_dir.name,
+        'description': f"Recorded from {cache_dir}",
+        'endpoints': [{pattern: variants} for pattern, variants in endpoints.items()],
+        'default': {'status_code': 404, 'content': ''},
+    }
+    with (skin_dir / 'config.yaml').open('w') as file:
+        yaml.safe_dump(config, file, sort_keys=False, allow_unicode=True)
+    return len(recordings)
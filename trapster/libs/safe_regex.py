@@ -0,0 +1,438 @@
+"""
+ReDoS-safe compilation of skin regexes (route patterns and query rules).
+
+Skin regexes are matched against attacker-controlled paths and query values
+on the event loop, and Python's backtracking `re` can take exponential (or
+high polynomial) time on an ambiguous pattern: `/(a+)+x` against
+`/aaaaaaaaaaaaaaaaaaaaaaaaaaaaa!` never returns. So every pattern is
+checked when the skin is loaded:
+
+- Its ambiguity is measured on its position automaton (one state per
+  character position, one edge per way the regex can go from a position to
+  the next): a pattern that can match some input along exponentially many
+  paths (nested or overlapping quantifiers such as `(a+)+`, `(a|a)*` or
+  `(\\w+\\s?)*`) is rejected with UnsafePattern. One matching along
+  polynomially many (`(.*)/(.*)`: as many paths as there are slashes) has
+  the degree of that polynomial; most patterns have degree 0.
+- It is matched with RE2 (the `google-re2` package), which runs in linear
+  time, when that is installed and supports the pattern (RE2 has no
+  lookarounds or backreferences). Otherwise with `re`, and a pattern of
+  degree d >= 1 is only tried on inputs short enough for its worst case
+  (about n ** (d + 1) steps) to stay within STEP_BUDGET; longer inputs
+  don't match it.
+"""
+
+import logging
+import math
+import re
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+_c = sre_constants
+_REPEATS = {_c.MAX_REPEAT, _c.MIN_REPEAT, getattr(_c, 'POSSESSIVE_REPEAT', None)} - {None}
+_LOOKAROUNDS = {_c.ASSERT, _c.ASSERT_NOT}
+# Constructs RE2 doesn't support.
+_NOT_RE2 = _LOOKAROUNDS | {_c.GROUPREF, _c.GROUPREF_EXISTS, getattr(_c, 'ATOMIC_GROUP', None),
+                           getattr(_c, 'POSSESSIVE_REPEAT', None)} - {None}
+
+# Worst-case matching steps allowed for a polynomial pattern under `re`
+# (roughly a tenth of a second).
+STEP_BUDGET = 4_000_000
+
+# Bounded repeats up to this count are expanded, larger ones are analyzed as
+# unbounded (which can only over-estimate the ambiguity).
+_MAX_EXPANDED_REPEAT = 10
+# Patterns with more positions than this are not analyzed (and rejected).
+_MAX_POSITIONS = 2000
+
+# Characters representing the alphabet: every character class is reduced to
+# the set of these it contains. All of Latin-1, plus non-ASCII digits,
+# letters, spaces and line breaks, which `re` classes treat specially.
+_SAMPLES = [chr(i) for i in range(256)] + ['٠', 'ā', '中', ' ', '　', '￿']
+
+_CATEGORIES = {
+    name: re.compile(regex) for name, regex in (
+        ('CATEGORY_DIGIT', r'\d'), ('CATEGORY_NOT_DIGIT', r'\D'), ('CATEGORY_SPACE', r'\s'),
+        ('CATEGORY_NOT_SPACE', r'\S'), ('CATEGORY_WORD', r'\w'), ('CATEGORY_NOT_WORD', r'\W'),
+        ('CATEGORY_LINEBREAK', r'\n'), ('CATEGORY_NOT_LINEBREAK', r'[^\n]'),
+    )
+}
+_ALL = (1 << len(_SAMPLES)) - 1
+
+
+class UnsafePattern(re.error):
+    """A regex that can take exponential time to match."""
+
+
+def _mask(predicate):
+    mask = 0
+    for i, char in enumerate(_SAMPLES):
+        if predicate(char):
+            mask |= 1 << i
+    return mask
+
+
+def _class_mask(op, av, flags):
+    """Sample characters matched by one character-matching node."""
+    fold = bool(flags & re.IGNORECASE)
+
+    def variants(char):
+        return {char, char.lower(), char.upper()} if fold else {char}
+
+    if op is _c.LITERAL:
+        return _mask(lambda ch: chr(av) in variants(ch))
+    if op is _c.NOT_LITERAL:
+        return _mask(lambda ch: chr(av) not in variants(ch))
+    if op is _c.ANY:
+        return _ALL if flags & re.DOTALL else _mask(lambda ch: ch != '\n')
+    if op is _c.IN:
+        negate = False
+        tests = []
+        for item_op, item_av in av:
+            if item_op is _c.NEGATE:
+                negate = True
+            elif item_op is _c.LITERAL:
+                tests.append(lambda ch, c=chr(item_av): c in variants(ch))
+            elif item_op is _c.RANGE:
+                tests.append(lambda ch, lo=item_av[0], hi=item_av[1]:
+                             any(lo <= ord(v) <= hi for v in variants(ch)))
+            elif item_op is _c.CATEGORY and str(item_av) in _CATEGORIES:
+                tests.append(lambda ch, r=_CATEGORIES[str(item_av)]: r.fullmatch(ch) is not None)
+            else:
+                return _ALL
+        return _mask(lambda ch: any(test(ch) for test in tests) != negate)
+    return _ALL
+
+
+class _Automaton:
+    """Position automaton of a parsed regex, keeping one edge per way of
+    reaching a position (so `(a+)+` has two a -> a edges, where a plain
+    Glushkov automaton would merge them).
+
+    A fragment's nullability is the number of ways it matches the empty
+    string (capped at 2), not a flag: sre_parse factors the common prefix out
+    of alternatives, turning `(a|a)*` into `(a(?:|))*`, and the two empty
+    alternatives left are two ways through, i.e. parallel edges."""
+
+    def __init__(self, parsed, flags):
+        self.masks = [0]      # position -> sample mask; 0 is the start
+        self.edges = []       # [(source, target), ...], parallel edges kept
+        self.lookarounds = []
+        nullable, first, last = self._sequence(list(parsed), flags)
+        self.edges.extend((0, position) for position in first)
+
+    def _position(self, mask):
+        if len(self.masks) > _MAX_POSITIONS:
+            raise UnsafePattern("pattern too large to analyze")
+        self.masks.append(mask)
+        return len(self.masks) - 1
+
+    def _link(self, sources, targets):
+        self.edges.extend((s, t) for s in sources for t in targets)
+
+    def _sequence(self, items, flags):
+        return self._chain(((op, av, None) for op, av in items), flags)
+
+    def _chain(self, fragments, flags):
+        """Concatenate fragments: (op, av, None) nodes or (None, n, (f, l))
+        already built ones."""
+        nullable, first, last = 1, [], []
+        for op, av, built in fragments:
+            n, f, l = self._node(op, av, flags) if built is None else (av, *built)
+            self._link(last, f)
+            first = first + f * nullable
+            last = l + last * n
+            nullable = min(2, nullable * n)
+        return nullable, first, last
+
+    def _repeat(self, body, low, high, flags):
+        """Fragment for body{low,high} (high None: unbounded)."""
+        parts = [(False, body)] * min(low, _MAX_EXPANDED_REPEAT)
+        if high is None:
+            parts.append((True, body))
+        else:
+            parts += [(None, body)] * (high - low)
+        def fragments():
+            for kind, items in parts:
+                n, f, l = self._sequence(items, flags)
+                if kind is True:
+                    self._link(l, f)       # the loop back
+                    n = 1
+                elif kind is None:
+                    n = min(2, 1 + n)      # optional copy: skipped, or matched empty
+                yield None, n, (f, l)
+        return self._chain(fragments(), flags)
+
+    def _node(self, op, av, flags):
+        if op in (_c.LITERAL, _c.NOT_LITERAL, _c.ANY, _c.IN):
+            position = self._position(_class_mask(op, av, flags))
+            return 0, [position], [position]
+        if op is _c.BRANCH:
+            nullable, first, last = 0, [], []
+            for items in av[1]:
+                n, f, l = self._sequence(list(items), flags)
+                nullable, first, last = min(2, nullable + n), first + f, last + l
+            return nullable, first, last
+        if op is _c.SUBPATTERN:
+            group, add_flags, del_flags, items = av
+            return self._sequence(list(items), (flags | add_flags) & ~del_flags)
+        if op in _REPEATS:
+            low, high, items = av
+            if high == _c.MAXREPEAT or high > _MAX_EXPANDED_REPEAT:
+                high = None
+            return self._repeat(list(items), low, high, flags)
+        if op in _LOOKAROUNDS:
+            self.lookarounds.append(av[1])
+            return 1, [], []
+        if op is _c.GROUPREF_EXISTS:
+            group, yes, no = av
+            n1, f1, l1 = self._sequence(list(yes), flags)
+            n2, f2, l2 = self._sequence(list(no or []), flags)
+            return min(2, n1 + n2), f1 + f2, l1 + l2
+        if op is _c.GROUPREF:
+            # A backreference can repeat anything: analyzed as `.*`.
+            return self._repeat([(_c.ANY, None)], 0, None, flags | re.DOTALL)
+        if op is getattr(_c, 'ATOMIC_GROUP', None):
+            return self._sequence(list(av), flags)
+        # Anchors and other zero-width assertions.
+        return 1, [], []
+
+    def degree(self):
+        """math.inf if some input matches along exponentially many paths,
+        else the degree of the polynomial bounding the number of paths."""
+        # States are the edges (so parallel edges are told apart); an edge's
+        # label is the character class of its target position.
+        count = len(self.edges)
+        labels = [self.masks[target] for _, target in self.edges]
+        by_source = {}
+        for index, (source, _) in enumerate(self.edges):
+            by_source.setdefault(source, []).append(index)
+        successors = [by_source.get(target, []) for _, target in self.edges]
+        initial = by_source.get(0, [])
+
+        if self._exponential(initial, successors, labels):
+            return math.inf
+        return self._polynomial_degree(count, successors, labels)
+
+    @staticmethod
+    def _exponential(initial, successors, labels):
+        """True if two different paths leave a state and come back to it on
+        the same input: in the product automaton, a strongly connected
+        component holding both a pair (e, e) and a pair (e, f), e != f."""
+        def pairs(node):
+            a, b = node
+            for x in successors[a]:
+                for y in successors[b]:
+                    if labels[x] & labels[y]:
+                        yield x, y
+
+        starts = [(a, b) for a in initial for b in initial if labels[a] & labels[b]]
+        for component in _components(starts, pairs):
+            if len(component) > 1 and any(a == b for a, b in component) and any(a != b for a, b in component):
+                return True
+        return False
+
+    @staticmethod
+    def _polynomial_degree(count, successors, labels):
+        """Longest chain p1 -> p2 -> ... of distinct looping states where,
+        for some input v, each p loops on v, and v also leads from each one
+        to the next (the number of paths then grows as n ** (chain - 1))."""
+        loops = [i for i in range(count) if _reaches(i, i, successors)]
+        reach = {p: _reachable(p, successors) for p in loops}
+        pairs = {}
+        for p in loops:
+            for q in loops:
+                if p != q and q in reach[p] and p not in reach[q] and _same_word(p, q, successors, labels):
+                    pairs.setdefault(p, []).append(q)
+
+        longest = {}
+
+        def chain(p):
+            if p not in longest:
+                longest[p] = max((1 + chain(q) for q in pairs.get(p, ())), default=0)
+            return longest[p]
+
+        return max((chain(p) for p in loops), default=0)
+
+
+def _components(starts, neighbours):
+    """Strongly connected components of the graph reachable from `starts`
+    (iterative Tarjan)."""
+    index, lowlink, on_stack, stack, components = {}, {}, set(), [], []
+    counter = 0
+    for start in starts:
+        if start in index:
+            continue
+        work = [(start, iter(neighbours(start)))]
+        index[start] = lowlink[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(neighbours(child))))
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def _reachable(start, successors):
+    seen, todo = set(), list(successors[start])
+    while todo:
+        node = todo.pop()
+        if node not in seen:
+            seen.add(node)
+            todo.extend(successors[node])
+    return seen
+
+
+def _reaches(source, target, successors):
+    return target in _reachable(source, successors)
+
+
+def _same_word(p, q, successors, labels):
+    """True if some input v leads p -> p, p -> q and q -> q at once: a path
+    from (p, p, q) to (p, q, q) in the triple product automaton."""
+    start, goal = (p, p, q), (p, q, q)
+    seen, todo = set(), [start]
+    while todo:
+        a, b, c = todo.pop()
+        for x in successors[a]:
+            for y in successors[b]:
+                common = labels[x] & labels[y]
+                if not common:
+                    continue
+                for z in successors[c]:
+                    if common & labels[z]:
+                        node = (x, y, z)
+                        if node == goal:
+                            return True
+                        if node not in seen:
+                            seen.add(node)
+                            todo.append(node)
+    return False
+
+
+def _parse(pattern, flags=0):
+    parsed = sre_parse.parse(pattern, flags)
+    return parsed, parsed.state.flags
+
+
+def ambiguity(pattern, flags=0):
+    """The pattern's ambiguity degree (see module docstring): 0 for most
+    patterns, math.inf for those backtracking exponentially, including
+    in a lookaround."""
+    parsed, flags = _parse(pattern, flags)
+    automaton = _Automaton(parsed, flags)
+    degree = automaton.degree()
+    for items in automaton.lookarounds:
+        degree = max(degree, _Automaton(items, flags).degree())
+    return degree
+
+
+def _uses(items, ops):
+    for op, av in items:
+        if op in ops:
+            return True
+        for value in (av if isinstance(av, (tuple, list)) else (av,)):
+            if isinstance(value, sre_parse.SubPattern) and _uses(value, ops):
+                return True
+            if isinstance(value, list) and value and all(isinstance(v, sre_parse.SubPattern) for v in value):
+                if any(_uses(v, ops) for v in value):
+                    return True
+    return False
+
+
+class SafeRegex:
+    """A compiled skin regex: `fullmatch` like a `re.Pattern`, through RE2
+    when possible, else through `re` with an input length cap for
+    polynomial patterns."""
+    __slots__ = ('pattern', 'regex', 'engine', 'degree', 'max_length')
+
+    def __init__(self, pattern, regex, engine, degree, max_length=None):
+        self.pattern = pattern
+        self.regex = regex
+        self.engine = engine
+        self.degree = degree
+        self.max_length = max_length
+
+    def fullmatch(self, string):
+        if self.max_length is not None and len(string) > self.max_length:
+            return None
+        return self.regex.fullmatch(string)
+
+
+def re2_compatible(pattern):
+    """True if RE2 is installed and supports this pattern."""
+    if re2 is None:
+        return False
+    try:
+        parsed, _ = _parse(pattern)
+    except re.error:
+        return False
+    return not _uses(parsed, _NOT_RE2)
+
+
+def compile_safe(pattern, step_budget=STEP_BUDGET):
+    """SafeRegex for a skin pattern. Raises re.error if it's invalid, and
+    UnsafePattern if it backtracks exponentially."""
+    regex = re.compile(pattern)
+    degree = ambiguity(pattern)
+    if degree == math.inf:
+        raise UnsafePattern("nested or overlapping quantifiers, matching can take exponential time")
+    if re2_compatible(pattern):
+        try:
+            return SafeRegex(pattern, re2.compile(pattern), 're2', degree)
+        except re2.error:
+            pass
+    max_length = None
+    if degree:
+        max_length = int(step_budget ** (1 / (degree + 1)))
+        logging.warning(f"Regex {pattern!r} backtracks polynomially (degree {degree}): only matched against "
+                        f"inputs up to {max_length} characters (install google-re2 to lift this)")
+    return SafeRegex(pattern, regex, 're', degree, max_length)
+
+
+def compile_alternation(pattern, regexes):
+    """Compile the alternation of already-checked SafeRegexes: with RE2 if
+    they all use it, else with `re` if none needs a length cap, else None."""
+    engines = {regex.engine for regex in regexes}
+    if engines == {'re2'}:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            return None
+    if any(regex.max_length is not None for regex in regexes):
+        return None
+    return re.compile(pattern)
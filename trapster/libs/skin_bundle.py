@@ -0,0 +1,209 @@
+"""
+Precompiled skin bundles (`trapster skin compile`).
+
+A bundle is a single file holding everything an HTTP skin needs at runtime:
+
+    b"TRAPSKIN" | version (u32) | header length (u64) | JSON header | blob
+
+The JSON header carries the skin name, the deploy_seed it was compiled with,
+the config.yaml with its deploy-time Jinja already resolved (kept as YAML so
+its types survive), and an index of the blob: template sources, their
+compiled Jinja bytecode, and static files, each as (offset, size). The blob
+is mmap'd, so static files are served straight from the page cache, and
+every process loading the same bundle shares those pages.
+
+Bytecode is only used by the Python version that compiled it; any other
+compiles the stored sources on first use instead.
+
+Within a process, load_bundle() returns one SkinBundle per file, and the
+state compiled from it (Jinja environment, routes, static index) is built
+once and shared read-only by every HTTP/HTTPS instance using it.
+"""
+
+from collections import OrderedDict
+import json
+import mmap
+import os
+from pathlib import PurePosixPath
+import posixpath
+import struct
+import threading
+
+from jinja2 import BaseLoader, BytecodeCache, TemplateNotFound
+import yaml
+
+from trapster.libs.http_static import StaticFile, StaticIndex
+from trapster.libs.http_templates import TemplateCache
+
+MAGIC = b"TRAPSKIN"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sIQ")
+
+
+def write_bundle(path, header, blobs):
+    """Write a bundle. `header` is JSON-serialisable; `blobs` maps a section
+    name ('templates', 'bytecode', 'files') to {key: bytes}, indexed in the
+    header as {key: [offset, size]} (plus any extra fields already present
+    there, e.g. a file's content type). Returns the header as written."""
+    data = bytearray()
+    header = dict(header)
+    for section, items in blobs.items():
+        index = header.setdefault(section, {})
+        for key, content in items.items():
+            index[key] = [len(data), len(content)] + list(index.get(key, [])[2:])
+            data += content
+    encoded = json.dumps(header).encode()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        f.write(data)
+    os.replace(tmp, path)
+    return header
+
+
+class SkinBundle:
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = _PREAMBLE.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} skin bundle")
+        start = _PREAMBLE.size
+        header = json.loads(self._mmap[start:start + length])
+        self._data = memoryview(self._mmap)[start + length:]
+
+        self.skin = header["skin"]
+        self.deploy_seed = header["deploy_seed"]
+        self.config = yaml.safe_load(header["config"])
+        self.static_root = header["static_root"]
+        self.templates = header.get("templates", {})
+        self.bytecode = header.get("bytecode", {})
+        self.files = header.get("files", {})
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def view(self, entry):
+        """Zero-copy view of an (offset, size, ...) blob entry."""
+        offset, size = entry[0], entry[1]
+        return self._data[offset:offset + size]
+
+    def template_bytes(self, name):
+        entry = self.templates.get(name)
+        if entry is None:
+            raise FileNotFoundError(name)
+        return self.view(entry)
+
+    def shared(self, key, factory):
+        """State compiled from the bundle, built once and shared by every user."""
+        with self._lock:
+            if key not in self._shared:
+                self._shared[key] = factory()
+            return self._shared[key]
+
+
+class BundleLoader(BaseLoader):
+    """Jinja loader over a {name: source bytes} mapping (or a bundle)."""
+
+    def __init__(self, get_bytes):
+        self.get_bytes = get_bytes
+
+    def get_source(self, environment, template):
+        try:
+            source = bytes(self.get_bytes(template)).decode("utf-8")
+        except (FileNotFoundError, KeyError):
+            raise TemplateNotFound(template)
+        return source, template, lambda: True
+
+
+class BundleBytecodeCache(BytecodeCache):
+    """Serves the compiled bytecode stored in a bundle. When compiling, it
+    records what Jinja dumps instead, in `recorded`."""
+
+    def __init__(self, bundle=None):
+        self.bundle = bundle
+        self.recorded = {}
+
+    def load_bytecode(self, bucket):
+        if self.bundle is not None and bucket.key in self.bundle.bytecode:
+            bucket.bytecode_from_string(bytes(self.bundle.view(self.bundle.bytecode[bucket.key])))
+
+    def dump_bytecode(self, bucket):
+        if self.bundle is None:
+            self.recorded[bucket.key] = bucket.bytecode_to_string()
+
+
+def normalize_name(name):
+    """A template name as stored in a bundle; ValueError if it escapes the
+    templates folder."""
+    path = posixpath.normpath(str(name).replace("\\", "/"))
+    if posixpath.isabs(path) or path == ".." or path.startswith("../"):
+        raise ValueError(f"Template path escapes the skin: {name}")
+    return path
+
+
+class BundleTemplateCache(TemplateCache):
+    """TemplateCache over the templates stored in a bundle."""
+
+    def __init__(self, env, bundle, max_strings=1024):
+        self.env = env
+        self.bundle = bundle
+        self.max_strings = max_strings
+        self._strings = OrderedDict()
+
+    def path(self, name):
+        return PurePosixPath(normalize_name(name))
+
+    def resolve(self, name):
+        path = self.path(name)
+        if str(path) not in self.bundle.templates:
+            raise FileNotFoundError(name)
+        return path
+
+    def get_file(self, name):
+        return self.env.get_template(str(self.path(name)))
+
+    def get_bytes(self, name):
+        return bytes(self.bundle.template_bytes(str(self.path(name))))
+
+
+class BundleStaticIndex(StaticIndex):
+    """StaticIndex over the files stored in a bundle: content is served as a
+    view of the bundle's mapping, so there is nothing to cache or rescan.
+    Paths are normalized against the root the bundle was compiled from, so
+    lookups behave exactly as they did on that tree."""
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.rescan_interval = None
+        self._root = bundle.static_root
+        self._prefix = self._root.rstrip('/') + '/'
+        self.files = {rel: StaticFile(None, entry[1], 0, entry[2])
+                      for rel, entry in bundle.files.items()}
+
+    def rescan(self):
+        pass
+
+    def read(self, rel):
+        found = self.lookup(rel)
+        if found is None:
+            return None
+        key, entry = found
+        return self.bundle.view(self.bundle.files[key]), entry.content_type
+
+
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+
+def load_bundle(path):
+    """The process-wide SkinBundle for this file (reloaded if it changed)."""
+    real = os.path.realpath(path)
+    st = os.stat(real)
+    key = (real, st.st_mtime_ns, st.st_size)
+    with _bundles_lock:
+        bundle = _bundles.get(real)
+        if bundle is None or bundle[0] != key:
+            bundle = _bundles[real] = (key, SkinBundle(real))
+        return bundle[1]
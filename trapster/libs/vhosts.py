@@ -0,0 +1,55 @@
+"""
+Host name lookup for name-based virtual hosts (HTTP Host header, TLS SNI).
+
+Patterns are either exact names ('intranet.corp.local') or wildcards
+('*.corp.local', matching any name below corp.local, at any depth). Both are
+compiled into dicts: a lookup is one dict probe for the exact name, then one
+per parent domain for wildcards, the most specific suffix winning.
+"""
+
+
+def normalize_host(host):
+    """'Intranet.Corp.Local.:8080' -> 'intranet.corp.local' ('' if unusable)."""
+    if isinstance(host, bytes):
+        host = host.decode("latin1")
+    host = host.strip().lower()
+    if host.startswith("["):
+        # IPv6 literal, with or without a port.
+        return host[1:host.find("]")] if "]" in host else ""
+    if host.count(":") == 1:
+        host = host.partition(":")[0]
+    return host.rstrip(".")
+
+
+class HostMap:
+    def __init__(self, entries=None):
+        self.exact = {}
+        self.wildcards = {}   # parent domain -> value, for '*.<domain>'
+        for pattern, value in (entries or {}).items():
+            self.add(pattern, value)
+
+    def add(self, pattern, value):
+        pattern = pattern.strip().lower().rstrip(".")
+        if pattern.startswith("*."):
+            self.wildcards[pattern[2:]] = value
+        else:
+            self.exact[pattern] = value
+
+    def __bool__(self):
+        return bool(self.exact or self.wildcards)
+
+    def lookup(self, host, default=None):
+        """Value of the pattern matching `host` (a Host header or SNI name)."""
+        host = normalize_host(host)
+        value = self.exact.get(host)
+        if value is not None:
+            return value
+        if self.wildcards:
+            dot = host.find(".")
+            while dot >= 0:
+                host = host[dot + 1:]
+                value = self.wildcards.get(host)
+                if value is not None:
+                    return value
+                dot = host.find(".")
+        return default
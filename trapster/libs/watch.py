@@ -0,0 +1,128 @@
+"""
+Directory watcher: run a callback once files under a directory change.
+
+Uses inotify (through libc, no extra dependency) where available, watching
+every subdirectory; otherwise falls back to polling the tree's mtimes and
+sizes. Bursts of changes (an editor saving, a `cp -r`) are debounced into a
+single callback.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+class DirectoryWatcher:
+    def __init__(self, root, callback, debounce=0.5, poll_interval=2.0):
+        self.root = str(root)
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+    def _directories(self):
+        yield self.root
+        for dirpath, dirnames, _ in os.walk(self.root, followlinks=True):
+            for name in dirnames:
+                yield os.path.join(dirpath, name)
+
+    async def run(self):
+        """Watch until cancelled."""
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if libc else -1
+        if fd < 0:
+            logging.debug(f"inotify unavailable, polling {self.root} every {self.poll_interval}s")
+            await self._poll()
+            return
+        try:
+            await self._watch(libc, fd)
+        finally:
+            os.close(fd)
+
+    async def _watch(self, libc, fd):
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def add_watches():
+            for path in self._directories():
+                libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK)
+
+        def drain():
+            try:
+                while os.read(fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+        def on_readable():
+            drain()
+            changed.set()
+
+        add_watches()
+        loop.add_reader(fd, on_readable)
+        try:
+            while True:
+                await changed.wait()
+                # Let the burst settle before acting on it.
+                while changed.is_set():
+                    changed.clear()
+                    await asyncio.sleep(self.debounce)
+                # New subdirectories need their own watch (existing ones are
+                # simply returned again by inotify_add_watch).
+                add_watches()
+                await self._notify()
+        finally:
+            loop.remove_reader(fd)
+
+    def _snapshot(self):
+        snapshot = {}
+        for dirpath, _, filenames in os.walk(self.root, followlinks=True):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    async def _poll(self):
+        previous = await asyncio.to_thread(self._snapshot)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await asyncio.to_thread(self._snapshot)
+            if current != previous:
+                previous = current
+                await self._notify()
+
+    async def _notify(self):
+        try:
+            await self.callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error handling changes in {self.root}: {e}")
@@ -48,3 +48,7 @@ class BaseLogger(object):
 
     def log(self, logtype, transport, data='', extra={}):
         return self.parse_log(logtype, transport, data, extra)
+
+    def after_fork(self):
+        """Called in each worker process right after it is forked."""
+        pass
@@ -41,7 +41,10 @@ def set_logger(config):
             # Convenience: allow flat kwargs for output and format settings.
             if output_kwargs is None:
                 output_kwargs = {}
-                for key in ("logfile", "mode", "url", "headers", "host", "port"):
+                for key in ("logfile", "mode", "url", "headers", "host", "port",
+                            "queue_size", "batch_size", "flush_interval", "overflow", "drain_timeout",
+                            "body_format", "gzip", "timeout", "max_concurrency", "retries",
+                            "key", "structure", "retention", "maxlen"):
                     if key in kwargs:
                         output_kwargs[key] = kwargs[key]
 
@@ -1,13 +1,13 @@
 import asyncio
-from datetime import datetime
 import json
 import logging
 
-import httpx
 import redis
 
 from .base import BaseLogger
 from .formatters import DefaultFormatter, EcsFormatter
+from .pipeline import EventQueue
+from .sinks import ApiSink, RedisSink
 
 
 class OutputLogger(BaseLogger):
@@ -25,11 +25,13 @@ class OutputLogger(BaseLogger):
         self.output_kwargs = output_kwargs or {}
         self.format_kwargs = format_kwargs or {}
         self.file = None
-        self.redis_client = None
+        self.redis_sink = None
         self.api_headers = None
         self.api_url = None
+        self.api_sink = None
         self._formatter = self._build_formatter()
         self._setup_output()
+        self._setup_queue()
 
     def _build_formatter(self):
         if self.event_format == "default":
@@ -53,57 +55,175 @@ class OutputLogger(BaseLogger):
             if not self.api_url:
                 raise ValueError("Missing required 'url' for api output.")
             self.api_headers = self.output_kwargs.get("headers", {})
+            self.api_sink = ApiSink(
+                self.api_url,
+                headers=self.api_headers,
+                body_format=self.output_kwargs.get("body_format", "event"),
+                gzip=self.output_kwargs.get("gzip", False),
+                timeout=self.output_kwargs.get("timeout", 10),
+                max_concurrency=self.output_kwargs.get("max_concurrency", 4),
+                retries=self.output_kwargs.get("retries", 3),
+            )
             return
         if self.output == "redis":
-            host = self.output_kwargs.get("host", "localhost")
-            port = self.output_kwargs.get("port", 6379)
-            self.redis_client = redis.Redis(host=host, port=port)
+            self.redis_sink = RedisSink(
+                host=self.output_kwargs.get("host", "localhost"),
+                port=self.output_kwargs.get("port", 6379),
+                key=self.output_kwargs.get("key", "events"),
+                structure=self.output_kwargs.get("structure", "zset"),
+                retention=self.output_kwargs.get("retention"),
+                maxlen=self.output_kwargs.get("maxlen", 100000),
+                max_connections=self.output_kwargs.get("max_concurrency", 4),
+            )
             return
         raise ValueError(
             f"Unsupported output '{self.output}'. Supported outputs: terminal, file, api, redis."
         )
 
+    def _setup_queue(self):
+        """Events are queued by log() and written in batches by a background
+        task, flushed every `batch_size` events or `flush_interval` seconds."""
+        self.queue = EventQueue(
+            maxsize=self.output_kwargs.get("queue_size", 10000),
+            batch_size=self.output_kwargs.get("batch_size", 500),
+            overflow=self.output_kwargs.get("overflow", "drop-oldest"),
+        )
+        self.flush_interval = float(self.output_kwargs.get("flush_interval", 1.0))
+        self.drain_timeout = float(self.output_kwargs.get("drain_timeout", 10.0))
+        self.written = 0
+        self._writer_task = None
+        self._reported_drops = 0
+
     def log(self, logtype, transport, data='', extra={}):
         event = self.parse_log(logtype, transport, data, extra)
         if not event:
             return
 
-        payload = self._formatter.format(event)
+        # Outside an event loop there is no writer to hand off to (and no
+        # other task to stall): write the event now.
+        if not self._ensure_writer():
+            self._write_events([event])
+            return
+        self.queue.put(event)
+
+    def stats(self):
+        """Pipeline counters: events waiting, dropped or kept over the bound on
+        overflow, and written (for the api output: successfully posted)."""
+        return {
+            "queue_depth": len(self.queue),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.queue.dropped,
+            "blocked": self.queue.blocked,
+            "written": self.written + (self.api_sink.sent if self.api_sink else 0),
+        }
+
+    def _ensure_writer(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if self._writer_task is None or self._writer_task.done() or self._writer_task.get_loop() is not loop:
+            self._writer_task = loop.create_task(self._run_writer())
+        return True
+
+    async def _run_writer(self):
+        try:
+            while True:
+                await self.queue.wait(self.flush_interval)
+                batch = self.queue.get_batch()
+                if batch:
+                    try:
+                        await self._write_batch(batch)
+                    except Exception as e:
+                        logging.error(f"Failed to write {len(batch)} events to {self.output}: {e}")
+                self._report_drops()
+        except asyncio.CancelledError:
+            # Shutdown: drain whatever is still queued before the loop goes away.
+            await self._drain()
+            raise
+
+    def _report_drops(self):
+        if self.queue.dropped > self._reported_drops:
+            logging.warning(
+                f"Log queue full ({self.queue.maxsize} events), "
+                f"{self.queue.dropped - self._reported_drops} events dropped"
+            )
+            self._reported_drops = self.queue.dropped
+
+    async def flush(self):
+        """Write every queued event now, and wait for in-flight requests."""
+        while len(self.queue):
+            await self._write_batch(self.queue.get_batch())
+        if self.api_sink:
+            await self.api_sink.join()
+
+    async def _drain(self):
+        try:
+            await asyncio.wait_for(self.flush(), self.drain_timeout)
+            if self.api_sink:
+                await self.api_sink.close()
+            if self.redis_sink:
+                await self.redis_sink.close()
+        except Exception as e:
+            logging.error(f"Failed to drain log queue to {self.output}: {e!r}, "
+                          f"{len(self.queue)} events lost")
+
+    async def _write_batch(self, events):
+        if self.output == "api":
+            # Counted by the sink once posted
+            await self.api_sink.write([self._formatter.format(event) for event in events])
+            return
+        elif self.output == "redis":
+            await self.redis_sink.write([self._formatter.format(event) for event in events], events)
+        else:
+            # terminal/file writes are a single local call per batch.
+            self._write_events(events)
+            return
+        self.written += len(events)
+
+    def _write_events(self, events):
+        """Write events from the caller: only outside an event loop for the
+        api and redis outputs, whose sync clients block."""
+        payloads = [self._formatter.format(event) for event in events]
         if self.output == "terminal":
-            logging.info(payload)
+            for payload in payloads:
+                logging.info(payload)
         elif self.output == "file":
-            self._write_file(payload)
+            if not self._write_file(payloads):
+                return
         elif self.output == "api":
-            self._post_api(payload)
+            self.api_sink.write_sync(payloads)
+            return
         elif self.output == "redis":
-            self._write_redis(payload, event)
+            try:
+                self.redis_sink.write_sync(payloads, events)
+            except redis.RedisError as e:
+                logging.error(f"Failed to write {len(events)} events to redis: {e}")
+                return
+        self.written += len(events)
 
-    def _write_file(self, payload):
+    def after_fork(self):
+        # Workers share the parent's file description, and with it a single
+        # write offset. Reopen in append mode so each worker's O_APPEND writes
+        # land at the current end of file instead of overwriting each other.
+        if self.file:
+            logfile = self.file.name
+            self.file.close()
+            self.file = open(logfile, "a")
+        for sink in (self.api_sink, self.redis_sink):
+            if sink:
+                sink.reset()
+        self._writer_task = None
+
+    def _write_file(self, payloads):
         try:
-            json.dump(payload, self.file)
-            self.file.write("\n")
+            # One write per batch of whole lines, so concurrent workers never interleave.
+            self.file.write("".join(json.dumps(payload) + "\n" for payload in payloads))
             self.file.flush()
+            return True
         except IOError as e:
             logging.error(f"An error occurred while writing to the log file: {e}")
-
-    def _post_api(self, payload):
-        loop = asyncio.get_event_loop()
-        loop.create_task(self._post_request(payload))
-
-    async def _post_request(self, payload):
-        return await asyncio.to_thread(self._post_request_threaded, payload)
-
-    def _post_request_threaded(self, payload):
-        with httpx.Client(headers=self.api_headers) as client:
-            return client.post(self.api_url, json=payload, timeout=10)
-
-    def _write_redis(self, payload, event):
-        timestamp = event.get("timestamp")
-        try:
-            score = datetime.fromisoformat(timestamp).timestamp()
-        except Exception:
-            score = datetime.now().timestamp()
-        self.redis_client.zadd("events", {json.dumps(payload): score})
+            return False
 
     def __del__(self):
         if self.file:
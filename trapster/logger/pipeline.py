@@ -0,0 +1,74 @@
+import asyncio
+from collections import deque
+
+
+OVERFLOW_POLICIES = ("drop-oldest", "drop-newest", "block")
+
+
+class EventQueue:
+    """Bounded FIFO between OutputLogger.log() and its background writer.
+
+    put() is O(1) and never awaits, so protocol handlers only pay for an
+    append. When the queue is full, the overflow policy decides:
+
+    - drop-oldest: evict the oldest queued event to make room (default)
+    - drop-newest: discard the incoming event
+    - block: keep the event, over the bound, and wake the writer to drain the
+      queue at once; nothing is lost or reordered, and the caller never
+      writes to the sink itself (`blocked` counts these events)
+    """
+
+    def __init__(self, maxsize=10000, batch_size=500, overflow="drop-oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unsupported overflow policy '{overflow}'. Supported policies: {', '.join(OVERFLOW_POLICIES)}."
+            )
+        self.maxsize = max(1, int(maxsize))
+        self.batch_size = max(1, int(batch_size))
+        self.overflow = overflow
+        self.dropped = 0
+        self.blocked = 0
+        self._items = deque()
+        self._ready = None
+        self._loop = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        if len(self._items) >= self.maxsize:
+            if self.overflow == "block":
+                self.blocked += 1
+            else:
+                self.dropped += 1
+                if self.overflow == "drop-newest":
+                    return True
+                self._items.popleft()
+        self._items.append(item)
+        if self._full() and self._ready is not None:
+            self._ready.set()
+        return True
+
+    def get_batch(self):
+        count = min(self.batch_size, len(self._items))
+        return [self._items.popleft() for _ in range(count)]
+
+    def _full(self):
+        return len(self._items) >= self.batch_size or (self.overflow == "block" and len(self._items) >= self.maxsize)
+
+    async def wait(self, timeout):
+        """Return once a full batch is queued (or, under "block", the queue
+        is full), or after `timeout` seconds."""
+        if self._full():
+            return
+        # The event is bound to the loop it's first awaited on; a worker
+        # process or a new asyncio.run() gets a fresh one.
+        loop = asyncio.get_running_loop()
+        if self._ready is None or self._loop is not loop:
+            self._ready = asyncio.Event()
+            self._loop = loop
+        self._ready.clear()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -2,11 +2,13 @@ from .output import OutputLogger
 
 
 class RedisLogger(OutputLogger):
-    def __init__(self, node_id, host="localhost", port=6379, event_format="default", format_kwargs=None):
+    def __init__(self, node_id, host="localhost", port=6379, event_format="default", format_kwargs=None,
+                 key="events", structure="zset", retention=None, maxlen=100000):
         super().__init__(
             node_id=node_id,
             output="redis",
             event_format=event_format,
-            output_kwargs={"host": host, "port": port},
+            output_kwargs={"host": host, "port": port, "key": key, "structure": structure,
+                           "retention": retention, "maxlen": maxlen},
             format_kwargs=format_kwargs or {},
         )
@@ -0,0 +1,241 @@
+import asyncio
+from datetime import datetime, timezone
+import gzip
+import json
+import logging
+import time
+
+import httpx
+import redis
+import redis.asyncio as aioredis
+
+
+class ApiSink:
+    """HTTP(S) event sink sharing one keep-alive AsyncClient.
+
+    Each batch from the logger queue is POSTed according to `body_format`:
+
+    - event: one JSON object per request (the historical behaviour)
+    - ndjson: one request per batch, newline-delimited JSON
+    - json: one request per batch, a JSON array
+
+    At most `max_concurrency` requests are in flight; the logger's writer
+    waits for a free slot, so a slow collector backs up into the bounded
+    queue instead of piling up tasks. Only 2xx responses count as sent;
+    5xx/429 responses, timeouts and connection errors are retried with
+    exponential backoff, and other responses fail the batch at once.
+    """
+
+    BODY_FORMATS = {
+        "event": "application/json",
+        "ndjson": "application/x-ndjson",
+        "json": "application/json",
+    }
+
+    def __init__(self, url, headers=None, body_format="event", gzip=False, timeout=10,
+                 max_concurrency=4, retries=3, backoff=0.5, max_backoff=30):
+        if body_format not in self.BODY_FORMATS:
+            raise ValueError(
+                f"Unsupported body_format '{body_format}'. Supported formats: {', '.join(self.BODY_FORMATS)}."
+            )
+        self.url = url
+        self.headers = headers or {}
+        self.body_format = body_format
+        self.gzip = gzip
+        self.timeout = float(timeout)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.failed = 0
+        self.sent = 0
+        self.reset()
+
+    def reset(self):
+        """Forget loop-bound state (client, semaphore), e.g. after a fork."""
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._inflight = set()
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_concurrency,
+                                  max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout, limits=limits)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = set()
+            self._loop = loop
+
+    def _encode(self, payloads):
+        """Yield (body, headers, event_count) for each request a batch needs."""
+        if self.body_format == "event":
+            bodies = [(json.dumps(payload).encode(), 1) for payload in payloads]
+        elif self.body_format == "ndjson":
+            bodies = [("".join(json.dumps(payload) + "\n" for payload in payloads).encode(), len(payloads))]
+        else:
+            bodies = [(json.dumps(payloads).encode(), len(payloads))]
+
+        headers = {"Content-Type": self.BODY_FORMATS[self.body_format]}
+        if self.gzip:
+            headers["Content-Encoding"] = "gzip"
+        for body, count in bodies:
+            yield (gzip.compress(body) if self.gzip else body), headers, count
+
+    async def write(self, payloads):
+        self._ensure_client()
+        for body, headers, count in self._encode(payloads):
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._post(body, headers, count))
+            self._inflight.add(task)
+            task.add_done_callback(self._post_done)
+
+    def _post_done(self, task):
+        self._inflight.discard(task)
+        self._semaphore.release()
+
+    async def _post(self, body, headers, count):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+            try:
+                response = await self._client.post(self.url, content=body, headers=headers)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            if response.is_success:
+                self.sent += count
+                return
+            error = f"HTTP {response.status_code}"
+            if not self._retryable(response.status_code):
+                break
+        self.failed += count
+        logging.error(f"Failed to post {count} events to {self.url}: {error}")
+
+    @staticmethod
+    def _retryable(status_code):
+        # Other errors (e.g. 401, 404, 413: a wrong url, key or size limit)
+        # fail the same way on every attempt.
+        return status_code == 429 or status_code >= 500
+
+    async def join(self):
+        """Wait for every in-flight request to finish."""
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def close(self):
+        await self.join()
+        if self._client is not None:
+            await self._client.aclose()
+        self.reset()
+
+    def write_sync(self, payloads):
+        """Blocking fallback for when there is no running event loop."""
+        with httpx.Client(headers=self.headers, timeout=self.timeout) as client:
+            for body, headers, count in self._encode(payloads):
+                try:
+                    response = client.post(self.url, content=body, headers=headers)
+                except httpx.TransportError as e:
+                    self.failed += count
+                    logging.error(f"Failed to post {count} events to {self.url}: {e}")
+                    continue
+                if response.is_success:
+                    self.sent += count
+                else:
+                    self.failed += count
+                    logging.error(f"Failed to post {count} events to {self.url}: HTTP {response.status_code}")
+
+
+class RedisSink:
+    """Redis event sink on a redis.asyncio connection pool.
+
+    Each batch from the logger queue is written in one pipelined round trip
+    (no MULTI/EXEC), to one of these `structure`s:
+
+    - zset: ZADD into `key`, scored by event time (the historical layout);
+      with `retention` (seconds), older events are trimmed on every batch
+    - daily: the same ZSET layout sharded per UTC day (`<key>:YYYY-MM-DD`);
+      with `retention`, each day key expires that long after its last write
+    - stream: XADD to the `key` stream, capped with MAXLEN ~ `maxlen`
+    """
+
+    STRUCTURES = ("zset", "daily", "stream")
+
+    def __init__(self, host="localhost", port=6379, key="events", structure="zset",
+                 retention=None, maxlen=100000, max_connections=4):
+        if structure not in self.STRUCTURES:
+            raise ValueError(
+                f"Unsupported redis structure '{structure}'. Supported structures: {', '.join(self.STRUCTURES)}."
+            )
+        self.host = host
+        self.port = port
+        self.key = key
+        self.structure = structure
+        self.retention = float(retention) if retention else None
+        self.maxlen = int(maxlen)
+        self.max_connections = max(1, int(max_connections))
+        self._sync_client = None
+        self.reset()
+
+    def reset(self):
+        """Forget the loop-bound client, e.g. after a fork."""
+        self._client = None
+        self._loop = None
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = aioredis.Redis(host=self.host, port=self.port,
+                                          max_connections=self.max_connections)
+            self._loop = loop
+        return self._client
+
+    @staticmethod
+    def _event_time(event):
+        try:
+            return datetime.fromisoformat(event.get("timestamp")).replace(tzinfo=timezone.utc).timestamp()
+        except Exception:
+            return time.time()
+
+    def _queue_commands(self, pipe, payloads, events):
+        """Queue a batch's commands on a (sync or async) pipeline."""
+        if self.structure == "stream":
+            for payload in payloads:
+                pipe.xadd(self.key, {"event": json.dumps(payload)}, maxlen=self.maxlen, approximate=True)
+            return
+
+        expiring = set()
+        for payload, event in zip(payloads, events):
+            score = self._event_time(event)
+            if self.structure == "daily":
+                key = f"{self.key}:{datetime.fromtimestamp(score, timezone.utc):%Y-%m-%d}"
+                expiring.add(key)
+            else:
+                key = self.key
+            pipe.zadd(key, {json.dumps(payload): score})
+
+        if self.retention and self.structure == "zset":
+            pipe.zremrangebyscore(self.key, "-inf", f"({time.time() - self.retention}")
+        elif self.retention:
+            for key in expiring:
+                pipe.expire(key, int(self.retention))
+
+    async def write(self, payloads, events):
+        async with self._ensure_client().pipeline(transaction=False) as pipe:
+            self._queue_commands(pipe, payloads, events)
+            await pipe.execute()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self.reset()
+
+    def write_sync(self, payloads, events):
+        """Blocking fallback for when there is no running event loop."""
+        if self._sync_client is None:
+            self._sync_client = redis.Redis(host=self.host, port=self.port)
+        pipe = self._sync_client.pipeline(transaction=False)
+        self._queue_commands(pipe, payloads, events)
+        pipe.execute()
@@ -1,6 +1,7 @@
 import asyncio
 import errno
 import logging
+import socket
 from typing import Optional
 
 # https://svn.nmap.org/nmap/nmap-service-probes
@@ -61,6 +62,22 @@ class BaseHoneypot(object):
         self.handler.logger = logger
         self.server = None
         self.task = None
+        # Set by TrapsterManager when running several worker processes: every
+        # worker binds the same port and the kernel load-balances accepts.
+        self.reuse_port = False
+
+    def _bind_reuse_port(self, type_=socket.SOCK_STREAM):
+        """Bind a SO_REUSEPORT socket, for servers that only accept a pre-bound socket."""
+        family = socket.AF_INET6 if ":" in self.bindaddr else socket.AF_INET
+        sock = socket.socket(family, type_)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.bindaddr, self.port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
 
     def _log_bind_error(self, exc: Exception = None):
         if isinstance(exc, OSError) and exc.errno == errno.EACCES:
@@ -82,7 +99,8 @@ class BaseHoneypot(object):
     async def _start_server(self):
         loop = asyncio.get_running_loop()
         try:
-            self.server = await loop.create_server(self.handler, host=self.bindaddr, port=self.port)
+            self.server = await loop.create_server(self.handler, host=self.bindaddr, port=self.port,
+                                                   reuse_port=self.reuse_port)
             await self.server.serve_forever()
         except asyncio.CancelledError:
             raise
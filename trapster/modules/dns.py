@@ -110,10 +110,12 @@ class DnsHoneypot(BaseHoneypot):
         try:
             # Create UDP server
             self.udp_transport, self.udp_protocol = await loop.create_datagram_endpoint(self.handler_udp, 
-                                        local_addr=(self.bindaddr, self.port))
+                                        local_addr=(self.bindaddr, self.port),
+                                        reuse_port=self.reuse_port)
             
             # Create TCP server
-            self.server = await loop.create_server(self.handler, host=self.bindaddr, port=self.port)
+            self.server = await loop.create_server(self.handler, host=self.bindaddr, port=self.port,
+                                                   reuse_port=self.reuse_port)
             await self.server.serve_forever()
         except asyncio.CancelledError:
             raise
@@ -1,35 +1,69 @@
 import asyncio
+import functools
 import hashlib
+import logging
 import secrets
+import socket
+import time
 
-from starlette.requests import ClientDisconnect
-from fastapi import FastAPI, Request, Response
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
 
 from jinja2.sandbox import ImmutableSandboxedEnvironment
-from jinja2 import FileSystemLoader, Undefined
+from jinja2 import FileSystemBytecodeCache, FileSystemLoader, TemplateError, Undefined
 import yaml
-import random, string, base64, mimetypes, re, uuid
-from urllib.parse import parse_qsl, quote
+import random, string, base64, mimetypes, uuid
+from urllib.parse import quote
 from datetime import datetime, timezone
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 mimetypes.add_type('image/x-icon', '.ico')
 
 from trapster.modules.base import BaseHoneypot
+from trapster.libs.delay import DelayScheduler
+from trapster.libs.http_compression import Compression
+from trapster.libs.http_context import DEFAULT_MAX_BODY, RequestContext
+from trapster.libs.http_responses import ConstantResponse, cookie_name, is_not_modified
+from trapster.libs.honeyfiles import Honeyfile
+from trapster.libs.http_routes import RouteIndex
+from trapster.libs.http_static import StaticIndex
+from trapster.libs.http_templates import TemplateCache
+from trapster.libs.http_upstream import UpstreamCache
+from trapster.libs.skin_bundle import (BundleBytecodeCache, BundleLoader, BundleStaticIndex,
+                                       BundleTemplateCache, load_bundle, write_bundle)
+from trapster.libs.vhosts import HostMap
+from trapster.libs.watch import DirectoryWatcher
 
 # Carries a custom HTTP/1.1 reason phrase from the handler to the hypercorn
 # reason patch below, via the ASGI `state` extension (request.state / scope
-# ["state"]). Not a contextvar: FastAPI's @app.middleware("http") decorator
-# (see custom_method_middleware) runs the actual endpoint in a child task
-# spawned by Starlette's BaseHTTPMiddleware, and a contextvar set there is
-# invisible to the outer task that hands the response to hypercorn. The ASGI
-# scope dict, in contrast, is the same object shared across that task split,
-# so mutating scope["state"] is visible wherever the scope is threaded next.
+# ["state"]). The patch only sees hypercorn's stream, whose `scope` is the very
+# dict the app was called with, so the scope is the one place both can reach.
 _REASON_STATE_KEY = "custom_http_reason"
 
-# HTTP methods FastAPI routes natively; anything else is a "custom" method.
+# HTTP methods routed to HttpHandler.handle_request; anything else is a
+# "custom" method, answered by handle_unknown_method.
 STANDARD_METHODS = {"GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH", "TRACE", "QUERY"}
 
+# Hypercorn settings a service ("hypercorn" in trapster.conf) or its skin
+# ("hypercorn" in config.yaml) can tune, with defaults for hostile traffic:
+# a deep accept backlog for scan bursts, short TLS handshakes, and tighter
+# per-connection HTTP/2 limits than Hypercorn's. read_timeout is off: it
+# closes a connection whenever the client sends nothing for that long,
+# which includes a slow honeyfile download.
+HYPERCORN_SETTINGS = {
+    'keep_alive_timeout': 5.0,
+    'keep_alive_max_requests': 100,
+    'backlog': 1024,
+    'h11_max_incomplete_size': 16384,
+    'h2_max_concurrent_streams': 32,
+    'h2_max_header_list_size': 16384,
+    'h2_max_inbound_frame_size': 16384,
+    'read_timeout': None,
+    'ssl_handshake_timeout': 10.0,
+    'graceful_timeout': 3.0,
+    'max_app_queue_size': 10,
+}
+
 
 def _patch_hypercorn_reason():
     """Let config.yaml override the HTTP/1.1 reason phrase.
@@ -71,6 +105,7 @@ _patch_hypercorn_reason()
 # Optional AI import - gracefully handle when AI dependencies aren't installed
 try:
     from trapster.ai import HTTPAgent
+    from trapster.ai.http import request_key
     AI_AVAILABLE = True
 except ImportError:
     HTTPAgent = None
@@ -85,6 +120,10 @@ class HttpHandler:
         self.config.setdefault('basic_auth', False)
         self.config.setdefault('username', None)
         self.config.setdefault('password', None)
+        # Drawn here rather than in setup(): handlers are built before worker
+        # processes are forked, so every worker serves the same deploy values.
+        if not self.config.get('deploy_seed'):
+            self.config['deploy_seed'] = secrets.token_hex(8)
 
         self.logger = logger
         self.logger.debug = False
@@ -94,8 +133,68 @@ class HttpHandler:
         self.USERNAME = self.config.get('username')
         self.PASSWORD = self.config.get('password')
         self.data_folder = Path(__file__).parent.parent / "data" / "http"
+        # Deploy-time Jinja results, kept across reloads (see setup()).
+        self._deploy_values = {}
+        # The precompiled skin being served, if any (see _setup_bundle()).
+        self.bundle = None
+
+    def setup(self, previous=None):
+        """Load and compile the skin.
+
+        When reloading, `previous` is the handler being replaced: its
+        deploy-time values (vars, evaluated headers/content), response delay
+        scheduler and AI agent carry over, so the reload is invisible from
+        the outside unless the skin itself changed.
+        """
+        if previous is not None:
+            self._deploy_values = previous._deploy_values
+        if self.config.get('bundle'):
+            self._setup_bundle(self.config['bundle'])
+        else:
+            self._load_skin()
+            self.routes = RouteIndex(self.http_config.get('endpoints', []))
+            self.env = self.create_jinja_env()
+            self.templates = TemplateCache(self.env, self.template_folder)
+            static_options = {key: self.config[f'static_{key}']
+                              for key in ('cache_size', 'mmap_threshold', 'rescan_interval')
+                              if self.config.get(f'static_{key}') is not None}
+            self.static = StaticIndex(self.static_folder, **static_options)
+        self.compression = Compression.from_config(self.http_config.get('compression'))
+        self.static_variants = {}
+        if self.compression is not None:
+            if self.bundle is not None:
+                self.static_variants = self.bundle.shared('static_variants', self._precompress_static)
+            else:
+                self.static_variants = self._precompress_static()
+        self.constant_responses = self._build_constant_responses()
+        self.honeyfiles = self._build_honeyfiles()
+        self.upstream = self._setup_upstream(previous)
+        # Recorded upstream responses served so far, keyed by recording key.
+        self.upstream_responses = {}
+        if previous is not None:
+            self.delays = previous.delays
+        else:
+            delay_options = {key: self.config[f'delay_{key}']
+                             for key in ('tick', 'max_pending', 'shrink_pending', 'shrink_lag')
+                             if self.config.get(f'delay_{key}') is not None}
+            self.delays = DelayScheduler(**delay_options)
+        # Request bytes kept for templates and logs (the rest is only hashed
+        # and counted), from the service config, else the skin's config.yaml.
+        self.max_body_size = int(self.config.get('max_body_size')
+                                 or self.http_config.get('max_body_size')
+                                 or DEFAULT_MAX_BODY)
+        # http_version: "2" offers HTTP/2 via ALPN (https only); clients that
+        # negotiate h2 get lowercase headers, h1.1 clients get Title-Case. The
+        # casing is decided per-request by the protocol, not by this flag.
+        version = str(self.http_config.get('http_version', '') or '').strip()
+        self.http2 = version in ('2', '2.0', 'h2')
+        if previous is not None:
+            self.http_agent = previous.http_agent
+        else:
+            self.http_agent = HTTPAgent.shared() if AI_AVAILABLE else None
 
-    def setup(self):
+    def _load_skin(self):
+        """Read the skin's config.yaml and resolve its deploy-time values."""
         try:
             resolved_path = (self.data_folder / self.NAME).resolve()
             if not resolved_path.is_relative_to(self.data_folder):
@@ -111,13 +210,121 @@ class HttpHandler:
             self.http_config = yaml.safe_load(file)
 
         self._resolve_deploy_config()
-        self.env = self.create_jinja_env()
-        # http_version: "2" offers HTTP/2 via ALPN (https only); clients that
-        # negotiate h2 get lowercase headers, h1.1 clients get Title-Case. The
-        # casing is decided per-request by the protocol, not by this flag.
-        version = str(self.http_config.get('http_version', '') or '').strip()
-        self.http2 = version in ('2', '2.0', 'h2')
-        self.http_agent = HTTPAgent() if AI_AVAILABLE else None
+
+    def _setup_bundle(self, path):
+        """Serve a precompiled skin bundle (see `trapster skin compile`).
+
+        The bundle, and the routes, Jinja environment, templates and static
+        index built from it, are shared by every handler of the process
+        serving the same file. Its config is already resolved, with the
+        deploy_seed it was compiled with, which replaces this handler's.
+        """
+        bundle = load_bundle(path)
+        self.bundle = bundle
+        self.NAME = bundle.skin
+        self.config['deploy_seed'] = bundle.deploy_seed
+        self._deploy_seed = bundle.deploy_seed
+        self._etag_fn = self.make_etag_fn(bundle.deploy_seed)
+        self.http_config = bundle.config
+        self.routes = bundle.shared('routes', lambda: RouteIndex(bundle.config.get('endpoints', [])))
+        self.env = bundle.shared('env', lambda: self.create_jinja_env(
+            loader=BundleLoader(bundle.template_bytes), bytecode_cache=BundleBytecodeCache(bundle)))
+        self.templates = bundle.shared('templates', lambda: BundleTemplateCache(self.env, bundle))
+        self.static = bundle.shared('static', lambda: BundleStaticIndex(bundle))
+
+    def compile_bundle(self, output):
+        """Write this handler's skin to `output` as a bundle: config.yaml
+        resolved with this handler's deploy_seed, template sources with their
+        compiled bytecode, and static files. Returns the bundle's header."""
+        self._load_skin()
+        templates = StaticIndex(self.template_folder)
+        sources = {rel: Path(entry.path).read_bytes() for rel, entry in templates.files.items()}
+        bytecode = BundleBytecodeCache()
+        env = self.create_jinja_env(loader=BundleLoader(sources.__getitem__), bytecode_cache=bytecode)
+        for name in sources:
+            if PurePosixPath(name).suffix.lower() in self._JINJA_FILE_SUFFIXES:
+                try:
+                    env.get_template(name)
+                except (TemplateError, UnicodeDecodeError) as e:
+                    logging.warning(f"Template {name} not precompiled: {e}")
+
+        static = StaticIndex(self.static_folder)
+        files = {rel: Path(entry.path).read_bytes() for rel, entry in static.files.items()}
+        header = {
+            'skin': self.NAME,
+            'deploy_seed': self.config['deploy_seed'],
+            'config': yaml.safe_dump(self.http_config, sort_keys=False),
+            'static_root': static._root,
+            'files': {rel: [0, 0, entry.content_type] for rel, entry in static.files.items()},
+        }
+        return write_bundle(output, header, {'templates': sources, 'bytecode': bytecode.recorded, 'files': files})
+
+    def _build_constant_responses(self):
+        """Pre-build the response of every endpoint (and the default) that
+        doesn't depend on the request, keyed by id() of its config entry."""
+        global_headers = self.http_config.get('headers', {})
+        configs = [(variant.config, 200 if 'content' in variant.config else 404)
+                   for route in self.routes.routes
+                   for variants in route.by_method.values()
+                   for variant in variants]
+        configs.append((self.http_config.get('default'), 404))
+
+        constants = {}
+        for config, default_status in configs:
+            constant = ConstantResponse.build(config, global_headers, default_status, self._render_reason,
+                                              self.compression)
+            if constant is not None:
+                constants[id(config)] = constant
+        return constants
+
+    def _build_honeyfiles(self):
+        """Honeyfile of every `honeyfile` endpoint, keyed by id() of its config
+        entry. Content is seeded by the deployment and the route, so each
+        deployment serves its own, stable bytes."""
+        honeyfiles = {}
+        for route in self.routes.routes:
+            for variants in route.by_method.values():
+                for variant in variants:
+                    options = variant.config.get('honeyfile')
+                    if options:
+                        seed = f"{self.config['deploy_seed']}:{route.pattern}"
+                        honeyfiles[id(variant.config)] = Honeyfile.from_config(options, seed)
+        return honeyfiles
+
+    def _setup_upstream(self, previous=None):
+        """The skin's origin in record-and-replay mode (`upstream`), if any.
+        Recordings go to the service's `upstream_cache` directory, else the
+        skin's `upstream.cache`, else ./upstream_cache/<skin>. A reload keeps
+        the previous one (and its connections) unless its options changed."""
+        cache_dir = self.config.get('upstream_cache') or Path('upstream_cache') / self.NAME
+        upstream = UpstreamCache.from_config(self.http_config.get('upstream'), cache_dir)
+        if previous is not None and upstream is not None and previous.upstream is not None \
+                and previous.upstream.options == upstream.options:
+            return previous.upstream
+        return upstream
+
+    def _precompress_static(self):
+        """Compressed variants of every compressible static file, keyed like
+        the static index: {key: (StaticFile, {encoding: bytes})}."""
+        return {key: (entry, self._compress_static(key, entry)) for key, entry in self.static.files.items()}
+
+    def _compress_static(self, key, entry):
+        if entry is None or not self.compression.eligible(200, {'Content-Type': entry.content_type}, entry.size):
+            return {}
+        try:
+            found = self.static.read(key)
+        except OSError:
+            return {}
+        return self.compression.variants(found[0]) if found is not None else {}
+
+    def _static_variants(self, key):
+        """Compressed variants of a static file, compressed again if the file
+        changed since (see StaticIndex rescan_interval)."""
+        entry = self.static.files.get(key)
+        cached = self.static_variants.get(key)
+        if cached is None or cached[0] is not entry:
+            cached = self.static_variants[key] = (entry, self._compress_static(key, entry))
+        return cached[1]
 
     # --- request / config helpers ------------------------------------------
 
@@ -130,37 +337,14 @@ class HttpHandler:
             params[key] = value
         return params
 
+    def _context(self, request):
+        return RequestContext.of(request, self.max_body_size)
+
     async def sanitize_request(self, request):
+        """The `request` object exposed to templates (built once per request)."""
         if not request:
             return None
-
-        body = None
-        form = {}
-        if request.method in ["POST", "PUT", "PATCH"]:
-            raw = await request.body()
-            body = raw.decode() if raw else None
-            # Parse form-urlencoded bodies so templates can reflect fields back
-            # (e.g. the submitted username). Last value wins for repeated keys.
-            ctype = request.headers.get("content-type", "")
-            if body and "application/x-www-form-urlencoded" in ctype:
-                form = dict(parse_qsl(body, keep_blank_values=True))
-
-        return {
-            "url": request.url,
-            "path": request.url.path,
-            "method": request.method,
-            "headers": dict(request.headers),
-            "body": body,
-            "form": form,
-            "remote": request.client.host if request.client else None,
-            "cookies": request.cookies,
-            "query_string": dict(request.query_params),
-            "content_type": request.headers.get("content-type"),
-            "host": request.headers.get("host"),
-            "secure": request.url.scheme == "https",
-            "scheme": request.url.scheme,
-            "path_qs": str(request.url).split(request.base_url.netloc, 1)[1],
-        }
+        return await self._context(request).info()
 
     @staticmethod
     def make_etag_fn(deploy_seed, route_ref=None):
@@ -197,15 +381,15 @@ class HttpHandler:
     def _resolve_deploy_config(self):
         """Evaluate Jinja expressions in config.yaml once at startup.
 
-        A random deploy_seed is generated per process (stable for the honeypot's
-        lifetime, unique across deployments) and exposed as {{ deploy_seed }}, so
+        A random deploy_seed is generated per instance (stable for the honeypot's
+        lifetime and shared by all its workers, unique across deployments) and exposed as {{ deploy_seed }}, so
         vars produce values that differ per deployment but stay identical across
         every request of a given deployment. Resolved vars become {{ vars.X }} in
         every template. Global/per-endpoint headers and inline content are also
         evaluated, letting fingerprint-prone values (etags, tokens, RSA keys)
         live as Jinja expressions instead of hardcoded strings.
         """
-        deploy_seed = self.config.get('deploy_seed') or secrets.token_hex(8)
+        deploy_seed = self.config['deploy_seed']
         route_ref = ['']
 
         eval_env = ImmutableSandboxedEnvironment(autoescape=False)
@@ -221,10 +405,15 @@ class HttpHandler:
                 # Location); leave them intact for render-time, not deploy-time.
                 if 'request' in value:
                     return value
-                try:
-                    return eval_env.from_string(value).render()
-                except Exception:
-                    return value
+                # Evaluated once per deployment: a reload reuses the value an
+                # unchanged expression got before (random() included).
+                key = (eval_env.globals['route'], value, repr(eval_env.globals.get('vars')))
+                if key not in self._deploy_values:
+                    try:
+                        self._deploy_values[key] = eval_env.from_string(value).render()
+                    except Exception:
+                        self._deploy_values[key] = value
+                return self._deploy_values[key]
             if isinstance(value, dict):
                 return {k: evaluate(v) for k, v in value.items()}
             if isinstance(value, list):
@@ -267,9 +456,19 @@ class HttpHandler:
             random.seed(seed)
         return ''.join(random.choice(alphabet) for _ in range(length))
 
-    def create_jinja_env(self):
+    def create_jinja_env(self, loader=None, bytecode_cache=None):
+        if loader is None:
+            loader = FileSystemLoader(self.template_folder)
+            # Optional on-disk cache of compiled template bytecode, so restarts
+            # skip compiling. Keep the directory private to trapster: it is
+            # only ever read back by this sandboxed environment.
+            cache_dir = self.config.get('template_cache_dir')
+            if cache_dir:
+                Path(cache_dir).mkdir(parents=True, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(cache_dir)
         env = ImmutableSandboxedEnvironment(
-            loader=FileSystemLoader(self.template_folder),
+            loader=loader,
+            bytecode_cache=bytecode_cache,
             autoescape=True,
             # Keep the original document's trailing newline so a rendered page
             # is byte-for-byte identical to the source (Content-Length tell).
@@ -287,34 +486,10 @@ class HttpHandler:
         env.undefined = Undefined
         return env
 
-    @staticmethod
-    def _query_matches(rules, params):
-        """True if every query rule (regex per param) matches the request."""
-        return all(name in params and re.fullmatch(pattern, params[name])
-                   for name, pattern in rules.items())
-
     def get_endpoint_config(self, full_url, method):
         """Find the config entry matching this URL + method (+ query rules)."""
         base_url, _, query_string = full_url.partition('?')
-        query_params = self.parse_query_string(query_string)
-
-        for endpoint in self.http_config.get('endpoints', []):
-            for route, details in endpoint.items():
-                if not re.fullmatch(route, base_url):
-                    continue
-                if not isinstance(details, list):
-                    details = [details]
-                candidates = [d for d in details if d['method'] == method]
-
-                # Prefer a config whose query rules all match the request,
-                # otherwise fall back to one with no query rules.
-                for config in candidates:
-                    if config.get('query') and self._query_matches(config['query'], query_params):
-                        return config
-                fallback = next((d for d in candidates if not d.get('query')), None)
-                if fallback:
-                    return fallback
-        return None
+        return self.routes.lookup(base_url, method, self.parse_query_string(query_string))
 
     def parse_front_matter(self, content):
         """Extract optional YAML-ish front matter, allowing a template to set
@@ -354,29 +529,28 @@ class HttpHandler:
             return endpoint_config['content'], endpoint_config.get('status_code', 200)
 
         if 'file' in endpoint_config:
-            file_path = (self.template_folder / endpoint_config['file']).resolve()
+            name = endpoint_config['file']
             try:
-                # Guard against path traversal outside the template folder.
-                file_path.relative_to(self.template_folder.resolve())
-                if not file_path.is_file():
-                    raise FileNotFoundError(file_path)
+                # Guards against path traversal outside the template folder.
+                file_path = self.templates.path(name)
                 status = int(endpoint_config.get('status_code', 200))
                 # Binary assets (fonts, icons, …) — raw bytes, no Jinja.
                 if file_path.suffix.lower() not in self._JINJA_FILE_SUFFIXES:
-                    return file_path.read_bytes(), status
-                raw_content = file_path.read_text()
-                template = self.env.from_string(raw_content)
-                template.globals['request'] = await self.sanitize_request(request)
-                metadata, body = self.parse_front_matter(template.render())
+                    return self.templates.get_bytes(name), status
+                template = self.templates.get_file(name)
+                rendered = template.render(request=await self.sanitize_request(request))
+                metadata, body = self.parse_front_matter(rendered)
                 return body, int(metadata.get('status_code', status))
-            except (ValueError, FileNotFoundError, UnicodeDecodeError) as e:
+            except (ValueError, OSError, UnicodeDecodeError) as e:
                 print(f"Error: {e}")
 
         elif 'ai' in endpoint_config:
             # experimental AI response: prompt = configured text + requested path
             session_id = request.client.host
             prompt = endpoint_config['ai'] + "\n" + request.url.path
-            result = await self.http_agent.make_query("http:" + session_id, prompt) if self.http_agent else None
+            key = request_key(endpoint_config['ai'], request.url.path, request.method)
+            result = (await self.http_agent.make_query("http:" + session_id, prompt, source=session_id, cache_key=key)
+                      if self.http_agent else None)
             if result is None:
                 return '', 404
             # the AI response is sometimes wrapped in a ```json block
@@ -397,22 +571,8 @@ class HttpHandler:
     def _is_not_modified(request, headers: dict) -> bool:
         """True if the request's conditional headers indicate the resource is unchanged."""
         etag = next((v for k, v in headers.items() if k.lower() == "etag"), None)
-        if etag:
-            inm = request.headers.get("if-none-match", "")
-            if inm and (inm.strip('"') == etag.strip('"') or inm == "*"):
-                return True
         last_modified = next((v for k, v in headers.items() if k.lower() == "last-modified"), None)
-        if last_modified:
-            ims = request.headers.get("if-modified-since", "")
-            if ims:
-                try:
-                    from email.utils import parsedate_to_datetime
-                    if parsedate_to_datetime(ims) >= parsedate_to_datetime(last_modified):
-                        return True
-                except Exception:
-                    if ims == last_modified:
-                        return True
-        return False
+        return is_not_modified(request.headers, etag, last_modified)
 
     def _render_reason(self, config, request_info):
         """Render a config entry's optional 'reason' Jinja template to a string."""
@@ -420,9 +580,8 @@ class HttpHandler:
         if not raw:
             return None
         try:
-            template = self.env.from_string(raw)
-            template.globals["request"] = request_info
-            return self._strip_ctl(template.render().strip()) or None
+            template = self.templates.get_string(raw)
+            return self._strip_ctl(template.render(request=request_info).strip()) or None
         except Exception:
             return None
 
@@ -454,7 +613,7 @@ class HttpHandler:
             mu, sigma = self._DELAY_MU, self._DELAY_SIGMA
             min_d, max_d = self._DELAY_MIN, self._DELAY_MAX
         delay = random.gauss(mu, sigma)
-        await asyncio.sleep(max(min_d, min(max_d, delay)))
+        await self.delays.sleep(max(min_d, min(max_d, delay)))
 
     # --- request handlers --------------------------------------------------
 
@@ -470,30 +629,87 @@ class HttpHandler:
         if not await self.check_auth(request):
             return await self.handle_error(request, 401)
 
-        target = str(request.url).split(request.base_url.netloc, 1)[1]
-        endpoint_config = self.get_endpoint_config(target, request.method)
-
-        if endpoint_config:
-            await self._apply_delay(request.method)
-            combined_headers = {**self.http_config.get('headers', {}),
-                                 **endpoint_config.get('headers', {})}
-            if self._is_not_modified(request, combined_headers):
-                await self.log(request, self._log_type(request), 304)
-                return Response(content=b"", status_code=304,
-                                headers={k: v for k, v in combined_headers.items()
-                                         if k.lower() in ("etag", "cache-control", "last-modified")})
-            content, status_code = await self.get_content(endpoint_config, request)
-            status_code = endpoint_config.get('status_code', status_code)
-            headers = dict(endpoint_config.get('headers', {}))
-            await self._set_reason(endpoint_config, request)
-            await self.log(request, self._log_type(request), status_code)
-        else:
+        endpoint_config = self.get_endpoint_config(self._context(request).target, request.method)
+        if not endpoint_config:
             # only the default response is logged (inside handle_default)
-            content, status_code, headers = await self.handle_static_file(request)
+            return await self.handle_static_file(request)
+
+        await self._apply_delay(request.method)
+        constant = self.constant_responses.get(id(endpoint_config))
+        if constant is not None:
+            return await self._constant_response(constant, request)
+        honeyfile = self.honeyfiles.get(id(endpoint_config))
+
+        combined_headers = {**self.http_config.get('headers', {}),
+                            **endpoint_config.get('headers', {})}
+        if self._is_not_modified(request, combined_headers):
+            await self.log(request, self._log_type(request), 304)
+            return Response(content=b"", status_code=304,
+                            headers={k: v for k, v in combined_headers.items()
+                                     if k.lower() in ("etag", "cache-control", "last-modified")})
+        if honeyfile is not None:
+            return await self._honeyfile_response(honeyfile, endpoint_config, combined_headers, request)
+        content, status_code = await self.get_content(endpoint_config, request)
+        status_code = endpoint_config.get('status_code', status_code)
+        await self._set_reason(endpoint_config, request)
+        await self.log(request, self._log_type(request), status_code)
+        return await self._make_response(content, status_code, combined_headers, request)
 
-        response_headers = self.http_config.get('headers', {}).copy()
-        response_headers.update(headers)
-        return await self._make_response(content, status_code, response_headers, request)
+    async def _honeyfile_response(self, honeyfile, config, headers, request):
+        """Stream a honeyfile (the requested range of it, if any), then log how
+        much of it was sent and whether the download completed."""
+        headers = await self._render_request_headers(headers, request)
+        if not any(k.lower() == 'content-type' for k in headers):
+            headers['Content-Type'] = honeyfile.content_type
+        headers['Accept-Ranges'] = 'bytes'
+        byte_range = honeyfile.byte_range(request.headers.get('range'))
+        if byte_range == 'unsatisfiable':
+            headers['Content-Range'] = f"bytes */{honeyfile.size}"
+            await self.log(request, self._log_type(request), 416)
+            return Response(content=b"", status_code=416, headers=headers)
+        if byte_range is None:
+            status_code = int(config.get('status_code', 200))
+            start, end = 0, honeyfile.size
+        else:
+            status_code = 206
+            start, end = byte_range
+            headers['Content-Range'] = f"bytes {start}-{end - 1}/{honeyfile.size}"
+        headers['Content-Length'] = str(end - start)
+        await self._set_reason(config, request)
+        await self.log(request, self._log_type(request), status_code)
+        if request.method == 'HEAD':
+            return Response(content=b"", status_code=status_code, headers=headers)
+        return StreamingResponse(self._stream_honeyfile(honeyfile, start, end, status_code, request),
+                                 status_code=status_code, headers=headers)
+
+    async def _stream_honeyfile(self, honeyfile, start, end, status_code, request):
+        began = time.monotonic()
+        sent = 0
+        try:
+            async for chunk in honeyfile.stream(start, end):
+                yield chunk
+                # Counted once the server asked for more, i.e. took this one.
+                sent += len(chunk)
+        finally:
+            await self.log(request, self.logger.DATA, status_code, extra={
+                "honeyfile_size": honeyfile.size,
+                "range_start": start,
+                "range_end": end - 1,
+                "bytes_sent": sent,
+                "complete": sent == end - start,
+                "duration": round(time.monotonic() - began, 3),
+            })
+
+    async def _constant_response(self, constant, request, conditional=True):
+        """Serve a pre-built response: only the 304 check, the reason, logging
+        and Set-Cookie suppression happen per request."""
+        if conditional and constant.is_not_modified(request.headers):
+            await self.log(request, self._log_type(request), 304)
+            return constant.not_modified()
+        if constant.reason:
+            request.scope.setdefault("state", {})[_REASON_STATE_KEY] = constant.reason
+        await self.log(request, self._log_type(request), constant.status_code)
+        return constant.response(request.cookies, request.headers.get('accept-encoding'))
 
     async def _render_request_headers(self, headers, request):
         """Render per-request Jinja in header VALUES (e.g. a redirect
@@ -507,33 +723,28 @@ class HttpHandler:
                 if info is None:
                     info = await self.sanitize_request(request)
                 try:
-                    tmpl = self.env.from_string(value)
-                    tmpl.globals['request'] = info
-                    value = self._strip_ctl(tmpl.render())
+                    tmpl = self.templates.get_string(value)
+                    value = self._strip_ctl(tmpl.render(request=info))
                 except Exception:
                     pass
             rendered[key] = value
         return rendered
 
-    @staticmethod
-    def _cookie_name_from_set_cookie(value: str):
-        """Return the cookie name from a Set-Cookie header value, or None."""
-        first = value.split(';', 1)[0].strip()
-        if '=' in first:
-            return first.split('=', 1)[0].strip()
-        return None
-
-    async def _make_response(self, content, status_code, headers, request):
+    async def _make_response(self, content, status_code, headers, request, variants=None):
         """Build a Response serving exactly the configured headers.
 
         Content-Type is NOT inferred: some origins send no Content-Type, and a
         faithful copy must reproduce that. We pass headers as-is and never pass
         media_type, so Starlette adds a Content-Type only when the config
         provides one. Static files set their own Content-Type (mimetypes) before
-        reaching here. The header name's case is restored by the middleware.
+        reaching here. The header name's case is restored by HttpApp.
 
         Set-Cookie headers are suppressed when the client already carries that
         cookie, so repeated requests don't keep re-setting the same cookie.
+
+        With the skin's compression enabled, the body is sent in the encoding
+        negotiated from Accept-Encoding: from `variants` when precomputed
+        (static files), else compressed here.
         """
         headers = await self._render_request_headers(headers, request)
         if request is not None:
@@ -542,10 +753,14 @@ class HttpHandler:
                 k: v for k, v in headers.items()
                 if not (
                     k.lower() == 'set-cookie'
-                    and (name := self._cookie_name_from_set_cookie(v)) is not None
+                    and (name := cookie_name(v)) is not None
                     and name in client_cookies
                 )
             }
+            if self.compression is not None:
+                body = content.encode('utf-8') if isinstance(content, str) else content
+                content, headers = self.compression.encode(
+                    status_code, headers, body, request.headers.get('accept-encoding'), variants)
         return Response(content=content, status_code=status_code, headers=headers)
 
     async def handle_static_file(self, request):
@@ -554,36 +769,74 @@ class HttpHandler:
         elif request.method == 'GET':
             rel = request.url.path.lstrip('/')
         else:
-            return await self.handle_default(request)
+            return await self.handle_upstream(request)
 
-        # Resolve BOTH sides and require strict containment so attacker-supplied
-        # paths (../, symlinks, encoded traversal, NUL bytes) cannot escape the
-        # skin's files/ directory (LFI). Anything outside falls through to the
-        # normal default response, so a probe looks like an ordinary 404.
+        # Only files indexed under the skin's files/ directory can be served
+        # (see StaticIndex): attacker-supplied paths (../, symlinks, encoded
+        # traversal, NUL bytes) cannot escape it (LFI), and a miss costs no
+        # filesystem access. Anything else falls through to the normal default
+        # response, so a probe looks like an ordinary 404.
         try:
-            static_root = self.static_folder.resolve()
-            base = self.static_folder.resolve()
-            file_path = (self.static_folder / rel).resolve()
-            file_path.relative_to(base)
-            if file_path.is_file():
-                content = file_path.read_bytes()
-                content_type = (mimetypes.guess_type(str(file_path))[0]
-                                or 'application/octet-stream')
-                return content, 200, {'Content-Type': content_type}
-        except (ValueError, OSError):
+            found = self.static.read(rel)
+            if found is not None:
+                content, content_type = found
+                headers = {**self.http_config.get('headers', {}), 'Content-Type': content_type}
+                variants = self._static_variants(self.static.normalize(rel)) if self.compression else None
+                return await self._make_response(content, 200, headers, request, variants)
+        except OSError:
             pass
 
-        return await self.handle_default(request)
+        return await self.handle_upstream(request)
 
-    async def handle_default(self, request):
+    async def handle_upstream(self, request):
+        """Replay the origin's response to a request no endpoint or static
+        file matched, forwarding it first if it wasn't recorded yet (skins
+        with `upstream`, see UpstreamCache). Anything the origin can't
+        answer gets the default response."""
+        upstream = self.upstream
+        if upstream is None or request.method not in upstream.methods:
+            return await self.handle_default(request)
         await self._apply_delay(request.method)
+        context = self._context(request)
+        path, _, query = context.target.partition('?')
+        key = upstream.key(request.method, path, query)
+        constant = self.upstream_responses.get(key)
+        outcome = 'replayed'
+        if constant is None:
+            body = await context.body()
+            if context.body_truncated:
+                # Forwarding part of the body would record the origin's
+                # answer to a request nobody sent.
+                return await self.handle_default(request, delay=False)
+            recording, recorded = await upstream.get(request.method, path, query, request.headers, body)
+            if recording is None:
+                return await self.handle_default(request, delay=False)
+            if recorded:
+                outcome = 'recorded'
+            constant = ConstantResponse(recording.body, recording.status_code, recording.header_dict(),
+                                        compression=self.compression)
+            # Client errors stay in the upstream's own evictable bucket
+            if constant.status_code < 400 and len(self.upstream_responses) < upstream.max_entries:
+                self.upstream_responses[key] = constant
+        if constant.is_not_modified(request.headers):
+            await self.log(request, self._log_type(request), 304, extra={"upstream": outcome})
+            return constant.not_modified()
+        await self.log(request, self._log_type(request), constant.status_code, extra={"upstream": outcome})
+        return constant.response(request.cookies, request.headers.get('accept-encoding'))
+
+    async def handle_default(self, request, delay=True):
+        if delay:
+            await self._apply_delay(request.method)
         config = self.http_config.get('default')
+        constant = self.constant_responses.get(id(config))
+        if constant is not None:
+            return await self._constant_response(constant, request, conditional=False)
         content, _ = await self.get_content(config, request)
         status_code = config.get('status_code', 404)
-        headers = dict(config.get('headers', {}))
+        headers = {**self.http_config.get('headers', {}), **config.get('headers', {})}
         await self._set_reason(config, request)
         await self.log(request, self._log_type(request), status_code)
-        return content, status_code, headers
+        return await self._make_response(content, status_code, headers, request)
 
     async def handle_error(self, request, error_code):
         # Use the configured error response, else an {error_code}.html template.
@@ -633,17 +886,19 @@ class HttpHandler:
             return False
 
     async def log(self, request, log_type, status_code, extra=None):
-        """Log a request. For POST/PUT/PATCH, the body is stored and scanned for
-        common credential fields (form-encoded or XML/SOAP)."""
+        """Log a request. For POST/PUT/PATCH, the body (up to max_body_size) is
+        stored with its true length and SHA-256, and the whole body is scanned
+        for common credential fields (form-encoded or XML/SOAP)."""
+        context = self._context(request)
         src_ip, src_port = request.client.host, request.client.port
         dst_ip, dst_port = request.scope.get("server", ("unknown", "unknown"))
 
         all_extra = {
             "skin": self.NAME,
             "method": request.method,
-            "target": str(request.url).split(request.base_url.netloc, 1)[1],
+            "target": context.target,
             "version": request.scope.get("http_version"),
-            "headers": dict(request.headers),
+            "headers": context.headers,
             "status_code": status_code,
             # Manually added because transport doesn't exist
             "src_ip": src_ip,
@@ -667,66 +922,73 @@ class HttpHandler:
             elif token:
                 all_extra["auth_token"] = token
 
-        data = ''
-        if request.method in ["POST", "PUT", "PATCH"]:
-            try:
-                body = await request.body()
-                if body:
-                    data = body
-                    all_extra.update(self._extract_credentials(body.decode('utf-8', errors='replace')))
-            except ClientDisconnect:
-                pass
+        data = await context.body() or ''
+        if context.has_body and context.body_length:
+            all_extra['form'] = data.decode('utf-8', errors='replace')
+            all_extra['body_length'] = context.body_length
+            all_extra['body_sha256'] = context.body_sha256
+            all_extra['body_truncated'] = context.body_truncated
+            all_extra.update(await context.credentials())
 
         self.logger.log(f"{self.protocol_name}.{log_type}", request.client, data=data, extra=all_extra)
 
-    # Form fields commonly carrying credentials, by role.
-    _USERNAME_FIELDS = {'login', 'username', 'account', 'user%5Blogin%5D', 'j_username', 'ba_username'}
-    _PASSWORD_FIELDS = {'password', 'credential', 'passwd', 'user%5Bpassword%5D', 'j_password', 'secretkey', 'ba_password'}
-
-    def _extract_credentials(self, form_data):
-        """Pull username/password out of a POST body (form-encoded or XML/SOAP)."""
-        extra = {'form': form_data}
 
-        for key, value in self.parse_query_string(form_data).items():
-            if key in self._USERNAME_FIELDS:
-                extra['username'] = value
-            elif key in self._PASSWORD_FIELDS:
-                extra['password'] = value
+class HttpApp:
+    """Minimal ASGI application dispatching every request to HttpHandler.
 
-        if '<Envelope' in form_data and '</Envelope>' in form_data:
-            for tag, field in (('userName', 'username'), ('password', 'password')):
-                open_tag, close_tag = f'<{tag}>', f'</{tag}>'
-                if open_tag in form_data and close_tag in form_data:
-                    start = form_data.find(open_tag) + len(open_tag)
-                    extra[field] = form_data[start:form_data.find(close_tag)]
-
-        return extra
-
-
-class HeaderCapitalizationMiddleware:
-    """Set response header-name casing from the negotiated protocol and inject
-    the Date header (Hypercorn's own date/server headers are disabled).
-
-    Starlette lowercases all outgoing header names. Casing is then decided
-    purely by scope['http_version']:
+    Custom methods are answered inline by handle_unknown_method, the rest by
+    handle_request. Response header-name casing follows the negotiated
+    protocol, and the Date header is injected (Hypercorn's own date/server
+    headers are disabled), in a single pass over the headers:
 
     - HTTP/2: names stay lowercase (required by the protocol); 'date' is injected.
     - HTTP/1.1: names are Title-Cased (the convention); 'Date' is injected.
+
+    With virtual hosts, `hosts` is a HostMap of Host patterns to handlers;
+    requests for any other host (or without one) go to `handler`.
     """
 
     # Standard headers whose canonical case isn't simple Title-Case.
-    _TITLE_EXCEPTIONS = {'etag': 'ETag', 'www-authenticate': 'WWW-Authenticate'}
-
-    def __init__(self, app):
-        self.app = app
-
-    def _title(self, lower):
-        return self._TITLE_EXCEPTIONS.get(lower, lower.title())
+    _TITLE_EXCEPTIONS = {b'etag': b'ETag', b'www-authenticate': b'WWW-Authenticate'}
+
+    def __init__(self, handler, hosts=None):
+        self.handler = handler
+        self.hosts = hosts
+        self._titles = dict(self._TITLE_EXCEPTIONS)
+        self._date_second = None
+        self._date_value = None
+
+    def _title(self, name):
+        title = self._titles.get(name)
+        if title is None:
+            title = self._titles[name] = name.decode("latin1").title().encode("latin1")
+        return title
+
+    def _date(self):
+        """The Date header value, formatted at most once per second."""
+        second = int(time.time())
+        if second != self._date_second:
+            self._date_value = datetime.fromtimestamp(second, timezone.utc).strftime(
+                "%a, %d %b %Y %H:%M:%S GMT").encode("latin1")
+            self._date_second = second
+        return self._date_value
+
+    def _headers(self, raw_headers, is_h2):
+        has_date = False
+        headers = []
+        for name, value in raw_headers:
+            name = name.lower()
+            if name == b"date":
+                has_date = True
+            headers.append((name if is_h2 else self._title(name), value))
+        if not has_date:
+            headers.append((b"date" if is_h2 else b"Date", self._date()))
+        return headers
 
     async def _handle_lifespan(self, receive, send):
-        # The honeypot app has no startup/shutdown logic. Handling the lifespan
-        # protocol here (instead of letting Starlette do it) avoids Hypercorn's
-        # noisy LifespanFailureError when the server task is cancelled on Ctrl+C.
+        # The honeypot app has no startup/shutdown logic. Acknowledging the
+        # lifespan protocol avoids Hypercorn's noisy LifespanFailureError when
+        # the server task is cancelled on Ctrl+C.
         while True:
             try:
                 message = await receive()
@@ -743,61 +1005,126 @@ class HeaderCapitalizationMiddleware:
             await self._handle_lifespan(receive, send)
             return
         if scope["type"] != "http":
-            await self.app(scope, receive, send)
             return
 
-        is_h2 = scope.get("http_version") == "2"
-
-        async def send_wrapper(message):
-            if message["type"] == "http.response.start":
-                has_date = False
-                names = []  # lowercase name, value
-                for raw_name, raw_value in message.get("headers", []):
-                    lower = raw_name.decode("latin1").lower()
-                    if lower == "date":
-                        has_date = True
-                    names.append((lower, raw_value))
-
-                if is_h2:
-                    headers = [[lower.encode("latin1"), value] for lower, value in names]
-                    date_name = b"date"
-                else:
-                    headers = [[self._title(lower).encode("latin1"), value]
-                               for lower, value in names]
-                    date_name = b"Date"
+        request = Request(scope, receive)
+        # Read once: a skin reload swaps self.handler (or self.hosts), and a
+        # request already in flight finishes on the skin it started with.
+        handler = self.handler
+        hosts = self.hosts
+        if hosts:
+            for name, value in scope["headers"]:
+                if name == b"host":
+                    handler = hosts.lookup(value, handler)
+                    break
+        try:
+            if request.method in STANDARD_METHODS:
+                response = await handler.handle_request(request)
+            else:
+                response = await handler.handle_unknown_method(request)
+        except Exception:
+            logging.exception(f"Error handling {request.method} {scope.get('path')}")
+            response = Response("Internal Server Error", status_code=500, media_type="text/plain")
 
-                if not has_date:
-                    date_val = datetime.now(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
-                    headers.append([date_name, date_val.encode("latin1")])
+        is_h2 = scope.get("http_version") == "2"
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": self._headers(response.raw_headers, is_h2),
+        })
+        if isinstance(response, StreamingResponse):
+            await self._stream(response.body_iterator, receive, send)
+        else:
+            await send({"type": "http.response.body", "body": response.body})
 
-                message["headers"] = headers
+    @staticmethod
+    async def _stream(chunks, receive, send):
+        """Send a streamed body until it ends or the client goes away; either
+        way the iterator is closed, so it can account for what was sent."""
+        disconnected = asyncio.Event()
 
-            await send(message)
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
 
-        await self.app(scope, receive, send_wrapper)
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            async for chunk in chunks:
+                if disconnected.is_set():
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            await chunks.aclose()
 
 
 class HttpHoneypot(BaseHoneypot):
     service_name = "http"
+    handler_class = HttpHandler
 
     def __init__(self, config, logger, bindaddr="0.0.0.0"):
         super().__init__(config, logger, bindaddr)
         self.port = config['port']
-        self.handler = HttpHandler(config=config, logger=logger)
-        self.fastapi_app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
-        self.app = None  # set after route setup in start()
+        self.config = config
+        self.handler = self.handler_class(config=config, logger=logger)
+        # Name-based virtual hosts: {host pattern: skin name or handler
+        # config}, served on this same listener; other hosts get `skin`.
+        self.vhost_handlers = {pattern: self.handler_class(config=self._vhost_config(site), logger=logger)
+                               for pattern, site in (config.get('vhosts') or {}).items()}
+        self.app = None  # set after handler setup in start()
         self.server = None
+        # "workers": N runs this service in N processes of its own, sharing
+        # one listening socket (see TrapsterManager.run and share_socket()).
+        self.workers = max(1, int(config.get('workers') or 1))
+        self.shared_socket = None
+        # Origin clients of replaced skins, closed once their requests are done
+        self._retiring = set()
+
+    def _vhost_config(self, site):
+        """Handler config of a virtual host: the service's, overridden by the
+        vhost's own entry (a skin name, or a dict of handler options). Each
+        site gets its own deploy_seed unless its entry sets one."""
+        if not isinstance(site, dict):
+            site = {'skin': site}
+        config = {key: value for key, value in self.config.items()
+                  if key not in ('vhosts', 'deploy_seed', 'skin', 'bundle')}
+        config.update(site)
+        return config
 
-        # FastAPI only routes standard methods; custom verbs are handled here.
-        @self.fastapi_app.middleware("http")
-        async def custom_method_middleware(request: Request, call_next):
-            if request.method not in STANDARD_METHODS:
-                return await self.handler.handle_unknown_method(request)
-            return await call_next(request)
+    def _host_map(self):
+        return HostMap(self.vhost_handlers)
+
+    def _hypercorn_settings(self):
+        """HYPERCORN_SETTINGS, overridden by the skin's `hypercorn` block, then
+        by the service's. Invalid values are ignored with a warning."""
+        settings = dict(HYPERCORN_SETTINGS)
+        for source, overrides in (("skin", self.handler.http_config.get('hypercorn')),
+                                  ("service", self.config.get('hypercorn'))):
+            for key, value in (overrides or {}).items():
+                if key not in HYPERCORN_SETTINGS:
+                    logging.warning(f"Unknown hypercorn setting {key!r} in {source} config of {self.service_name}")
+                    continue
+                default = HYPERCORN_SETTINGS[key]
+                try:
+                    if value is not None:
+                        value = type(default or 0.0)(value)
+                        if value < 0:
+                            raise ValueError
+                    elif key != 'read_timeout':
+                        raise ValueError
+                except (TypeError, ValueError):
+                    logging.warning(f"Invalid hypercorn setting {key}={value!r} in {source} config of "
+                                    f"{self.service_name}, using {settings[key]!r}")
+                    continue
+                settings[key] = value
+        return settings
 
     def _hypercorn_config(self):
         """Base Hypercorn config shared by HTTP and HTTPS. Date and Server are
-        disabled here; the middleware injects Date (with protocol-correct case)
+        disabled here; HttpApp injects Date (with protocol-correct case)
         and Server comes from the skin's config headers."""
         from hypercorn.config import Config as HyperConfig
         config = HyperConfig()
@@ -806,11 +1133,45 @@ class HttpHoneypot(BaseHoneypot):
         config.include_date_header = False
         config.accesslog = None
         config.errorlog = None
+        for key, value in self._hypercorn_settings().items():
+            setattr(config, key, value)
         return config
 
+    def share_socket(self):
+        """Bind the listening socket before worker processes are forked, for
+        all of them to accept from (like Hypercorn's own multi-worker mode,
+        which needs an importable app instead of this in-memory one).
+        Raises OSError if the address can't be bound."""
+        family = socket.AF_INET6 if ":" in self.bindaddr else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.bindaddr, self.port))
+        except OSError:
+            sock.close()
+            raise
+        sock.set_inheritable(True)
+        self.shared_socket = sock
+
     async def _serve_hypercorn(self, config):
         from hypercorn.asyncio import serve as hyper_serve
+        watchers = []
+        if self.config.get('hot_reload', False):
+            for pattern, handler in [(None, self.handler), *self.vhost_handlers.items()]:
+                # A bundle is a build artifact: recompile it and restart instead.
+                if not handler.config.get('bundle'):
+                    skin_folder = handler.data_folder / handler.NAME
+                    watcher = DirectoryWatcher(skin_folder, functools.partial(self.reload, pattern))
+                    watchers.append(asyncio.create_task(watcher.run()))
         try:
+            if self.shared_socket is not None:
+                # Hypercorn takes ownership of (and closes) a duplicate: the
+                # shared socket itself stays open.
+                config.bind = [f"fd://{self.shared_socket.dup().detach()}"]
+            elif self.reuse_port:
+                # Hypercorn only sets SO_REUSEPORT in its own multi-worker mode,
+                # so hand it a socket we bound ourselves (it takes ownership).
+                config.bind = [f"fd://{self._bind_reuse_port().detach()}"]
             await hyper_serve(self.app, config,
                               shutdown_trigger=self._shutdown_event.wait)
         except (OSError, SystemExit) as e:
@@ -819,15 +1180,52 @@ class HttpHoneypot(BaseHoneypot):
         except asyncio.CancelledError:
             self._shutdown_event.set()
             raise
+        finally:
+            for watcher in watchers:
+                watcher.cancel()
+
+    async def reload(self, vhost=None):
+        """Rebuild the skin (config, routes, templates, static index) of the
+        default site, or of the given virtual host pattern, off the event
+        loop, then swap it in. Requests already in flight finish on the
+        previous version; if the new one fails to load, it is kept."""
+        previous = self.handler if vhost is None else self.vhost_handlers[vhost]
+        handler = type(previous)(config=previous.config, logger=self.logger)
+        handler.data_folder = previous.data_folder
+        try:
+            await asyncio.to_thread(handler.setup, previous)
+        except Exception as e:
+            logging.error(f"Failed to reload skin {previous.NAME}, keeping the running version: {e}")
+            return
+        if vhost is None:
+            self.handler = handler
+            if self.app is not None:
+                self.app.handler = handler
+        else:
+            self.vhost_handlers[vhost] = handler
+            if self.app is not None:
+                self.app.hosts = self._host_map()
+        replaced = getattr(previous, 'upstream', None)
+        if replaced is not None and replaced is not getattr(handler, 'upstream', None):
+            task = asyncio.create_task(self._close_upstream(replaced))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+        logging.info(f"Reloaded skin {handler.NAME}")
+
+    @staticmethod
+    async def _close_upstream(upstream):
+        """Close the origin client of a replaced skin. Requests in flight on
+        it give up after its timeout at the latest."""
+        try:
+            await asyncio.sleep(upstream.timeout)
+        finally:
+            await upstream.aclose()
 
     async def start(self):
         self.handler.setup()
-
-        @self.fastapi_app.api_route("/{path:path}", methods=list(STANDARD_METHODS))
-        async def catch_all(request: Request, path: str):
-            return await self.handler.handle_request(request)
-
-        self.app = HeaderCapitalizationMiddleware(self.fastapi_app)
+        for handler in self.vhost_handlers.values():
+            handler.setup()
+        self.app = HttpApp(self.handler, self._host_map())
         self._shutdown_event = asyncio.Event()
         return await super().start()
 
@@ -839,4 +1237,11 @@ class HttpHoneypot(BaseHoneypot):
     async def stop(self):
         if getattr(self, '_shutdown_event', None) is not None:
             self._shutdown_event.set()
+        for handler in [self.handler, *self.vhost_handlers.values()]:
+            if getattr(handler, 'upstream', None) is not None:
+                await handler.upstream.aclose()
+        for task in list(self._retiring):
+            task.cancel()
+        if AI_AVAILABLE:
+            await HTTPAgent.close_shared()
         return await super().stop()
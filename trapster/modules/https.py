@@ -1,8 +1,8 @@
-from trapster.modules.http import HttpHandler, HttpHoneypot, HeaderCapitalizationMiddleware
+from trapster.modules.http import HttpHandler, HttpHoneypot
+from trapster.libs.vhosts import HostMap
 
-import asyncio
-from fastapi import Request
 from pathlib import Path
+import copy
 import datetime
 
 from cryptography.hazmat.primitives.asymmetric import rsa
@@ -20,10 +20,10 @@ class HttpsHandler(HttpHandler):
 class HttpsHoneypot(HttpHoneypot):
     """common class to all trapster instance"""
     service_name = "https"
+    handler_class = HttpsHandler
 
     def __init__(self, config, logger, bindaddr="0.0.0.0"):
         super().__init__(config, logger, bindaddr)
-        self.handler = HttpsHandler(config=config, logger=logger)
         # Check if the user has set the TLS key and certificate
         self.user_set_tls = config.get("key") and config.get("certificate")
         config.setdefault("country_name", None)
@@ -48,37 +48,89 @@ class HttpsHoneypot(HttpHoneypot):
         self.certificate_path = Path(config.get("certificate"))
 
         self.generate_certificate()
-    
+
+        # Virtual hosts present their own certificate (selected by SNI): the
+        # one set in their entry, else a self-signed one for their name. The
+        # service's own key/certificate are not inherited.
+        self.vhost_certificates = {}
+        sites = config.get("vhosts") or {}
+        for pattern in self.vhost_handlers:
+            site = sites[pattern] if isinstance(sites[pattern], dict) else {}
+            if site.get("key") and site.get("certificate"):
+                key_path, certificate_path = Path(site["key"]), Path(site["certificate"])
+                self.generate_certificate(key_path, certificate_path, user_set=True)
+            else:
+                name = pattern.replace("*", "_wildcard")
+                key_path = self.key_path.parent / "vhosts" / f"{name}.key.pem"
+                certificate_path = self.certificate_path.parent / "vhosts" / f"{name}.certificate.pem"
+                self.generate_certificate(key_path, certificate_path, common_name=pattern, dns_names=[pattern],
+                                          user_set=False)
+            self.vhost_certificates[pattern] = (key_path, certificate_path)
+
     async def _start_server(self):
         # TLS via Hypercorn. http_version: "2" enables ALPN h2 (falling back to
-        # http/1.1); otherwise http/1.1 only. The per-request middleware adapts
-        # casing/Date to whichever protocol the client negotiates.
+        # http/1.1); otherwise http/1.1 only. HttpApp adapts casing/Date to
+        # whichever protocol the client negotiates.
         config = self._hypercorn_config()
         config.certfile = str(self.certificate_path)
         config.keyfile = str(self.key_path)
         config.alpn_protocols = ["h2", "http/1.1"] if self.handler.http2 else ["http/1.1"]
+        if self.vhost_certificates:
+            self._add_sni(config)
         return await self._serve_hypercorn(config)
 
-    def generate_certificate(self):
+    def _add_sni(self, config):
+        """Have the server's SSL context switch to a virtual host's context
+        (its certificate, same TLS settings) when the client's SNI matches it.
+        The contexts are all built up front."""
+        contexts = HostMap()
+        for pattern, (key_path, certificate_path) in self.vhost_certificates.items():
+            site_config = copy.copy(config)
+            site_config.certfile, site_config.keyfile = str(certificate_path), str(key_path)
+            contexts.add(pattern, site_config.create_ssl_context())
+
+        def sni_callback(ssl_object, server_name, context):
+            if server_name:
+                site_context = contexts.lookup(server_name)
+                if site_context is not None:
+                    ssl_object.context = site_context
+
+        create_ssl_context = config.create_ssl_context
+
+        def create_sni_ssl_context():
+            context = create_ssl_context()
+            context.sni_callback = sni_callback
+            return context
+
+        config.create_ssl_context = create_sni_ssl_context
+
+    def generate_certificate(self, key_path=None, certificate_path=None, common_name=None, dns_names=None,
+                             user_set=None):
         '''
         Use the configured key/certificate files when both already exist.
         Otherwise generate a self-signed pair (and write it to those paths).
+        Defaults to the service's own pair; virtual hosts pass theirs.
         '''
-        if self.user_set_tls:
-            if self.certificate_path.is_file() and self.key_path.is_file():
+        key_path = key_path or self.key_path
+        certificate_path = certificate_path or self.certificate_path
+        common_name = common_name or self.COMMON_NAME
+        if user_set is None:
+            user_set = self.user_set_tls
+        if user_set:
+            if certificate_path.is_file() and key_path.is_file():
                 return
             else:
-                raise ValueError(f"HTTPS key/certificate configured but missing: key={self.key_path} certificate={self.certificate_path}")
+                raise ValueError(f"HTTPS key/certificate configured but missing: key={key_path} certificate={certificate_path}")
 
-        self.key_path.parent.mkdir(parents=True, exist_ok=True)
-        self.certificate_path.parent.mkdir(parents=True, exist_ok=True)
+        key_path.parent.mkdir(parents=True, exist_ok=True)
+        certificate_path.parent.mkdir(parents=True, exist_ok=True)
 
         key = rsa.generate_private_key(
                 public_exponent=65537,
                 key_size=2048,
             )
 
-        with open(self.key_path, "wb") as f:
+        with open(key_path, "wb") as f:
             f.write(key.private_bytes(
             encoding=serialization.Encoding.PEM,
             format=serialization.PrivateFormat.TraditionalOpenSSL,
@@ -90,11 +142,11 @@ class HttpsHoneypot(HttpHoneypot):
             x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, self.STATE_OR_PROVINCE_NAME) if self.STATE_OR_PROVINCE_NAME else None,
             x509.NameAttribute(NameOID.LOCALITY_NAME, self.LOCALITY_NAME) if self.LOCALITY_NAME else None,
             x509.NameAttribute(NameOID.ORGANIZATION_NAME, self.ORGANIZATION_NAME) if self.ORGANIZATION_NAME else None,
-            x509.NameAttribute(NameOID.COMMON_NAME, self.COMMON_NAME),
+            x509.NameAttribute(NameOID.COMMON_NAME, common_name),
         ]
         subject = issuer = x509.Name(filter(None, name_attributes))
 
-        alt_names = x509.SubjectAlternativeName([x509.DNSName('localhost'),])
+        alt_names = x509.SubjectAlternativeName([x509.DNSName(name) for name in dns_names or ['localhost']])
 
         certification = (
             x509.CertificateBuilder()
@@ -108,5 +160,5 @@ class HttpsHoneypot(HttpHoneypot):
             .sign(key, hashes.SHA256(), default_backend())
         )
 
-        with open(self.certificate_path, "wb") as f:
+        with open(certificate_path, "wb") as f:
             f.write(certification.public_bytes(serialization.Encoding.PEM))
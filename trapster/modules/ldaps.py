@@ -69,7 +69,8 @@ class LdapsHoneypot(LdapHoneypot):
         loop = asyncio.get_running_loop()
         try:
             self.server = await loop.create_server(
-                self.handler, host=self.bindaddr, port=self.port, ssl=ssl_ctx
+                self.handler, host=self.bindaddr, port=self.port, ssl=ssl_ctx,
+                reuse_port=self.reuse_port
             )
             await self.server.serve_forever()
         except asyncio.CancelledError:
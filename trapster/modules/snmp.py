@@ -68,7 +68,8 @@ class SnmpHoneypot(BaseHoneypot):
         try:
             # Create UDP server
             transport, protocol = await loop.create_datagram_endpoint(lambda: self.handler_udp(), 
-                                        local_addr=(self.bindaddr, self.port))
+                                        local_addr=(self.bindaddr, self.port),
+                                        reuse_port=self.reuse_port)
         except asyncio.CancelledError:
             raise
         except OSError as e:
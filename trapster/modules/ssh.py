@@ -10,6 +10,7 @@ import asyncio, asyncssh, os, datetime, logging, random, ipaddress
 # Optional AI import - gracefully handle when AI dependencies aren't installed
 try:
     from trapster.ai import SSHAgent
+    from trapster.ai.commands import ShellState
     AI_AVAILABLE = True
 except ImportError:
     SSHAgent = None
@@ -70,11 +71,14 @@ Last login: {last_dt.strftime('%a %b %d %H:%M:%S %Y')} from {last_ip}
     peer_addr = process.get_extra_info('peername')[0]
     session_id = "ssh:" + peer_addr + ":" + username
     current_directory = "~"
+    directory = f"/home/{username}/"
     server_name = "ns" + str(random.randint(100000, 999999))
 
 
-    # Initialize AI agent if available
-    ai_agent = SSHAgent(username=username) if AI_AVAILABLE else None
+    # Process-wide AI agent if available; the username is passed per query
+    ai_agent = SSHAgent.shared() if AI_AVAILABLE else None
+    # What this session wrote, which cached command outputs cannot know about
+    shell_state = ShellState() if AI_AVAILABLE else None
 
     while True:
         try:
@@ -99,11 +103,13 @@ Last login: {last_dt.strftime('%a %b %d %H:%M:%S %Y')} from {last_ip}
                 return
             
             # make query to AI agent
-            result = await ai_agent.make_query(session_id, command)
+            result = await ai_agent.make_query(session_id, command, username=username, source=peer_addr,
+                                               directory=directory, state=shell_state)
 
             # handle result
             result['directory'] = result['directory'] or "/home/guest/"
             result['command_result'] = result['command_result'] or ""
+            directory = result['directory']
 
             if result['directory'] == f"/home/{username}/":
                 current_directory = "~"
@@ -222,7 +228,8 @@ class SshHoneypot(BaseHoneypot):
             
             self.server = await asyncssh.create_server(self.handler, self.bindaddr, self.port,
                                  server_host_keys=host_keys,
-                                 process_factory=handle_client
+                                 process_factory=handle_client,
+                                 reuse_port=self.reuse_port
                                  )
             await self.server.serve_forever()
         except asyncio.CancelledError:
@@ -234,6 +241,11 @@ class SshHoneypot(BaseHoneypot):
             logging.error(e)
             return False
 
+    async def stop(self):
+        await super().stop()
+        if AI_AVAILABLE:
+            await SSHAgent.close_shared()
+
     def generate_keys(self):
         """Generate multiple host key types: RSA, ECDSA, and ED25519"""
         ssh_dir = os.path.dirname(__file__) + "/../data/ssh"
@@ -2,16 +2,29 @@ import asyncio
 import psutil
 import argparse, json, socket, os
 import logging
+import signal
 import ssl
+import sys
+import time
 
 from . import __version__
 from .modules import *
-from .logger import set_logger
+from .modules.http import HttpHandler
+from .libs.http_upstream import export_skin
+from .logger import BaseLogger, set_logger
+
+# Optional AI import - gracefully handle when AI dependencies aren't installed
+try:
+    from .ai.base import scheduler as ai_scheduler
+except ImportError:
+    ai_scheduler = None
 
 class TrapsterManager:
-    def __init__(self, config):
+    def __init__(self, config, workers=1):
         self.logger = None
         self.config = config
+        self.workers = workers
+        self.servers = []
 
     def get_ip(self, config_interface):
         if not config_interface:
@@ -28,13 +41,12 @@ class TrapsterManager:
         logging.warning(f"Interface {config_interface} does not exist, using 0.0.0.0")
         return "0.0.0.0"
 
-    async def start(self):
-        # A honeypot constantly gets malformed/aborted TLS from scanners; those
-        # surface as loop-level ssl.SSLError noise. Drop them, keep everything else.
-        asyncio.get_running_loop().set_exception_handler(
-            lambda loop, ctx: None if isinstance(ctx.get("exception"), ssl.SSLError)
-            else loop.default_exception_handler(ctx)
-        )
+    def create_servers(self):
+        """Instantiate every configured service.
+
+        Kept separate from start() so that key/certificate generation and
+        deploy seeds happen once, in the parent, before workers are forked.
+        """
         ip = self.get_ip(self.config.get('interface', None))
 
         global_vars = {k: self.config[k] for k in ('hostname', 'domain') if k in self.config}
@@ -75,15 +87,177 @@ class TrapsterManager:
                 else:
                     logging.error(f"Unrecognized service {service_type}")
                     break
-                                        
+
+                # With several workers, each one binds the port with SO_REUSEPORT.
+                # A service can opt out ("reuse_port": false, e.g. UDP services
+                # that should see every datagram in one process): it then only
+                # runs in the first worker.
+                server.reuse_port = self.workers > 1 and service_config.get('reuse_port', True)
+                self.servers.append((service_type, service_config, server))
+
+    async def start(self, worker_id=0, service=None):
+        """Start every service (of this worker), or only the service at
+        index `service` in self.servers, for its dedicated workers."""
+        # A honeypot constantly gets malformed/aborted TLS from scanners; those
+        # surface as loop-level ssl.SSLError noise. Drop them, keep everything else.
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, ctx: None if isinstance(ctx.get("exception"), ssl.SSLError)
+            else loop.default_exception_handler(ctx)
+        )
+        if not self.servers:
+            self.create_servers()
+
+        started = []
+        for index, (service_type, service_config, server) in enumerate(self.servers):
+            if service is not None:
+                if index != service:
+                    continue
+            elif getattr(server, 'workers', 1) > 1:
+                continue  # runs in its own workers
+            elif worker_id > 0 and not server.reuse_port:
+                continue
+            try:
+                logging.info(f"Starting service {service_type} on port {service_config['port']}")
+                await server.start()
+                started.append((service_type, service_config, server))
+            except Exception as e:
+                logging.error(f"Error starting {service_type}: {e}")
+
+        # Every "stats_interval" seconds (0 disables it), each process logs its
+        # pipeline counters (see stats()). They go to the application log, not
+        # the event logger: they are no attack event.
+        interval = float(self.config.get('stats_interval', 300) or 0)
+        try:
+            while True:
+                await asyncio.sleep(interval or 10)
+                if interval:
+                    logging.info(f"Stats of worker {worker_id}: {json.dumps(self.stats(started))}")
+        finally:
+            # Stopped (see serve()): services write out what they still hold
+            for service_type, service_config, server in started:
                 try:
-                    logging.info(f"Starting service {service_type} on port {service_config['port']}")
-                    await server.start()
+                    await server.stop()
                 except Exception as e:
-                    logging.error(f"Error starting {service_type}: {e}")
-        
-        while True:
-            await asyncio.sleep(10)
+                    logging.error(f"Error stopping {service_type}: {e}")
+
+    def stats(self, servers=None):
+        """Counters of this process, for tuning: the event queue
+        (OutputLogger.stats()), the response delays of each HTTP(S) site
+        (DelayScheduler.stats()), by service and port, and vhost pattern, and
+        the model calls (AIScheduler.metrics()) when AI is available."""
+        stats = {}
+        if hasattr(self.logger, 'stats'):
+            stats['logger'] = self.logger.stats()
+        delays = {}
+        for service_type, service_config, server in self.servers if servers is None else servers:
+            sites = [(None, getattr(server, 'handler', None)), *getattr(server, 'vhost_handlers', {}).items()]
+            for pattern, handler in sites:
+                if getattr(handler, 'delays', None) is not None:
+                    name = f"{service_type}:{service_config['port']}" + (f":{pattern}" if pattern else "")
+                    delays[name] = handler.delays.stats()
+        if delays:
+            stats['delays'] = delays
+        if ai_scheduler is not None:
+            stats['ai'] = ai_scheduler().metrics()
+        return stats
+
+    def serve(self, worker_id=0, service=None):
+        """asyncio.run(self.start()), stopped by SIGTERM as by Ctrl-C.
+
+        SIGTERM cancels the main task, and asyncio.run() then cancels the
+        others, among them the logger's writer, which drains its queue on the
+        way out: `docker stop` loses no queued event. Raises KeyboardInterrupt.
+        """
+        async def main():
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+            await self.start(worker_id, service)
+
+        try:
+            asyncio.run(main())
+        except asyncio.CancelledError:
+            raise KeyboardInterrupt from None
+
+    def run(self):
+        """Run the honeypot, pre-forking worker processes when workers > 1.
+
+        HTTP/HTTPS services with their own "workers" setting run apart, in
+        that many processes accepting from one socket bound here, so their
+        throughput scales independently of the other services.
+        """
+        self.create_servers()
+        dedicated = []
+        for index, (service_type, service_config, server) in enumerate(self.servers):
+            if getattr(server, 'workers', 1) <= 1:
+                continue
+            try:
+                server.share_socket()
+            except OSError as e:
+                # Start it with the other services instead, where its bind
+                # fails (and is reported) like any service's.
+                logging.warning(f"Could not bind {service_type} on port {service_config['port']} "
+                                f"for its {server.workers} workers: {e}")
+                server.workers = 1
+                continue
+            dedicated.append(index)
+        if self.workers <= 1 and not dedicated:
+            self.serve()
+            return
+
+        workers = {}
+
+        def spawn(worker):
+            worker_id, service = worker
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 0
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    self.logger.after_fork()
+                    self.serve(worker_id, service)
+                except KeyboardInterrupt:
+                    pass
+                except Exception as e:
+                    logging.error(f"Worker {worker_id} crashed: {e}")
+                    exit_code = 1
+                finally:
+                    os._exit(exit_code)
+            workers[pid] = worker
+
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, terminate)
+        for worker_id in range(self.workers):
+            spawn((worker_id, None))
+        for index in dedicated:
+            service_type, service_config, server = self.servers[index]
+            for worker_id in range(server.workers):
+                spawn((worker_id, index))
+            logging.info(f"Started {server.workers} workers for {service_type} on port {service_config['port']}")
+        logging.info(f"Started {self.workers} workers")
+
+        try:
+            while workers:
+                pid, status = os.wait()
+                worker = workers.pop(pid, None)
+                if worker is None:
+                    continue
+                logging.warning(f"Worker {worker[0]} (pid {pid}) exited with status {status}, restarting")
+                # Avoid a fork loop if a worker dies right away (e.g. bad config).
+                time.sleep(1)
+                spawn(worker)
+        except KeyboardInterrupt:
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in workers:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            raise
 
 def list_interfaces():
     interfaces = psutil.net_if_addrs()
@@ -106,13 +280,49 @@ def load_config(config_path):
     with open(config_path, 'r') as f:
         return json.load(f)
     
+def skin_command(argv):
+    """`trapster skin compile <skin>`: pack an HTTP skin into a bundle, served
+    by setting the HTTP/HTTPS service's "bundle" key to its path.
+    `trapster skin export <cache> <skin_dir>`: turn the responses recorded
+    by a skin in upstream mode into a regular skin."""
+    parser = argparse.ArgumentParser(prog="trapster skin", description="Manage HTTP skins.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    compile_parser = commands.add_parser('compile', help='Pack a skin into a single precompiled bundle.')
+    compile_parser.add_argument('skin', help='Skin name, under trapster/data/http/.')
+    compile_parser.add_argument('-o', '--output', type=str, help='Bundle file to write (default: <skin>.tskin).')
+    compile_parser.add_argument('--deploy-seed', type=str,
+                                help='Seed for the skin\'s deploy-time values (default: random, i.e. a new deployment).')
+    export_parser = commands.add_parser('export', help='Turn recorded upstream responses into a skin.')
+    export_parser.add_argument('cache', help='Recordings directory (the upstream cache).')
+    export_parser.add_argument('output', help='Skin directory to write, e.g. trapster/data/http/<name>.')
+    export_parser.add_argument('--name', type=str, help='Skin name (default: the output directory\'s name).')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        count = export_skin(args.cache, args.output, args.name, HttpHandler._JINJA_FILE_SUFFIXES)
+        logging.info(f"Exported {count} recorded responses to {args.output}")
+        return
+
+    # Compiling serves no request: BaseLogger builds events and writes none.
+    handler = HttpHandler({'skin': args.skin, 'deploy_seed': args.deploy_seed},
+                          logger=BaseLogger("trapster-skin"))
+    output = args.output or f"{args.skin}.tskin"
+    header = handler.compile_bundle(output)
+    logging.info(f"Compiled skin {header['skin']} to {output}: {len(header['templates'])} templates "
+                 f"({len(header['bytecode'])} precompiled), {len(header['files'])} static files")
+
 def main():
+    if sys.argv[1:2] == ['skin']:
+        logging.getLogger().setLevel(logging.INFO)
+        return skin_command(sys.argv[2:])
+
     parser = argparse.ArgumentParser(description="Trapster Community honeypot.")
     parser.add_argument('-i', '--interfaces', action='store_true', help='Show list of interfaces and their corresponding IPs.')
     parser.add_argument('-c', '--config', type=str, help='Specify the config file to use.')
     parser.add_argument('-s', '--show-config', action='store_true', help='Show the config file currently in use.')
     parser.add_argument('-v', '--version', action='store_true', help='Print version')
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes sharing the listening ports (SO_REUSEPORT).')
     args = parser.parse_args()
 
     # set logging level to INFO by default
@@ -142,11 +352,11 @@ def main():
     if logger == None:
         return
       
-    manager = TrapsterManager(config)
+    manager = TrapsterManager(config, workers=args.workers)
     logger.whitelist_ips = []
     manager.logger = logger
 
     try:
-        asyncio.run(manager.start())
+        manager.run()
     except KeyboardInterrupt:
         logging.info('Finishing')